@@ -0,0 +1,288 @@
+"""Server-side KPI aggregations for the dashboard and reports.
+
+Each function issues a single aggregation against one collection and only
+returns the computed numbers, so the cost of a page does not grow with the
+number of documents shipped to Python.
+"""
+from datetime import datetime
+
+from bson.decimal128 import Decimal128
+from django.conf import settings
+
+from . import concurrency, reporting, subscriptions
+from .cluster_registry import cluster_registry
+from .mongo_models import UserProfile, MatchId, Payment, RevenueRollup
+
+# Stand-ins used when an aggregation fails or times out, keyed by collection
+EMPTY_STATS = {
+    'users': {'user_count': 0, 'user_growth': {}},
+    'match_ids': {
+        'active_match_ids': 0,
+        'active_clusters': 0,
+        'trial_match_ids': 0,
+        'converted_trials': 0,
+        'trial_conversion_rate': 0,
+    },
+    'payments': {
+        'total_revenue': 0,
+        'payment_count': 0,
+        'monthly_revenue': {},
+        'cluster_performance': {},
+    },
+}
+
+
+def to_float(value):
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    return float(value or 0)
+
+
+def _count(facet):
+    # $count yields an empty list instead of a zero count
+    return facet[0]['count'] if facet else 0
+
+
+def _month_key(field):
+    return {'$dateToString': {'format': '%Y-%m', 'date': field}}
+
+
+def _trial_facets():
+    return {
+        'trials': [
+            {'$match': {'is_trial': True}},
+            {'$count': 'count'},
+        ],
+        # A trial converted once it was paid for after being created
+        'converted': [
+            {'$match': {
+                'is_trial': True,
+                '$expr': {'$gt': ['$last_paid_on', '$created_on']},
+            }},
+            {'$count': 'count'},
+        ],
+    }
+
+
+def trial_stats_pipeline():
+    return [{'$facet': _trial_facets()}]
+
+
+def match_id_stats_pipeline(now):
+    return [{'$facet': {
+        'active': [
+            {'$match': {'valid_till': {'$gte': now}}},
+            {'$count': 'count'},
+        ],
+        'active_clusters': [
+            {'$match': {'valid_till': {'$gt': now}}},
+            {'$group': {'_id': '$cluster_name'}},
+            {'$count': 'count'},
+        ],
+        **_trial_facets(),
+    }}]
+
+
+def match_id_stats(now=None):
+    """Active subscription and trial conversion counts for match IDs"""
+    now = now or datetime.now()
+    if subscriptions.use_subscription_states():
+        # Active counts are counter reads; only the trial figures aggregate
+        result = next(reporting.objects(MatchId).aggregate(trial_stats_pipeline()))
+        active = subscriptions.active_counts()
+    else:
+        result = next(reporting.objects(MatchId).aggregate(match_id_stats_pipeline(now)))
+        active = {
+            'active_match_ids': _count(result['active']),
+            'active_clusters': _count(result['active_clusters']),
+        }
+
+    trial_match_ids = _count(result['trials'])
+    converted_trials = _count(result['converted'])
+    trial_conversion_rate = 0
+    if trial_match_ids > 0:
+        trial_conversion_rate = (converted_trials / trial_match_ids) * 100
+
+    return {
+        'active_match_ids': active['active_match_ids'],
+        'active_clusters': active['active_clusters'],
+        'trial_match_ids': trial_match_ids,
+        'converted_trials': converted_trials,
+        'trial_conversion_rate': trial_conversion_rate,
+    }
+
+
+def match_id_period_stats(start, end):
+    """Match ID figures for the period [start, end).
+
+    Active subscriptions are match IDs valid at some point in the period;
+    trials and conversions count match IDs created in it. Each figure is a
+    separate indexed count rather than a $facet over the whole collection.
+    """
+    active = {'valid_till': {'$gte': start}, 'created_on': {'$lt': end}}
+    trials = {'created_on': {'$gte': start, '$lt': end}, 'is_trial': True}
+    converted = dict(trials, **{'$expr': {'$gt': ['$last_paid_on', '$created_on']}})
+
+    trial_match_ids = reporting.objects(MatchId).filter(__raw__=trials).count()
+    converted_trials = reporting.objects(MatchId).filter(__raw__=converted).count()
+    trial_conversion_rate = 0
+    if trial_match_ids > 0:
+        trial_conversion_rate = (converted_trials / trial_match_ids) * 100
+
+    return {
+        'active_match_ids': reporting.objects(MatchId).filter(__raw__=active).count(),
+        'trial_match_ids': trial_match_ids,
+        'converted_trials': converted_trials,
+        'trial_conversion_rate': trial_conversion_rate,
+    }
+
+
+def active_subscriptions_pipeline(now):
+    return [
+        {'$match': {'valid_till': {'$gt': now}}},
+        {'$group': {'_id': '$cluster_name', 'count': {'$sum': 1}}},
+    ]
+
+
+def active_subscriptions_by_cluster(now=None):
+    """Number of match IDs still valid at ``now``, per cluster name"""
+    if subscriptions.use_subscription_states():
+        return subscriptions.active_by_cluster()
+    now = now or datetime.now()
+    pipeline = active_subscriptions_pipeline(now)
+    return {row['_id']: row['count'] for row in reporting.objects(MatchId).aggregate(pipeline)}
+
+
+def use_rollups():
+    return getattr(settings, 'USE_REVENUE_ROLLUPS', False)
+
+
+def completed_revenue_pipeline(date_field, count, start=None, end=None):
+    """Completed revenue from payments or from their daily rollups.
+
+    Rollup documents already hold a summed amount and a ``count``, so the
+    same pipeline works for both sources with a different count expression.
+    ``start``/``end`` bound ``date_field`` to [start, end) in the leading
+    $match, so a period is an index range on (status, date_field).
+    """
+    match = {'status': 'Completed'}
+    bounds = {}
+    if start:
+        bounds['$gte'] = start
+    if end:
+        bounds['$lt'] = end
+    if bounds:
+        match[date_field] = bounds
+    return [
+        {'$match': match},
+        {'$facet': {
+            'totals': [
+                {'$group': {'_id': None, 'revenue': {'$sum': '$amount'}, 'count': {'$sum': count}}},
+            ],
+            'monthly': [
+                {'$match': {date_field: {'$ne': None}}},
+                {'$group': {'_id': _month_key(f'${date_field}'), 'revenue': {'$sum': '$amount'}}},
+                {'$sort': {'_id': 1}},
+            ],
+            'clusters': [
+                {'$group': {'_id': '$api_key', 'revenue': {'$sum': '$amount'}, 'count': {'$sum': count}}},
+            ],
+        }},
+    ]
+
+
+def payment_stats(start=None, end=None):
+    """Revenue totals, monthly revenue and per-cluster performance.
+
+    Restricted to payments dated in [start, end) when given; rollups hold
+    whole days, so a period should start and end at midnight.
+    """
+    if use_rollups():
+        result = next(reporting.objects(RevenueRollup).aggregate(completed_revenue_pipeline('day', '$count', start, end)))
+    else:
+        result = next(reporting.objects(Payment).aggregate(completed_revenue_pipeline('payment_date', 1, start, end)))
+
+    totals = result['totals'][0] if result['totals'] else {}
+    monthly_revenue = {row['_id']: to_float(row['revenue']) for row in result['monthly']}
+
+    # Several api_keys may share a cluster name, so merge their rows
+    cluster_names = cluster_registry.cluster_names(row['_id'] for row in result['clusters'])
+    cluster_performance = {}
+    for row in result['clusters']:
+        cluster_name = cluster_names[row['_id']]
+        if cluster_name:
+            stats = cluster_performance.setdefault(cluster_name, {'revenue': 0, 'count': 0})
+            stats['revenue'] += to_float(row['revenue'])
+            stats['count'] += row['count']
+
+    return {
+        'total_revenue': to_float(totals.get('revenue')),
+        'payment_count': totals.get('count', 0),
+        'monthly_revenue': monthly_revenue,
+        'cluster_performance': cluster_performance,
+    }
+
+
+def user_stats_pipeline():
+    return [{'$facet': {
+        'total': [{'$count': 'count'}],
+        'growth': [
+            {'$match': {'created_at': {'$ne': None}}},
+            {'$group': {'_id': _month_key('$created_at'), 'count': {'$sum': 1}}},
+            {'$sort': {'_id': 1}},
+        ],
+    }}]
+
+
+def user_stats():
+    """User count and new users per month"""
+    result = next(reporting.objects(UserProfile).aggregate(user_stats_pipeline()))
+
+    return {
+        'user_count': _count(result['total']),
+        'user_growth': {row['_id']: row['count'] for row in result['growth']},
+    }
+
+
+def daily_revenue_pipeline(start):
+    return [
+        {'$match': {'status': 'Completed', 'payment_date': {'$gte': start}}},
+        {'$group': {
+            '_id': {
+                'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$payment_date'}},
+                'api_key': '$api_key',
+            },
+            'amount': {'$sum': '$amount'},
+            'count': {'$sum': 1},
+        }},
+    ]
+
+
+def daily_revenue(start):
+    """Completed revenue and payment count per (day, api_key) since ``start``"""
+    # Whole days only, so both sources agree on the first bucket
+    start = datetime(start.year, start.month, start.day)
+    if use_rollups():
+        return [
+            (row['day'], row['api_key'], to_float(row['amount']), row['count'])
+            for row in reporting.objects(RevenueRollup).filter(status='Completed', day__gte=start).as_pymongo()
+        ]
+
+    return [
+        (datetime.strptime(row['_id']['day'], '%Y-%m-%d'), row['_id']['api_key'],
+         to_float(row['amount']), row['count'])
+        for row in reporting.objects(Payment).aggregate(daily_revenue_pipeline(start))
+    ]
+
+
+def fetch_kpis(names):
+    """Run the KPI aggregation for each named collection in parallel"""
+    queries = {
+        'users': user_stats,
+        'match_ids': match_id_stats,
+        'payments': payment_stats,
+    }
+    return concurrency.fan_out(
+        {name: queries[name] for name in names},
+        defaults=EMPTY_STATS,
+    )
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'solsub_admin.settings')
 
 application = get_asgi_application()
+
+from solsub_admin.warmup import maybe_warm_up  # noqa: E402 (needs the app loaded)
+
+maybe_warm_up()
@@ -0,0 +1,147 @@
+"""Time every dashboard view and API endpoint against synthetic data.
+
+For each data size the database is flushed and re-seeded (synthetic.py),
+then each endpoint is requested through its view with a staff user. Wall
+time is taken over ``repeat`` runs with the aggregate cache cleared before
+each one, Mongo command counts come from query_monitor, and one extra run
+under tracemalloc records the peak Python memory.
+"""
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from . import query_monitor, synthetic
+from .cluster_registry import cluster_registry
+
+# (users, clusters, match IDs, payments)
+SIZES = {
+    'small': (50, 20, 500, 2000),
+    'medium': (500, 200, 5000, 20000),
+    'large': (5000, 1000, 50000, 200000),
+}
+
+
+def parse_size(value):
+    """A preset name or explicit USERS:CLUSTERS:MATCH_IDS:PAYMENTS counts"""
+    if value in SIZES:
+        return value, SIZES[value]
+    try:
+        counts = tuple(int(part) for part in value.split(':'))
+    except ValueError:
+        counts = ()
+    if len(counts) != 4:
+        raise ValueError(f'Unknown size {value!r}; use {", ".join(SIZES)} or USERS:CLUSTERS:MATCH_IDS:PAYMENTS')
+    return value, counts
+
+
+def endpoints(cluster_name=''):
+    """(name, url) for every view worth timing"""
+    cluster_query = f'?cluster_name={cluster_name}' if cluster_name else ''
+    return [
+        ('dashboard', reverse('dashboard')),
+        ('users', reverse('users')),
+        ('payments', reverse('payments')),
+        ('match_ids', reverse('match_ids')),
+        ('clusters', reverse('clusters')),
+        ('users.fragment', reverse('users') + '?fragment=1'),
+        ('payments.fragment', reverse('payments') + '?fragment=1'),
+        ('match_ids.fragment', reverse('match_ids') + '?fragment=1'),
+        ('clusters.fragment', reverse('clusters') + '?fragment=1'),
+        ('reports', reverse('reports')),
+        ('cluster_owner_payment_report', reverse('cluster_owner_payment_report') + cluster_query),
+        ('cluster_owner_payment_report.pdf', reverse('cluster_owner_payment_report') + '?format=pdf'),
+        ('generate_report_pdf', reverse('generate_report_pdf') + '?report_type=detailed'),
+        ('analytics_data', reverse('analytics_data')),
+        ('timeseries_data', reverse('timeseries_data')),
+        ('timeseries_data.week', reverse('timeseries_data') + '?granularity=week'),
+        ('cluster_data', reverse('cluster_data')),
+        ('search_data', reverse('search_data') + '?q=synthetic-'),
+    ]
+
+
+def _request(factory, user, url):
+    request = factory.get(url)
+    request.user = user
+    match = resolve(request.path)
+    response = match.func(request, *match.args, **match.kwargs)
+    if getattr(response, 'streaming', False):
+        size = sum(len(chunk) for chunk in response.streaming_content)
+    else:
+        size = len(response.content)
+    response.close()
+    return response.status_code, size
+
+
+def _cold():
+    # Every run pays for its own queries
+    caches['default'].clear()
+    cluster_registry.invalidate()
+
+
+def time_endpoint(factory, user, url, repeat=3, cold=True):
+    durations = []
+    for _ in range(repeat):
+        if cold:
+            _cold()
+        stats, token = query_monitor.start(url)
+        started = time.perf_counter()
+        try:
+            status, size = _request(factory, user, url)
+        finally:
+            query_monitor.stop(token)
+        durations.append((time.perf_counter() - started) * 1000)
+
+    # Separate run for memory, tracemalloc slows everything down
+    if cold:
+        _cold()
+    tracemalloc.start()
+    try:
+        _request(factory, user, url)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'status': status,
+        'bytes': size,
+        'runs': repeat,
+        'median_ms': round(statistics.median(durations), 2),
+        'min_ms': round(min(durations), 2),
+        'max_ms': round(max(durations), 2),
+        # Last timed run; pymongo does not emit command events for mongomock
+        'mongo_commands': stats.commands,
+        'mongo_ms': round(stats.duration_ms, 2),
+        'mongo_documents': stats.documents,
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run(sizes, repeat=3, cold=True, only=None, seed=0, progress=None):
+    """Seed each size in turn and time every endpoint; returns JSON-ready results"""
+    progress = progress or (lambda message: None)
+    factory = RequestFactory()
+    user = User(username='benchmark', is_staff=True, is_superuser=True, is_active=True)
+    results = []
+    for label, counts in sizes:
+        synthetic.flush()
+        started = time.perf_counter()
+        written = synthetic.generate(*counts, seed=seed)
+        seed_seconds = round(time.perf_counter() - started, 2)
+        progress(f'{label}: seeded {written} in {seed_seconds}s')
+
+        names = cluster_registry.all_names()
+        timings = []
+        for name, url in endpoints(names[0] if names else ''):
+            if only and name not in only:
+                continue
+            timing = dict(view=name, url=url, **time_endpoint(factory, user, url, repeat, cold))
+            progress(f"  {name:34} {timing['median_ms']:>10.1f} ms  {timing['mongo_commands']:>6} cmds  "
+                     f"{timing['peak_kib']:>10.1f} KiB")
+            timings.append(timing)
+        results.append({'size': label, 'counts': written, 'seed_seconds': seed_seconds, 'endpoints': timings})
+    return results
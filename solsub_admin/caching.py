@@ -0,0 +1,122 @@
+"""Result cache for the aggregate endpoints.
+
+Results are stored in Django's cache framework under keys built from the
+endpoint name, the request parameters and a generation number for every
+collection the result depends on. Saving or deleting a ``Payment``,
+``MatchId`` or ``UserProfile`` bumps its collection's generation (from the
+models' save/delete overrides, and explicitly after bulk writes), which
+orphans every cached result derived from it; the per-endpoint TTL bounds
+staleness for writes this process cannot see (e.g. with the local-memory
+backend and several workers).
+
+The same generations serve as version stamps for conditional GETs: see
+``conditional()``.
+"""
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import caches
+from django.views.decorators.http import condition
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _cache():
+    return caches[getattr(settings, 'AGGREGATE_CACHE_ALIAS', 'default')]
+
+
+def _generation_key(collection):
+    return f'solsub:generation:{collection}'
+
+
+def _new_generation():
+    # Start from the clock so a generation evicted from the cache never
+    # comes back with a number that older cached results were keyed on
+    return int(time.time() * 1000)
+
+
+def bump(*collections):
+    """Invalidate every cached result that depends on these collections"""
+    cache = _cache()
+    for collection in collections:
+        key = _generation_key(collection)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _new_generation(), timeout=None)
+
+
+def generations(collections):
+    cache = _cache()
+    keys = [_generation_key(collection) for collection in collections]
+    current = cache.get_many(keys)
+    for key in keys:
+        if key not in current:
+            cache.add(key, _new_generation(), timeout=None)
+            current[key] = cache.get(key)
+    return [current[key] for key in keys]
+
+
+def cache_key(endpoint, collections, params=None):
+    parts = [f'{name}={value}' for name, value in sorted((params or {}).items())]
+    parts.extend(str(generation) for generation in generations(collections))
+    digest = hashlib.sha1('&'.join(parts).encode()).hexdigest()
+    return f'solsub:result:{endpoint}:{digest}'
+
+
+def ttl_for(endpoint):
+    ttls = getattr(settings, 'AGGREGATE_CACHE_TTLS', {})
+    return ttls.get(endpoint, ttls.get('default', 60))
+
+
+def cached_result(endpoint, collections, compute, params=None, should_cache=None):
+    """Return ``compute()`` from the cache, computing it at most once per TTL.
+
+    ``params`` (e.g. ``request.GET``) is part of the key, so differently
+    filtered requests are cached separately. ``should_cache`` can veto
+    storing a result, e.g. one assembled from partially failed queries.
+    """
+    ttl = ttl_for(endpoint)
+    if not ttl:
+        return compute()
+
+    if params is not None and hasattr(params, 'lists'):
+        params = {name: ','.join(values) for name, values in params.lists()}
+
+    cache = _cache()
+    key = cache_key(endpoint, collections, params)
+    result = cache.get(key, _MISSING)
+    if result is _MISSING:
+        result = compute()
+        if should_cache is None or should_cache(result):
+            cache.set(key, result, ttl)
+    return result
+
+
+def etag(endpoint, collections, request):
+    """Version stamp for a response built from ``collections``.
+
+    Changes whenever one of the collections is written, the URL (filters,
+    cursor, format) or the session differs, and at least once per the
+    endpoint's TTL, which bounds staleness for time-dependent figures and
+    for writes this process cannot see. Pages with flash messages waiting
+    to be shown get no ETag, so they are always rendered.
+    """
+    if len(messages.get_messages(request)):
+        return None
+    ttl = ttl_for(endpoint) or 1
+    parts = [endpoint, request.get_full_path(), str(int(time.time() // ttl))]
+    session = getattr(request, 'session', None)
+    parts.append((session.session_key or '') if session is not None else '')
+    parts.extend(str(generation) for generation in generations(collections))
+    return hashlib.sha1('&'.join(parts).encode()).hexdigest()
+
+
+def conditional(endpoint, collections):
+    """Answer GETs whose ETag still matches with a 304, without running the view"""
+    return condition(etag_func=lambda request, *args, **kwargs: etag(endpoint, collections, request))
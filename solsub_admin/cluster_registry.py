@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+
+from .mongo_models import RegisteredCluster
+
+# Everything the views need to know about a cluster given a payment's api_key
+ClusterRef = namedtuple('ClusterRef', [
+    'cluster_name',
+    'api_key',
+    'owner_id',
+    'owner_username',
+    'owner_email',
+])
+
+
+class ClusterRegistry:
+    """Process-wide api_key -> cluster lookup shared by all views.
+
+    The full mapping is loaded from the clusters collection with a single
+    projected query and kept in memory. Cluster writes made through
+    ``UserProfile`` (see cluster_store.py) invalidate it immediately; the
+    TTL bounds how stale it can get when another process changes clusters.
+    """
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._by_api_key = None
+        self._by_name = None
+        self._misses = set()
+        self._loaded_at = 0
+
+    @property
+    def ttl(self):
+        if self._ttl is not None:
+            return self._ttl
+        return getattr(settings, 'CLUSTER_REGISTRY_TTL', 300)
+
+    def invalidate(self):
+        with self._lock:
+            self._by_api_key = None
+            self._by_name = None
+            self._misses = set()
+
+    def _is_fresh(self):
+        return self._by_api_key is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _add(self, cluster, by_api_key, by_name):
+        ref = ClusterRef(
+            cluster_name=cluster.get('cluster_name'),
+            api_key=cluster.get('api_key'),
+            owner_id=cluster.get('owner_id'),
+            owner_username=cluster.get('owner_username'),
+            owner_email=cluster.get('owner_email'),
+        )
+        if ref.api_key:
+            by_api_key[ref.api_key] = ref
+        by_name[ref.cluster_name] = ref
+
+    def _fetch(self, **filters):
+        return RegisteredCluster.objects(**filters).only(*ClusterRef._fields).as_pymongo()
+
+    def _ensure_loaded(self):
+        """Return the current (by_api_key, by_name, misses) snapshot"""
+        with self._lock:
+            if not self._is_fresh():
+                by_api_key, by_name = {}, {}
+                for cluster in self._fetch():
+                    self._add(cluster, by_api_key, by_name)
+                self._by_api_key = by_api_key
+                self._by_name = by_name
+                self._misses = set()
+                self._loaded_at = time.monotonic()
+            return self._by_api_key, self._by_name, self._misses
+
+    def resolve(self, api_key):
+        """Return the ClusterRef for an api_key, or None if it is unknown"""
+        return self.resolve_many([api_key]).get(api_key)
+
+    def resolve_many(self, api_keys):
+        """Resolve a batch of api_keys, e.g. a page of payments, in one go.
+
+        Keys missing from the cached mapping are looked up together with a
+        single indexed ``$in`` query, so clusters added by another process
+        are still found; keys that stay unknown are remembered until the
+        next reload.
+        """
+        by_api_key, by_name, misses = self._ensure_loaded()
+        api_keys = set(api_keys)
+        api_keys.discard(None)
+        missing = {key for key in api_keys if key not in by_api_key and key not in misses}
+        if missing:
+            with self._lock:
+                for cluster in self._fetch(api_key__in=list(missing)):
+                    self._add(cluster, by_api_key, by_name)
+                misses.update(key for key in missing if key not in by_api_key)
+        return {key: by_api_key[key] for key in api_keys if key in by_api_key}
+
+    def cluster_names(self, api_keys):
+        """Map each api_key to its cluster name (None when unknown)"""
+        api_keys = list(api_keys)
+        refs = self.resolve_many(api_keys)
+        return {key: refs[key].cluster_name if key in refs else None for key in api_keys}
+
+    def by_name(self, cluster_name):
+        return self._ensure_loaded()[1].get(cluster_name)
+
+    def all_names(self):
+        """Distinct cluster names in registration order, for filter dropdowns"""
+        return list(self._ensure_loaded()[1])
+
+
+cluster_registry = ClusterRegistry()
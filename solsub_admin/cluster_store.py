@@ -0,0 +1,139 @@
+"""Keep the top-level clusters collection in sync with UserProfile.clusters.
+
+Cluster definitions are still edited on the owning ``UserProfile``; every
+save mirrors them into ``RegisteredCluster`` (one document per cluster,
+unique on cluster_name and api_key) so lookups and the cluster list are
+indexed queries instead of scans over every user. ``rebuild()`` (the
+``sync_clusters`` command) re-derives the whole collection, for the first
+migration and for users changed outside this app.
+
+When two users declare the same cluster name or api_key the first owner
+wins, as it did when the views scanned users in order.
+"""
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from . import caching
+from .exports import batched
+from .cluster_registry import cluster_registry
+from .mongo_models import RegisteredCluster, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+def _document(user, cluster, synced_at):
+    document = RegisteredCluster.from_cluster(user, cluster).to_mongo().to_dict()
+    document.pop('_id', None)
+    document['synced_at'] = synced_at
+    return document
+
+
+def _changed():
+    cluster_registry.invalidate()
+    caching.bump('clusters')
+
+
+def sync_user(user):
+    """Mirror one user's clusters after it was saved"""
+    collection = RegisteredCluster._get_collection()
+    now = datetime.now()
+    declared = [cluster for cluster in user.clusters if cluster.cluster_name]
+
+    # Drop this user's documents whose name / api_key pair is no longer
+    # declared (e.g. a cluster renamed with the same api_key) before the
+    # upserts, so they can't collide with them on the unique indexes
+    stale = {'owner_id': user.user_id}
+    if declared:
+        stale['$nor'] = [
+            {'cluster_name': cluster.cluster_name, 'api_key': cluster.api_key} for cluster in declared
+        ]
+    collection.delete_many(stale)
+
+    names = []
+    for cluster in declared:
+        try:
+            # Only claims a name that is free or already this user's; the
+            # unique indexes reject a name or api_key owned by someone else
+            collection.update_one(
+                {'cluster_name': cluster.cluster_name, 'owner_id': user.user_id},
+                {'$set': _document(user, cluster, now)},
+                upsert=True,
+            )
+            names.append(cluster.cluster_name)
+        except DuplicateKeyError:
+            _log_clash(collection, user, cluster)
+    collection.delete_many({'owner_id': user.user_id, 'cluster_name': {'$nin': names}})
+    _changed()
+
+
+def _log_clash(collection, user, cluster):
+    taken = [{'cluster_name': cluster.cluster_name}]
+    if cluster.api_key:
+        taken.append({'api_key': cluster.api_key})
+    other = collection.find_one({'owner_id': {'$ne': user.user_id}, '$or': taken}, {'owner_id': 1})
+    if other:
+        logger.warning(
+            'Cluster %r of user %s clashes with a cluster of user %s; not registered',
+            cluster.cluster_name, user.user_id, other['owner_id'],
+        )
+    else:
+        logger.warning(
+            'Cluster %r of user %s repeats the api_key of another of their clusters; not registered',
+            cluster.cluster_name, user.user_id,
+        )
+
+
+def remove_user(user):
+    RegisteredCluster._get_collection().delete_many({'owner_id': user.user_id})
+    _changed()
+
+
+def rebuild(batch_size=500, progress=None):
+    """Re-derive the clusters collection from every UserProfile.
+
+    Upserts are sent in unordered bulk writes per batch of users; clusters
+    no longer declared by any user are removed at the end. Returns
+    (registered, skipped, removed).
+    """
+    collection = RegisteredCluster._get_collection()
+    started = datetime.now()
+    seen_names, seen_keys = set(), set()
+    registered = skipped = 0
+
+    users = UserProfile.objects.only('user_id', 'username', 'email', 'clusters')
+    for batch in batched(users, batch_size):
+        operations = []
+        for user in batch:
+            for cluster in user.clusters:
+                name, api_key = cluster.cluster_name, cluster.api_key
+                if not name or name in seen_names or (api_key and api_key in seen_keys):
+                    skipped += 1
+                    continue
+                seen_names.add(name)
+                if api_key:
+                    seen_keys.add(api_key)
+                operations.append(UpdateOne(
+                    {'cluster_name': name},
+                    {'$set': _document(user, cluster, started)},
+                    upsert=True,
+                ))
+        if operations:
+            try:
+                collection.bulk_write(operations, ordered=False)
+                registered += len(operations)
+            except BulkWriteError as exc:
+                # e.g. an api_key still held by a stale document; it is
+                # swept below and picked up by the next run
+                errors = exc.details.get('writeErrors', [])
+                registered += len(operations) - len(errors)
+                skipped += len(errors)
+                logger.warning('%d cluster upserts failed: %s', len(errors), errors[:3])
+        if progress:
+            progress(registered, skipped)
+
+    removed = collection.delete_many({'synced_at': {'$lt': started}}).deleted_count
+    _changed()
+    return registered, skipped, removed
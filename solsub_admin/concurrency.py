@@ -0,0 +1,77 @@
+"""Run independent Mongo queries in parallel.
+
+pymongo clients are thread-safe and spend most of a query waiting on the
+network, so a shared thread pool lets a view issue its KPI queries at once
+and pay for the slowest one instead of the sum of all of them.
+"""
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'QUERY_FANOUT_WORKERS', 8),
+                    thread_name_prefix='solsub-query',
+                )
+    return _executor
+
+
+class FanoutResult(dict):
+    """Task results by name; ``failed`` lists tasks that errored or timed out"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failed = []
+
+
+def fan_out(tasks, timeout=None, timeouts=None, defaults=None):
+    """Run ``tasks`` ({name: callable}) concurrently and join the results.
+
+    Each task gets ``timeouts[name]`` seconds (falling back to ``timeout``,
+    then QUERY_FANOUT_TIMEOUT) measured from submission. A task that raises
+    or runs over is logged and replaced by ``defaults[name]`` so one slow or
+    broken collection does not take the whole page down.
+    """
+    if timeout is None:
+        timeout = getattr(settings, 'QUERY_FANOUT_TIMEOUT', 10)
+    timeouts = timeouts or {}
+    defaults = defaults or {}
+
+    executor = get_executor()
+    started = time.monotonic()
+    # Run each task in a copy of the caller's context so per-request state
+    # (e.g. query_monitor's stats) follows the work into the pool threads
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, task)
+        for name, task in tasks.items()
+    }
+
+    results = FanoutResult()
+    for name, future in futures.items():
+        remaining = started + timeouts.get(name, timeout) - time.monotonic()
+        try:
+            results[name] = future.result(timeout=max(remaining, 0))
+        except TimeoutError:
+            future.cancel()
+            logger.warning('Query %r timed out after %ss', name, timeouts.get(name, timeout))
+            results[name] = defaults.get(name)
+            results.failed.append(name)
+        except Exception:
+            logger.exception('Query %r failed', name)
+            results[name] = defaults.get(name)
+            results.failed.append(name)
+    return results
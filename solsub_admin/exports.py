@@ -0,0 +1,84 @@
+"""Streaming CSV / NDJSON exports of the list views.
+
+Raw documents (projected to the fields in rows.py) are read from a Mongo
+cursor in batches and encoded as they arrive, so an export starts sending
+bytes immediately and runs in constant memory regardless of how many rows
+it covers.
+"""
+import csv
+import json
+from datetime import datetime
+
+from django.conf import settings
+
+from . import rows
+from .cluster_registry import cluster_registry
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Column order for CSV exports; keys match the dicts built in rows.py
+USER_COLUMNS = ['id', 'username', 'email', 'created_at', 'cluster_count', 'has_bank_details']
+PAYMENT_COLUMNS = ['id', 'match_id', 'cluster_name', 'amount', 'status', 'date', 'user_email']
+MATCH_ID_COLUMNS = ['id', 'cluster_name', 'created_on', 'last_paid_on', 'valid_till', 'is_trial', 'status']
+
+
+class Echo:
+    """File-like object whose write() hands the encoded line straight back"""
+
+    def write(self, value):
+        return value
+
+
+def batch_size():
+    return getattr(settings, 'EXPORT_BATCH_SIZE', 1000)
+
+
+def batched(queryset, size):
+    # no_cache() keeps the queryset from holding on to every document read
+    batch = []
+    for document in queryset.no_cache().timeout(False).batch_size(size):
+        batch.append(document)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def user_batches(queryset):
+    for batch in batched(queryset, batch_size()):
+        yield [rows.user_row(user) for user in batch]
+
+
+def payment_batches(queryset):
+    for batch in batched(queryset, batch_size()):
+        # One registry lookup per batch instead of Payment.cluster_name per row
+        cluster_names = cluster_registry.cluster_names(p.get('api_key') for p in batch)
+        yield [rows.payment_row(payment, cluster_names) for payment in batch]
+
+
+def match_id_batches(queryset, now=None):
+    now = now or datetime.now()
+    for batch in batched(queryset, batch_size()):
+        yield [rows.match_id_row(match_id, now) for match_id in batch]
+
+
+def csv_lines(columns, row_batches):
+    writer = csv.DictWriter(Echo(), fieldnames=columns, extrasaction='ignore')
+    yield writer.writeheader()
+    for batch in row_batches:
+        yield ''.join(writer.writerow(row) for row in batch)
+
+
+def ndjson_lines(row_batches):
+    for batch in row_batches:
+        yield ''.join(json.dumps(row) + '\n' for row in batch)
+
+
+def stream(export_format, columns, row_batches):
+    if export_format == 'ndjson':
+        return ndjson_lines(row_batches)
+    return csv_lines(columns, row_batches)
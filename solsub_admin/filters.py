@@ -0,0 +1,136 @@
+"""Query builders for the list filters shared by the list views and exports.
+
+Each builder turns request parameters into a raw MongoDB query on indexed
+fields. Empty values and 'all' mean "no filter", as in the filter forms.
+"""
+import re
+from datetime import datetime, timedelta
+
+from . import subscriptions
+from .cluster_registry import cluster_registry
+
+PAYMENT_STATUSES = ('Completed', 'Pending', 'Failed')
+MATCH_ID_STATUSES = ('Trial Active', 'Paid Active', 'Inactive')
+
+# Fields the search box (q) matches by prefix, each with its own index
+USER_SEARCH_FIELDS = ('email', 'username', 'user_id')
+PAYMENT_SEARCH_FIELDS = ('payment_id', 'match_id', 'user_email')
+MATCH_ID_SEARCH_FIELDS = ('match_id',)
+EMAIL_FIELDS = ('email', 'user_email')
+
+
+def _param(params, name):
+    value = (params.get(name) or '').strip()
+    return '' if value == 'all' else value
+
+
+def parse_date(value):
+    """Parse a YYYY-MM-DD form value, returning None when it is invalid"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+def date_range_query(field, start, end):
+    """Range on ``field`` covering whole days from start through end"""
+    bounds = {}
+    if start:
+        bounds['$gte'] = start
+    if end:
+        bounds['$lt'] = end + timedelta(days=1)
+    return {field: bounds} if bounds else {}
+
+
+def _terms(field, term):
+    # Emails are stored lowercase in practice; also try the term as typed
+    if field in EMAIL_FIELDS and term.lower() != term:
+        return (term, term.lower())
+    return (term,)
+
+
+def search_query(fields, term, exact=False):
+    """Exact or prefix match of ``term`` on any of ``fields``.
+
+    Prefixes are anchored, case-sensitive regexes, which MongoDB answers
+    with a range scan on each field's index.
+    """
+    if exact:
+        clauses = [{field: {'$in': list(_terms(field, term))}} for field in fields]
+    else:
+        clauses = [
+            {field: {'$regex': '^' + re.escape(value)}}
+            for field in fields for value in _terms(field, term)
+        ]
+    return clauses[0] if len(clauses) == 1 else {'$or': clauses}
+
+
+def _with_search(query, params, fields):
+    term = _param(params, 'q')
+    if not term:
+        return query
+    if not query:
+        return search_query(fields, term)
+    return {'$and': [query, search_query(fields, term)]}
+
+
+def payment_query(params):
+    query = {}
+
+    status = _param(params, 'status')
+    if status in PAYMENT_STATUSES:
+        query['status'] = status
+
+    # Payments only store the api_key, so resolve the cluster name first
+    cluster_name = _param(params, 'cluster')
+    if cluster_name:
+        ref = cluster_registry.by_name(cluster_name)
+        query['api_key'] = ref.api_key if ref else {'$in': []}
+
+    query.update(date_range_query(
+        'payment_date',
+        parse_date(params.get('start_date')),
+        parse_date(params.get('end_date')),
+    ))
+    return _with_search(query, params, PAYMENT_SEARCH_FIELDS)
+
+
+def match_id_query(params, now=None):
+    now = now or datetime.now()
+    query = {}
+
+    cluster_name = _param(params, 'cluster')
+    if cluster_name:
+        query['cluster_name'] = cluster_name
+
+    # Mirrors the status labels computed for each row in the match_ids view
+    status = _param(params, 'status')
+    if subscriptions.use_subscription_states():
+        if status in subscriptions.STATUS_FOR_LABEL:
+            query['status'] = subscriptions.STATUS_FOR_LABEL[status]
+    elif status == 'Trial Active':
+        query.update({'is_trial': True, 'valid_till': {'$gte': now}})
+    elif status == 'Paid Active':
+        query.update({'is_trial': {'$ne': True}, 'valid_till': {'$gte': now}})
+    elif status == 'Inactive':
+        query['$or'] = [{'valid_till': None}, {'valid_till': {'$lt': now}}]
+
+    return _with_search(query, params, MATCH_ID_SEARCH_FIELDS)
+
+
+def user_query(params):
+    query = {}
+
+    has_clusters = _param(params, 'has_clusters')
+    if has_clusters == 'yes':
+        query['clusters.0'] = {'$exists': True}
+    elif has_clusters == 'no':
+        query['clusters.0'] = {'$exists': False}
+
+    has_bank_details = _param(params, 'has_bank_details')
+    if has_bank_details == 'yes':
+        query['bank_details'] = {'$ne': None}
+    elif has_bank_details == 'no':
+        query['bank_details'] = None
+
+    return _with_search(query, params, USER_SEARCH_FIELDS)
@@ -0,0 +1,67 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from solsub_admin import query_audit
+
+
+class Command(BaseCommand):
+    help = (
+        'Explain every query the views issue and report keys/documents examined. '
+        'Fails on collection scans or in-memory sorts that are not expected.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ensure-indexes', action='store_true',
+                            help='Create the indexes declared in mongo_models.py before auditing')
+        parser.add_argument('--only', help='Only audit queries whose name starts with this prefix')
+        parser.add_argument('--json', action='store_true', help='Print one JSON object per query')
+
+    def handle(self, *args, **options):
+        for model in query_audit.AUDITED_MODELS:
+            if options['ensure_indexes']:
+                model.ensure_indexes()
+            comparison = model.compare_indexes()
+            for label in ('missing', 'extra'):
+                if comparison[label]:
+                    self.stdout.write(self.style.WARNING(
+                        f'{model._get_collection_name()}: {label} indexes {comparison[label]}'
+                    ))
+
+        failures = []
+        for query in query_audit.audit_queries():
+            if options['only'] and not query.name.startswith(options['only']):
+                continue
+            summary = query_audit.explain(query)
+            issues = query_audit.problems(summary)
+            if issues:
+                failures.append(f"{query.name} ({', '.join(issues)})")
+
+            if options['json']:
+                self.stdout.write(json.dumps({
+                    'query': query.name,
+                    'stages': summary.stages,
+                    'indexes': summary.indexes,
+                    'keys_examined': summary.keys_examined,
+                    'docs_examined': summary.docs_examined,
+                    'returned': summary.returned,
+                    'millis': summary.millis,
+                    'issues': issues,
+                }))
+                continue
+
+            line = (
+                f'{query.name:40} keys={summary.keys_examined:<8} docs={summary.docs_examined:<8} '
+                f"returned={summary.returned:<6} {summary.millis}ms  {', '.join(summary.indexes) or '-'}"
+            )
+            if issues:
+                self.stdout.write(self.style.ERROR(f"{line}  [{', '.join(issues)}]"))
+            elif summary.collection_scan:
+                self.stdout.write(f'{line}  [collection scan, expected]')
+            else:
+                self.stdout.write(line)
+
+        if failures:
+            raise CommandError('Query plan regressions: ' + '; '.join(failures))
+        if not options['json']:
+            self.stdout.write(self.style.SUCCESS('All audited queries use indexes.'))
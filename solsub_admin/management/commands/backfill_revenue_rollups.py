@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from solsub_admin import caching, rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily revenue rollups from the payments collection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Rebuild from this date (YYYY-MM-DD) instead of the first payment')
+        parser.add_argument('--days', type=int, help='Only rebuild the last N days')
+        parser.add_argument('--batch-days', type=int, default=31, help='Days of payments grouped per batch')
+
+    def handle(self, *args, **options):
+        bounds = rollups.payment_date_bounds()
+        if bounds is None:
+            self.stdout.write('No payments to roll up.')
+            return
+
+        start, latest = bounds
+        if options['since']:
+            try:
+                start = datetime.strptime(options['since'], '%Y-%m-%d')
+            except ValueError:
+                raise CommandError('--since must be a YYYY-MM-DD date')
+        elif options['days']:
+            start = rollups.day_of(datetime.now()) - timedelta(days=options['days'])
+        end = rollups.day_of(max(latest, datetime.now())) + timedelta(days=1)
+
+        def progress(window_start, window_end, count):
+            self.stdout.write(
+                f"{window_start:%Y-%m-%d} .. {window_end:%Y-%m-%d}: {count} rollup documents"
+            )
+
+        written = rollups.rebuild(start, end, batch_days=options['batch_days'], progress=progress)
+        caching.bump('payments')
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} rollup documents.'))
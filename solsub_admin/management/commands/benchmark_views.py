@@ -0,0 +1,55 @@
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from solsub_admin import benchmark, synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed synthetic data at several sizes and time every dashboard view and API endpoint. '
+        'Needs --mock (mongomock) or --mongo-url of a scratch database: the data is flushed per size.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='small,medium',
+                            help='Comma separated presets (%s) or USERS:CLUSTERS:MATCH_IDS:PAYMENTS'
+                                 % ', '.join(benchmark.SIZES))
+        parser.add_argument('--mock', action='store_true', help='Use an in-memory mongomock database')
+        parser.add_argument('--mongo-url', help='Scratch MongoDB to seed and query (e.g. mongodb://localhost/solsub_bench)')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed runs per endpoint')
+        parser.add_argument('--warm', action='store_true', help='Keep caches between runs instead of clearing them')
+        parser.add_argument('--only', help='Comma separated endpoint names to time')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='JSON results file (default: benchmark-<timestamp>.json)')
+
+    def handle(self, *args, **options):
+        if not options['mock'] and not options['mongo_url']:
+            raise CommandError('Pass --mock or --mongo-url; the benchmark deletes the data it seeds.')
+        try:
+            sizes = [benchmark.parse_size(size.strip()) for size in options['sizes'].split(',') if size.strip()]
+            synthetic.use_database(mongo_url=options['mongo_url'], mock=options['mock'])
+        except (ValueError, RuntimeError) as exc:
+            raise CommandError(str(exc))
+
+        started = datetime.now()
+        results = benchmark.run(
+            sizes,
+            repeat=options['repeat'],
+            cold=not options['warm'],
+            only=set(options['only'].split(',')) if options['only'] else None,
+            seed=options['seed'],
+            progress=self.stdout.write,
+        )
+
+        output = options['output'] or f'benchmark-{started:%Y%m%d-%H%M%S}.json'
+        with open(output, 'w') as handle:
+            json.dump({
+                'started_at': started.isoformat(),
+                'database': 'mongomock' if options['mock'] else 'mongodb',
+                'repeat': options['repeat'],
+                'cold': not options['warm'],
+                'results': results,
+            }, handle, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {output}'))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from solsub_admin import filters, match_id_actions
+from solsub_admin.mongo_models import MatchId
+
+
+class Command(BaseCommand):
+    help = (
+        'Extend, renew, convert or expire match IDs in bulk. Select them by cluster, status '
+        'and/or a file of match IDs; with no selection every match ID is affected.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=match_id_actions.ACTIONS)
+        parser.add_argument('--days', type=int, help='Days to add for extend / renew')
+        parser.add_argument('--cluster', help='Only match IDs of this cluster')
+        parser.add_argument('--status', choices=filters.MATCH_ID_STATUSES, help='Only match IDs with this status')
+        parser.add_argument('--ids-file', help='File of match IDs, one per line or comma separated')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Match IDs updated per bulk write')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the selected match IDs')
+
+    def handle(self, *args, **options):
+        ids = None
+        if options['ids_file']:
+            try:
+                with open(options['ids_file']) as ids_file:
+                    ids = match_id_actions.parse_match_ids(ids_file.read())
+            except OSError as error:
+                raise CommandError(f'Cannot read --ids-file: {error}')
+
+        params = {'cluster': options['cluster'] or '', 'status': options['status'] or ''}
+        query = match_id_actions.selection_query(params, ids)
+        selected = MatchId._get_collection().count_documents(query)
+        self.stdout.write(f'{selected} match IDs selected')
+        if options['dry_run'] or not selected:
+            return
+
+        def progress(matched, modified):
+            self.stdout.write(f'  {matched}/{selected} read, {modified} updated')
+
+        try:
+            matched, modified = match_id_actions.apply(
+                options['action'], query, days=options['days'],
+                batch_size=options['batch_size'], progress=progress,
+            )
+        except match_id_actions.InvalidAction as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(f'{options["action"]}: {modified} of {matched} match IDs updated.'))
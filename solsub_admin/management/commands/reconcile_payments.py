@@ -0,0 +1,56 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from solsub_admin import reconciliation
+
+
+class Command(BaseCommand):
+    help = (
+        'Check a payment gateway settlement file (CSV or NDJSON with payment_id, amount and status, '
+        'plus match_id, api_key and payment_date to insert missing payments) against the payments '
+        'collection, reporting every row that does not match.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Settlement file, or '-' for standard input")
+        parser.add_argument('--format', choices=reconciliation.FORMATS,
+                            help='File format (default: from the extension, CSV otherwise)')
+        parser.add_argument('--report', help='Write the rows that do not match to this CSV file')
+        parser.add_argument('--apply', action='store_true',
+                            help='Correct mismatched payments and insert missing ones')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows looked up per query')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or reconciliation.detect_format(path)
+        try:
+            stream = sys.stdin if path == '-' else reconciliation.open_text(path)
+        except OSError as error:
+            raise CommandError(f'Cannot read {path}: {error}')
+
+        report_file = writer = None
+        if options['report']:
+            report_file = open(options['report'], 'w', newline='')
+            writer = csv.DictWriter(report_file, fieldnames=reconciliation.REPORT_COLUMNS)
+            writer.writeheader()
+
+        def progress(counts):
+            self.stdout.write(f"  {sum(counts[outcome] for outcome in reconciliation.OUTCOMES)} rows checked")
+
+        try:
+            counts = reconciliation.reconcile(
+                stream, file_format, apply=options['apply'], batch_size=options['batch_size'],
+                on_row=writer.writerow if writer else None, progress=progress,
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if report_file:
+                report_file.close()
+
+        for outcome in reconciliation.OUTCOMES:
+            self.stdout.write(f'{outcome}: {counts[outcome]}')
+        if options['apply']:
+            self.stdout.write(self.style.SUCCESS(f"Corrected {counts['corrected']} payments."))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from solsub_admin import synthetic
+
+
+class Command(BaseCommand):
+    help = 'Insert synthetic users, clusters, match IDs and payments for local testing and benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500)
+        parser.add_argument('--clusters', type=int, default=200)
+        parser.add_argument('--match-ids', type=int, default=5000)
+        parser.add_argument('--payments', type=int, default=20000)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed, for repeatable data')
+        parser.add_argument('--mongo-url', help='Seed this database instead of MONGODB_DATABASE_URL')
+        parser.add_argument('--flush', action='store_true',
+                            help='Delete all users, match IDs, payments, clusters and rollups first')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive',
+                            help='Do not ask for confirmation')
+
+    def handle(self, *args, **options):
+        synthetic.use_database(mongo_url=options['mongo_url'])
+
+        if options['interactive']:
+            action = 'DELETE all existing data and insert' if options['flush'] else 'insert'
+            answer = input(f'This will {action} synthetic documents into the configured database. Continue? [y/N] ')
+            if answer.strip().lower() != 'y':
+                raise CommandError('Cancelled.')
+
+        if options['flush']:
+            synthetic.flush()
+
+        written = synthetic.generate(
+            options['users'], options['clusters'], options['match_ids'], options['payments'],
+            seed=options['seed'], progress=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            'Inserted ' + ', '.join(f'{count} {name}' for name, count in written.items()) + '.'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from solsub_admin import cluster_store
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the top-level clusters collection from UserProfile.clusters. '
+        'Run once after deploying it, and again to repair users changed outside the app.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Users read per bulk write')
+
+    def handle(self, *args, **options):
+        def progress(registered, skipped):
+            self.stdout.write(f'{registered} clusters registered, {skipped} skipped')
+
+        registered, skipped, removed = cluster_store.rebuild(
+            batch_size=options['batch_size'], progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Registered {registered} clusters, skipped {skipped} duplicates, removed {removed} stale.'
+        ))
@@ -0,0 +1,42 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from solsub_admin import subscriptions
+
+
+class Command(BaseCommand):
+    help = (
+        'Expire match IDs whose valid_till has passed and update the active counters. '
+        'Run with --rebuild once after deploying the stored states, and with --watch as a long-running process.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute every status and counter before processing expiries')
+        parser.add_argument('--watch', action='store_true',
+                            help='Keep running, waking up for each upcoming expiry')
+        parser.add_argument('--interval', type=float, default=60,
+                            help='Longest sleep in seconds between runs with --watch')
+        parser.add_argument('--batch-size', type=int, default=500, help='Match IDs expired per bulk write')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            changed = subscriptions.rebuild()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt subscription states, {changed} statuses changed.'))
+
+        while True:
+            expired = subscriptions.expire_due(batch_size=options['batch_size'])
+            if expired or not options['watch']:
+                self.stdout.write(f'{datetime.now():%Y-%m-%d %H:%M:%S}: expired {expired} match IDs')
+            if not options['watch']:
+                return
+
+            # Sleep until the next expiry, but wake up regularly for match
+            # IDs saved with an earlier valid_till in the meantime
+            delay = options['interval']
+            upcoming = subscriptions.next_expiry()
+            if upcoming is not None:
+                delay = min(delay, (upcoming - datetime.now()).total_seconds())
+            time.sleep(max(delay, 1))
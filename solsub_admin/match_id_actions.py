@@ -0,0 +1,144 @@
+"""Bulk renew / extend / convert / expire operations on match IDs.
+
+A selection (the match_ids list filters plus an optional list of match
+IDs) is walked in ``_id`` order, ``batch_size`` documents at a time. Each
+batch is one unordered ``bulk_write`` of per-document updates, since the
+new ``valid_till`` depends on the stored one. Bulk writes skip the
+``MatchId.save`` hook, so the stored subscription status is recomputed
+here and the counters and transition events are updated per batch.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from . import caching, filters, subscriptions
+from .mongo_models import MatchId, SubscriptionEvent
+
+ACTIONS = ('extend', 'renew', 'convert_trials', 'expire')
+
+# Actions that take a number of days
+DAY_ACTIONS = ('extend', 'renew')
+
+
+class InvalidAction(ValueError):
+    pass
+
+
+def selection_query(params, match_ids=None, now=None):
+    """Raw query for the list filters in ``params`` and an optional id list"""
+    query = filters.match_id_query(params, now)
+    if match_ids is None:
+        return query
+    # The filters may already constrain match_id (the q prefix), so both apply
+    listed = {'match_id': {'$in': list(match_ids)}}
+    return {'$and': [query, listed]} if query else listed
+
+
+def parse_match_ids(text):
+    """Match IDs from an uploaded list: one per line or comma separated"""
+    return [value.strip() for line in text.splitlines() for value in line.split(',') if value.strip()]
+
+
+def _changes(action, document, days, now):
+    """The $set for one match ID, or None when the action doesn't apply"""
+    valid_till = document.get('valid_till')
+    if action == 'extend':
+        return {'valid_till': (valid_till or now) + timedelta(days=days)}
+    if action == 'renew':
+        # A renewal starts from today when the match ID has already lapsed
+        start = valid_till if valid_till and valid_till > now else now
+        return {'valid_till': start + timedelta(days=days), 'last_paid_on': now}
+    if action == 'convert_trials':
+        if not document.get('is_trial'):
+            return None
+        return {'is_trial': False, 'last_paid_on': now}
+    if action == 'expire':
+        if valid_till is not None and valid_till < now:
+            return None
+        return {'valid_till': now - timedelta(seconds=1)}
+    raise InvalidAction(f'Unknown action: {action}')
+
+
+def apply(action, query, days=None, now=None, batch_size=1000, progress=None):
+    """Apply ``action`` to every match ID matching ``query``.
+
+    Returns (matched, modified). ``progress(matched, modified)`` is called
+    after each batch.
+    """
+    if action not in ACTIONS:
+        raise InvalidAction(f"action must be one of {', '.join(ACTIONS)}")
+    if action in DAY_ACTIONS and (days is None or days < 1):
+        raise InvalidAction(f'{action} needs a positive number of days')
+
+    now = now or datetime.now()
+    # MongoDB stores milliseconds; truncate so written dates compare equal
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    collection = MatchId._get_collection()
+    fields = {'match_id': 1, 'cluster_name': 1, 'valid_till': 1, 'is_trial': 1, 'status': 1}
+    matched = modified = 0
+    last_id = None
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query = {'$and': [query, {'_id': {'$gt': last_id}}]}
+        batch = list(collection.find(batch_query, fields).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]['_id']
+        matched += len(batch)
+
+        planned = []
+        for document in batch:
+            changes = _changes(action, document, days, now)
+            if changes is None:
+                continue
+            changes['status'] = subscriptions.status_of(
+                changes.get('is_trial', document.get('is_trial')),
+                changes.get('valid_till', document.get('valid_till')),
+                now,
+            )
+            planned.append((document, changes))
+        if not planned:
+            if progress:
+                progress(matched, modified)
+            continue
+
+        # Only update documents still in the state read above, so one saved
+        # concurrently (and counted by its save hook) is left alone
+        operations = [
+            UpdateOne(
+                {'_id': document['_id'], 'status': document.get('status'), 'valid_till': document.get('valid_till')},
+                {'$set': changes},
+            )
+            for document, changes in planned
+        ]
+        batch_modified = collection.bulk_write(operations, ordered=False).modified_count
+        if batch_modified != len(planned):
+            # Keep only the documents that now hold this batch's changes
+            wanted = {document['_id']: changes for document, changes in planned}
+            applied = {
+                stored['_id'] for stored in collection.find({'_id': {'$in': list(wanted)}})
+                if all(stored.get(field) == value for field, value in wanted[stored['_id']].items())
+            }
+            planned = [(document, changes) for document, changes in planned if document['_id'] in applied]
+        modified += batch_modified
+
+        moves = Counter()
+        events = []
+        for document, changes in planned:
+            old_status, status = document.get('status'), changes['status']
+            if old_status != status:
+                moves[(document.get('cluster_name'), old_status)] -= 1
+                moves[(document.get('cluster_name'), status)] += 1
+                events.append(subscriptions._event(document, old_status, status, now, 'bulk'))
+        for (cluster_name, status), delta in moves.items():
+            subscriptions._adjust(cluster_name, status, delta)
+        if events:
+            SubscriptionEvent._get_collection().insert_many(events)
+        if progress:
+            progress(matched, modified)
+
+    if modified:
+        caching.bump('match_ids')
+    return matched, modified
@@ -26,6 +26,9 @@ class ClusterDetails(EmbeddedDocument):
     match_id_type = StringField(default='admin_generated', choices=('admin_generated', 'user_created'))
     trial_period = IntField(min_value=0, max_value=7, default=0)
 
+# Stored subscription states of a match ID, maintained by subscriptions.py
+SUBSCRIPTION_STATUSES = ('trial_active', 'paid_active', 'inactive')
+
 class MatchId(Document):
     match_id = StringField(required=True, unique=True)
     cluster_name = StringField(required=True)
@@ -33,12 +36,48 @@ class MatchId(Document):
     last_paid_on = DateTimeField(default=None, null=True)
     valid_till = DateTimeField(default=None, null=True)
     is_trial = BooleanField(default=False)
+    # Set on save and moved to 'inactive' by the expiry tracker once
+    # valid_till has passed; None until `manage.py track_subscriptions --rebuild`
+    status = StringField(choices=SUBSCRIPTION_STATUSES, default=None, null=True)
     
     meta = {
         'collection': 'match_ids',
-        'indexes': ['match_id']
+        # Compound indexes follow the list filters (cluster, trial status)
+        # followed by the keyset sort fields; see `manage.py audit_queries`
+        'indexes': [
+            'match_id',
+            ('created_on', 'id'),
+            ('valid_till', 'id'),
+            ('cluster_name', 'created_on', 'id'),
+            ('cluster_name', 'valid_till', 'id'),
+            ('is_trial', 'valid_till', 'id'),
+            # Status filter, and the expiry tracker's scan in valid_till order
+            ('status', 'created_on', 'id'),
+            ('status', 'valid_till', 'id'),
+        ]
     }
     
+    def save(self, *args, **kwargs):
+        # Read the stored cluster and status first so the counters can move
+        # this match ID out of its old (cluster, status) bucket
+        from .subscriptions import status_of, record_match_id_change
+        previous = None
+        if self.pk:
+            previous = MatchId.objects(pk=self.pk).only('match_id', 'cluster_name', 'status').as_pymongo().first()
+        self.status = status_of(self.is_trial, self.valid_till)
+        result = super().save(*args, **kwargs)
+        record_match_id_change(previous, self.to_mongo())
+        from .caching import bump
+        bump('match_ids')
+        return result
+    
+    def delete(self, *args, **kwargs):
+        super().delete(*args, **kwargs)
+        from .subscriptions import record_match_id_change
+        record_match_id_change(self.to_mongo(), None)
+        from .caching import bump
+        bump('match_ids')
+    
     @classmethod
     def get_by_cluster(cls, cluster_name):
         return cls.objects(cluster_name=cluster_name).first()
@@ -52,9 +91,28 @@ class UserProfile(Document):
     clusters = EmbeddedDocumentListField(ClusterDetails, default=[])
 
     meta = {
-        'collection': 'users'
+        'collection': 'users',
+        # email and username back the search box (user_id is unique-indexed)
+        'indexes': ['clusters.api_key', 'clusters.cluster_name', ('created_at', 'id'), 'email', 'username']
     }
     
+    def save(self, *args, **kwargs):
+        result = super().save(*args, **kwargs)
+        # Clusters may have changed: mirror them into the clusters
+        # collection and drop the cached api_key lookup
+        from .cluster_store import sync_user
+        sync_user(self)
+        from .caching import bump
+        bump('users')
+        return result
+    
+    def delete(self, *args, **kwargs):
+        super().delete(*args, **kwargs)
+        from .cluster_store import remove_user
+        remove_user(self)
+        from .caching import bump
+        bump('users')
+    
     def add_cluster(self, cluster_data):
         new_cluster = ClusterDetails(**cluster_data)
         self.clusters.append(new_cluster)
@@ -76,14 +134,141 @@ class Payment(Document):
     
     meta = {
         'collection': 'payments',
-        'indexes': ['payment_id', 'match_id', 'payment_date', 'api_key']
+        # Equality fields (status, api_key) first, then the payment_date
+        # range / keyset sort; see `manage.py audit_queries`
+        'indexes': [
+            'payment_id',
+            'match_id',
+            'user_email',
+            ('payment_date', 'id'),
+            ('status', 'payment_date', 'id'),
+            ('api_key', 'payment_date', 'id'),
+            ('api_key', 'status', 'payment_date', 'id'),
+        ]
     }
     
+    def save(self, *args, **kwargs):
+        # Read the stored values first so the rollup can move the amount
+        # out of the old (day, api_key, status) bucket
+        previous = None
+        if self.pk:
+            previous = Payment.objects(pk=self.pk).only(
+                'payment_date', 'api_key', 'status', 'amount'
+            ).as_pymongo().first()
+        result = super().save(*args, **kwargs)
+        from .rollups import record_payment_change
+        record_payment_change(previous, self.to_mongo())
+        from .caching import bump
+        bump('payments')
+        return result
+    
+    def delete(self, *args, **kwargs):
+        super().delete(*args, **kwargs)
+        from .rollups import record_payment_change
+        record_payment_change(self.to_mongo(), None)
+        from .caching import bump
+        bump('payments')
+    
     @property
     def cluster_name(self):
-        """Get cluster name from api_key for backward compatibility"""
-        for user in UserProfile.objects:
-            for cluster in user.clusters:
-                if cluster.api_key == self.api_key:
-                    return cluster.cluster_name
-        return None
+        """Get cluster name from api_key for backward compatibility.
+
+        Resolves a single payment; list views should batch through
+        cluster_registry.cluster_names() instead.
+        """
+        from .cluster_registry import cluster_registry
+        ref = cluster_registry.resolve(self.api_key)
+        return ref.cluster_name if ref else None
+
+
+# Daily payment totals per (day, api_key, status), maintained by rollups.py
+class RevenueRollup(Document):
+    day = DateTimeField(required=True)
+    api_key = StringField(required=True)
+    status = StringField(required=True, choices=('Pending', 'Completed', 'Failed'))
+    amount = DecimalField(precision=2, default=0)
+    count = IntField(default=0)
+    
+    meta = {
+        'collection': 'revenue_rollups',
+        'indexes': [
+            {'fields': ['day', 'api_key', 'status'], 'unique': True},
+            ('status', 'day'),
+        ]
+    }
+
+
+# Active match ID counts per cluster, maintained by subscriptions.py. The
+# document with cluster_name None holds the totals over every cluster.
+class SubscriptionCounter(Document):
+    cluster_name = StringField()
+    trial_active = IntField(default=0)
+    paid_active = IntField(default=0)
+    active = IntField(default=0)
+    
+    meta = {
+        'collection': 'subscription_counters',
+        'indexes': [
+            {'fields': ['cluster_name'], 'unique': True},
+        ]
+    }
+
+
+# One document per subscription status change of a match ID
+class SubscriptionEvent(Document):
+    match_id = StringField(required=True)
+    cluster_name = StringField()
+    from_status = StringField(null=True)
+    to_status = StringField(null=True)
+    at = DateTimeField(required=True)
+    reason = StringField(choices=('expired', 'saved', 'deleted', 'bulk'))
+    
+    meta = {
+        'collection': 'subscription_events',
+        'indexes': [
+            ('match_id', 'at'),
+            'at',
+        ]
+    }
+
+
+# Top-level copy of every UserProfile.clusters entry, kept in sync by
+# cluster_store.py so clusters can be listed and looked up without scanning
+# users. The owner's username and email are denormalized for the registry.
+class RegisteredCluster(Document):
+    cluster_name = StringField(required=True, max_length=255)
+    api_key = StringField(max_length=32)
+    owner = ReferenceField(UserProfile)
+    owner_id = StringField(required=True)
+    owner_username = StringField()
+    owner_email = StringField()
+    cluster_price = DecimalField(precision=2)
+    timeline_days = IntField()
+    match_id_type = StringField(default='admin_generated', choices=('admin_generated', 'user_created'))
+    trial_period = IntField(default=0)
+    synced_at = DateTimeField()
+    
+    meta = {
+        'collection': 'clusters',
+        'indexes': [
+            {'fields': ['cluster_name'], 'unique': True},
+            {'fields': ['api_key'], 'unique': True, 'sparse': True},
+            'owner_id',
+            'synced_at',
+        ]
+    }
+    
+    @classmethod
+    def from_cluster(cls, user, cluster):
+        return cls(
+            cluster_name=cluster.cluster_name,
+            api_key=cluster.api_key,
+            owner=user,
+            owner_id=user.user_id,
+            owner_username=user.username,
+            owner_email=user.email,
+            cluster_price=cluster.cluster_price,
+            timeline_days=cluster.timeline_days,
+            match_id_type=cluster.match_id_type,
+            trial_period=cluster.trial_period,
+        )
@@ -0,0 +1,164 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+
+KeysetPage = namedtuple('KeysetPage', [
+    'items',
+    'next_cursor',
+    'previous_cursor',
+    'sort',
+    'page_size',
+])
+
+# Types a sort key may take in a cursor; anything else (a dict could carry
+# query operators into keyset_filter) makes the cursor invalid
+CURSOR_VALUE_TYPES = (str, int, float, bool, type(None))
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    return {'v': value}
+
+
+def _decode_value(data):
+    if 'dt' in data:
+        return datetime.fromisoformat(data['dt'])
+    if not isinstance(data['v'], CURSOR_VALUE_TYPES):
+        raise TypeError('cursor sort key must be a scalar')
+    return data['v']
+
+
+def encode_cursor(value, pk, direction):
+    payload = {'k': _encode_value(value), 'id': str(pk), 'd': direction}
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (value, pk, direction) or None for a missing/invalid cursor"""
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        direction = payload['d']
+        if direction not in ('next', 'prev'):
+            return None
+        return _decode_value(payload['k']), ObjectId(payload['id']), direction
+    except (ValueError, KeyError, TypeError, InvalidId):
+        return None
+
+
+def keyset_filter(field, value, pk, descending):
+    """Raw query matching documents that sort after (value, pk).
+
+    Nulls sort before every date in MongoDB, so they come last when
+    descending and first when ascending.
+    """
+    op = '$lt' if descending else '$gt'
+    tie = {field: value, '_id': {op: pk}}
+    if value is None:
+        if descending:
+            return tie
+        return {'$or': [tie, {field: {'$ne': None}}]}
+    clauses = [{field: {op: value}}, tie]
+    if descending:
+        clauses.append({field: None})
+    return {'$or': clauses}
+
+
+class KeysetPaginator:
+    """Cursor-based pagination over a queryset sorted by (field, _id).
+
+    Unlike skip/limit, every page is an index range scan that starts where
+    the previous page ended, so deep pages cost the same as the first one.
+    """
+
+    def __init__(self, queryset, field, descending=True, page_size=50):
+        self.queryset = queryset
+        self.field = field
+        self.descending = descending
+        self.page_size = page_size
+
+    def _key(self, item):
+        if isinstance(item, dict):
+            return item.get(self.field), item['_id']
+        return getattr(item, self.field), item.pk
+
+    def _fetch(self, after, descending):
+        queryset = self.queryset
+        if after is not None:
+            queryset = queryset.filter(__raw__=keyset_filter(self.field, after[0], after[1], descending))
+        sign = '-' if descending else ''
+        return list(queryset.order_by(f'{sign}{self.field}', f'{sign}id').limit(self.page_size + 1))
+
+    def page(self, cursor=None):
+        position = decode_cursor(cursor)
+        if position is not None and position[2] == 'prev':
+            # Walk backwards from the cursor, then restore display order
+            items = self._fetch(position[:2], not self.descending)
+            has_previous = len(items) > self.page_size
+            items = items[:self.page_size][::-1]
+            has_next = True
+        else:
+            items = self._fetch(position[:2] if position else None, self.descending)
+            has_next = len(items) > self.page_size
+            items = items[:self.page_size]
+            has_previous = position is not None
+
+        next_cursor = previous_cursor = None
+        if items and has_next:
+            next_cursor = encode_cursor(*self._key(items[-1]), 'next')
+        if items and has_previous:
+            previous_cursor = encode_cursor(*self._key(items[0]), 'prev')
+
+        sort = f"{'-' if self.descending else ''}{self.field}"
+        return KeysetPage(items, next_cursor, previous_cursor, sort, self.page_size)
+
+
+def get_page_size(request):
+    default = getattr(settings, 'LIST_PAGE_SIZE', 50)
+    maximum = getattr(settings, 'LIST_MAX_PAGE_SIZE', 500)
+    try:
+        page_size = int(request.GET.get('page_size', default))
+    except ValueError:
+        page_size = default
+    return max(1, min(page_size, maximum))
+
+
+def paginate(request, queryset, sort_fields, default_sort):
+    """Paginate a queryset from the request's cursor, sort and page_size.
+
+    ``sort`` is a field name from ``sort_fields``, prefixed with '-' for
+    descending order; anything else falls back to ``default_sort``.
+    """
+    sort = request.GET.get('sort', default_sort)
+    if sort.lstrip('-') not in sort_fields:
+        sort = default_sort
+    paginator = KeysetPaginator(
+        queryset,
+        sort.lstrip('-'),
+        descending=sort.startswith('-'),
+        page_size=get_page_size(request),
+    )
+    return paginator.page(request.GET.get('cursor'))
+
+
+def page_query(request, cursor):
+    """Query string for another page, keeping the current filters and sort"""
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params['cursor'] = cursor
+    return params.urlencode()
+
+
+def sort_query(request, sort):
+    """Query string for the first page in another sort order"""
+    params = request.GET.copy()
+    params.pop('cursor', None)
+    params['sort'] = sort
+    return params.urlencode()
@@ -0,0 +1,300 @@
+"""ReportLab rendering of the payment and custom reports.
+
+Renderers write into any binary file-like ``output`` so the same code
+serves the synchronous download views and the background report jobs.
+``progress(percent, message)`` is an optional callback for long renders.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+
+
+def _no_progress(percent, message):
+    pass
+
+
+def payment_report_filename(context):
+    filename = f"payment_report_{context['month_name']}_{context['year']}"
+    if context['cluster_name']:
+        filename += f"_{context['cluster_name'].replace(' ', '_')}"
+    return f"{filename}.pdf"
+
+
+def custom_report_filename(report_type, now=None):
+    now = now or datetime.now()
+    return f"solsub_report_{report_type}_{now.strftime('%Y%m%d')}.pdf"
+
+
+class _StreamedStory(list):
+    """Story list that is refilled from an iterator as the layout consumes it.
+
+    ReportLab's build loop checks ``len(story)`` before taking each flowable
+    off the front, so topping the list up there keeps only a few pending
+    flowables (and the rows behind them) in memory at any time.
+    """
+
+    def __init__(self, flowables, more, low_water=4):
+        self._more = iter(more)
+        self._low_water = low_water
+        super().__init__(flowables)
+
+    def __len__(self):
+        while self._more is not None and list.__len__(self) < self._low_water:
+            try:
+                self.append(next(self._more))
+            except StopIteration:
+                self._more = None
+        return list.__len__(self)
+
+
+def chunk_rows():
+    return getattr(settings, 'PDF_TABLE_CHUNK_ROWS', 40)
+
+
+def _table_style(amount_column, total_row):
+    commands = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('FONTSIZE', (0, 1), (-1, -1), 8),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('ALIGN', (amount_column, 1), (amount_column, -1), 'RIGHT'),  # Align amount column to right
+    ]
+    if total_row:
+        commands += [
+            ('BACKGROUND', (0, -1), (-1, -1), colors.beige),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ]
+    return TableStyle(commands)
+
+
+def _payment_tables(context, rows, width, progress):
+    """Payment table split into chunk_rows()-row tables with the header on each"""
+    if context['cluster_name']:
+        # If specific cluster, don't include cluster name column
+        header = ['Payment ID', 'Match ID', 'Amount (₹)', 'Date', 'User Email']
+        ratios = [0.22, 0.22, 0.14, 0.14, 0.28]
+        total_row = ['Total', '', f"₹{context['total_amount']:.2f}", '', '']
+        amount_column = 2
+
+        def cells(payment):
+            return [payment['id'], payment['match_id'], f"₹{payment['amount']:.2f}",
+                    payment['date'], payment['user_email']]
+    else:
+        # If all clusters, include cluster name column
+        header = ['Payment ID', 'Match ID', 'Cluster', 'Amount (₹)', 'Date', 'User Email']
+        ratios = [0.18, 0.18, 0.14, 0.12, 0.13, 0.25]
+        total_row = ['Total', '', '', f"₹{context['total_amount']:.2f}", '', '']
+        amount_column = 3
+
+        def cells(payment):
+            return [payment['id'], payment['match_id'], payment['cluster_name'],
+                    f"₹{payment['amount']:.2f}", payment['date'], payment['user_email']]
+
+    # Fixed column widths so every chunk lines up with the one before it
+    col_widths = [width * ratio for ratio in ratios]
+    body_style = _table_style(amount_column, total_row=False)
+    size = chunk_rows()
+    total = max(context['payment_count'], 1)
+
+    chunk, done = [], 0
+    for payment in rows:
+        chunk.append(cells(payment))
+        if len(chunk) == size:
+            done += len(chunk)
+            yield Table([header] + chunk, colWidths=col_widths, repeatRows=1, style=body_style)
+            progress(40 + int(55 * min(done, total) / total), f'Rendered {done} of {total} payments')
+            chunk = []
+    # Last chunk carries the total row
+    yield Table([header] + chunk + [total_row], colWidths=col_widths, repeatRows=1,
+                style=_table_style(amount_column, total_row=True))
+
+
+def render_payment_report(context, rows, output, progress=_no_progress):
+    """Render the cluster owner payment report.
+
+    ``rows`` is an iterable of payment dicts (see report_data); it is
+    consumed as the layout reaches the payment table, in chunk_rows()-row
+    tables, so neither the rows nor one table holding all of them are ever
+    in memory. The pages already laid out are still kept by ReportLab until
+    the document is written, so memory grows with the payment count (around
+    0.6 KB per payment).
+    """
+    # Create the PDF object, using the output as its "file"
+    doc = SimpleDocTemplate(output, pagesize=A4, pageCompression=1)
+
+    # Container for the 'Flowable' objects
+    elements = []
+
+    # Define styles
+    styles = getSampleStyleSheet()
+    title_style = styles['Heading1']
+    subtitle_style = styles['Heading2']
+    normal_style = styles['Normal']
+
+    # Add title
+    if context['cluster_name']:
+        title = f"Payment Report for {context['cluster_name']}"
+    else:
+        title = "Payment Report for All Clusters"
+
+    elements.append(Paragraph(title, title_style))
+    elements.append(Spacer(1, 0.25*inch))
+
+    # Add period
+    period = f"{context['month_name']} {context['year']}"
+    elements.append(Paragraph(f"Period: {period}", subtitle_style))
+    elements.append(Spacer(1, 0.25*inch))
+
+    # Add owner info if available
+    if context['owner_info']:
+        owner = context['owner_info']
+        elements.append(Paragraph("Cluster Owner Information", subtitle_style))
+        elements.append(Paragraph(f"Name: {owner['username']}", normal_style))
+        elements.append(Paragraph(f"Email: {owner['email']}", normal_style))
+
+        if 'bank_details' in owner:
+            elements.append(Spacer(1, 0.1*inch))
+            elements.append(Paragraph("Bank Details", subtitle_style))
+            bank = owner['bank_details']
+            elements.append(Paragraph(f"Bank: {bank['bank_name']}", normal_style))
+            elements.append(Paragraph(f"Account: {bank['account_number']}", normal_style))
+            elements.append(Paragraph(f"IFSC: {bank['ifsc_code']}", normal_style))
+            elements.append(Paragraph(f"Branch: {bank['branch_name']}", normal_style))
+
+        elements.append(Spacer(1, 0.25*inch))
+
+    # Add summary
+    elements.append(Paragraph("Summary", subtitle_style))
+    elements.append(Paragraph(f"Total Revenue: ₹{context['total_amount']:.2f}", normal_style))
+    elements.append(Paragraph(f"Total Payments: {context['payment_count']}", normal_style))
+    elements.append(Spacer(1, 0.25*inch))
+
+    # Add payments table
+    elements.append(Paragraph("Payment Details", subtitle_style))
+
+    def tail():
+        yield from _payment_tables(context, rows, doc.width, progress)
+
+        # Add footer with date
+        yield Spacer(1, 0.5*inch)
+        yield Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_style)
+
+    # Build PDF
+    doc.build(_StreamedStory(elements, tail()))
+
+
+def render_custom_report(data, date_range_text, output, progress=_no_progress):
+    """Render the custom report from report_data.custom_report_data()"""
+    report_type = data['report_type']
+
+    # Create the PDF object, using the output as its "file"
+    doc = SimpleDocTemplate(output, pagesize=A4)
+
+    # Container for the 'Flowable' objects
+    elements = []
+
+    # Define styles
+    styles = getSampleStyleSheet()
+    title_style = styles['Heading1']
+    subtitle_style = styles['Heading2']
+    normal_style = styles['Normal']
+
+    # Add title
+    title = f"SolSub Admin {report_type.capitalize()} Report"
+    elements.append(Paragraph(title, title_style))
+    elements.append(Spacer(1, 0.25*inch))
+
+    # Add date range
+    elements.append(Paragraph(f"Period: {date_range_text}", subtitle_style))
+    elements.append(Spacer(1, 0.25*inch))
+
+    # Add summary statistics
+    elements.append(Paragraph("Summary", subtitle_style))
+    elements.append(Paragraph(f"Total Revenue: ₹{data['total_revenue']:.2f}", normal_style))
+    elements.append(Paragraph(f"Active Subscriptions: {data['active_match_ids']}", normal_style))
+    elements.append(Paragraph(f"Trial Conversion Rate: {data['trial_conversion_rate']:.1f}%", normal_style))
+    if data['unavailable']:
+        elements.append(Paragraph(f"Unavailable (shown as zero): {', '.join(data['unavailable'])}", normal_style))
+    elements.append(Spacer(1, 0.25*inch))
+
+    # Add monthly revenue breakdown
+    elements.append(Paragraph("Monthly Revenue Breakdown", subtitle_style))
+
+    # Create table data
+    table_data = [['Month', 'Revenue (₹)']]
+    for month, revenue in data['monthly_revenue'].items():
+        # Format month as "Month Year"
+        month_date = datetime.strptime(month, '%Y-%m')
+        formatted_month = month_date.strftime('%B %Y')
+        table_data.append([formatted_month, f"₹{revenue:.2f}"])
+
+    # Create table
+    if len(table_data) > 1:  # Only create table if there's data
+        table = Table(table_data)
+
+        # Add style to table
+        style = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('ALIGN', (1, 1), (1, -1), 'RIGHT'),  # Align amount column to right
+        ])
+        table.setStyle(style)
+
+        # Add table to elements
+        elements.append(table)
+    else:
+        elements.append(Paragraph("No revenue data available", normal_style))
+
+    # Add cluster performance if detailed report
+    if report_type in ['detailed', 'financial']:
+        elements.append(Spacer(1, 0.25*inch))
+        elements.append(Paragraph("Cluster Performance", subtitle_style))
+
+        # Create table data
+        table_data = [['Cluster', 'Revenue (₹)', 'Number of Payments']]
+        for cluster, stats in data['cluster_performance'].items():
+            table_data.append([cluster, f"₹{stats['revenue']:.2f}", stats['count']])
+
+        # Create table
+        if len(table_data) > 1:  # Only create table if there's data
+            table = Table(table_data)
+
+            # Add style to table
+            style = TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 12),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black),
+                ('ALIGN', (1, 1), (1, -1), 'RIGHT'),  # Align amount column to right
+            ])
+            table.setStyle(style)
+
+            # Add table to elements
+            elements.append(table)
+        else:
+            elements.append(Paragraph("No cluster performance data available", normal_style))
+
+    # Add footer with date
+    elements.append(Spacer(1, 0.5*inch))
+    elements.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_style))
+
+    # Build PDF
+    progress(60, 'Laying out pages')
+    doc.build(elements)
@@ -0,0 +1,224 @@
+"""Query-plan audit for the queries the views issue.
+
+``audit_queries()`` builds the same filters, sorts and pipelines the views
+use (through the real builders in filters.py, aggregations.py and
+report_data.py, with sample values taken from the data) and ``explain()``
+summarises how MongoDB would run each one. The ``audit_queries`` management
+command prints the result and fails on collection scans or in-memory sorts
+that are not marked as expected.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from . import aggregations, filters, report_data, subscriptions, timeseries
+from .mongo_models import (
+    UserProfile, MatchId, Payment, RevenueRollup, RegisteredCluster, SubscriptionCounter, SubscriptionEvent,
+)
+
+AuditQuery = namedtuple(
+    'AuditQuery',
+    ['name', 'model', 'filter', 'sort', 'limit', 'pipeline', 'expect_scan'],
+    defaults=({}, None, None, None, False),
+)
+
+PlanSummary = namedtuple('PlanSummary', [
+    'query',
+    'stages',
+    'indexes',
+    'collection_scan',
+    'in_memory_sort',
+    'keys_examined',
+    'docs_examined',
+    'returned',
+    'millis',
+])
+
+# Every model whose indexes the audit checks
+AUDITED_MODELS = (
+    UserProfile, MatchId, Payment, RevenueRollup, RegisteredCluster, SubscriptionCounter, SubscriptionEvent,
+)
+
+
+def _list_sort(field, descending=True):
+    direction = -1 if descending else 1
+    return [(field, direction), ('_id', direction)]
+
+
+def _samples():
+    """A real cluster and user to plug into the sample queries"""
+    cluster = RegisteredCluster.objects.only('cluster_name', 'api_key').as_pymongo().first() or {}
+    user = UserProfile.objects.only('user_id').as_pymongo().first() or {}
+    return {
+        'cluster_name': cluster.get('cluster_name', ''),
+        'api_key': cluster.get('api_key', ''),
+        'user_id': user.get('user_id', ''),
+    }
+
+
+def audit_queries(now=None):
+    now = now or datetime.now()
+    sample = _samples()
+    page = getattr(settings, 'LIST_PAGE_SIZE', 50) + 1
+    month_ago = (now - timedelta(days=30)).strftime('%Y-%m-%d')
+    today = now.strftime('%Y-%m-%d')
+    cluster = sample['cluster_name']
+    period_start, period_end = report_data.report_period({'date_range': 'last30days'}, now)
+
+    return [
+        # List views (first keyset page, default and alternative sorts)
+        AuditQuery('users.list', UserProfile, filters.user_query({}), _list_sort('created_at'), page),
+        AuditQuery('users.list.has_clusters', UserProfile,
+                   filters.user_query({'has_clusters': 'yes'}), _list_sort('created_at'), page),
+        AuditQuery('payments.list', Payment, filters.payment_query({}), _list_sort('payment_date'), page),
+        AuditQuery('payments.list.status', Payment,
+                   filters.payment_query({'status': 'Completed'}), _list_sort('payment_date'), page),
+        AuditQuery('payments.list.cluster', Payment,
+                   filters.payment_query({'cluster': cluster}), _list_sort('payment_date'), page),
+        AuditQuery('payments.list.cluster_status', Payment,
+                   filters.payment_query({'cluster': cluster, 'status': 'Completed'}),
+                   _list_sort('payment_date'), page),
+        AuditQuery('payments.list.date_range', Payment,
+                   filters.payment_query({'start_date': month_ago, 'end_date': today}),
+                   _list_sort('payment_date'), page),
+        AuditQuery('match_ids.list', MatchId, filters.match_id_query({}, now), _list_sort('created_on'), page),
+        AuditQuery('match_ids.list.valid_till', MatchId,
+                   filters.match_id_query({}, now), _list_sort('valid_till', descending=False), page),
+        AuditQuery('match_ids.list.cluster', MatchId,
+                   filters.match_id_query({'cluster': cluster}, now), _list_sort('created_on'), page),
+        AuditQuery('match_ids.list.cluster_valid_till', MatchId,
+                   filters.match_id_query({'cluster': cluster}, now), _list_sort('valid_till'), page),
+        AuditQuery('match_ids.list.trial_active', MatchId,
+                   filters.match_id_query({'status': 'Trial Active'}, now), _list_sort('created_on'), page),
+        AuditQuery('match_ids.list.stored_status', MatchId,
+                   {'status': subscriptions.TRIAL_ACTIVE}, _list_sort('created_on'), page),
+
+        # Subscription expiry tracker
+        AuditQuery('match_ids.expiry_due', MatchId, subscriptions._due_query(now), [('valid_till', 1)], 500),
+        # A handful of counter documents, one per cluster
+        AuditQuery('subscription_counters.active', SubscriptionCounter,
+                   {'cluster_name': {'$ne': None}, 'active': {'$gt': 0}}, expect_scan=True),
+
+        # Lookups
+        AuditQuery('users.by_user_id', UserProfile, {'user_id': sample['user_id']}, limit=1),
+        AuditQuery('users.by_cluster_name', UserProfile, {'clusters.cluster_name': cluster}, limit=1),
+        AuditQuery('users.by_api_key', UserProfile, {'clusters.api_key': sample['api_key']}, limit=1),
+        AuditQuery('clusters.by_api_key', RegisteredCluster, {'api_key': {'$in': [sample['api_key']]}}),
+        AuditQuery('clusters.by_name', RegisteredCluster, {'cluster_name': cluster}, limit=1),
+        # The registry and cluster page read every cluster on purpose
+        AuditQuery('clusters.all', RegisteredCluster, {}, expect_scan=True),
+
+        # Search box: exact then prefix matches on each searched field
+        AuditQuery('search.users.exact', UserProfile,
+                   filters.search_query(filters.USER_SEARCH_FIELDS, sample['user_id'], exact=True), limit=10),
+        AuditQuery('search.users.prefix', UserProfile,
+                   filters.search_query(filters.USER_SEARCH_FIELDS, 'user'), limit=10),
+        AuditQuery('search.payments.prefix', Payment,
+                   filters.search_query(filters.PAYMENT_SEARCH_FIELDS, 'pay'), limit=10),
+        AuditQuery('search.match_ids.prefix', MatchId,
+                   filters.search_query(filters.MATCH_ID_SEARCH_FIELDS, 'match'), limit=10),
+
+        # Reports
+        AuditQuery('payments.report.cluster', Payment, report_data.payment_report_query(sample['api_key'], now)),
+        AuditQuery('payments.report.all', Payment, report_data.payment_report_query(None, now)),
+        AuditQuery('rollups.daily', RevenueRollup, {'status': 'Completed', 'day': {'$gte': now - timedelta(days=180)}}),
+
+        # Aggregations
+        AuditQuery('payments.revenue', Payment, pipeline=aggregations.completed_revenue_pipeline('payment_date', 1)),
+        AuditQuery('rollups.revenue', RevenueRollup, pipeline=aggregations.completed_revenue_pipeline('day', '$count')),
+        AuditQuery('payments.revenue.period', Payment,
+                   pipeline=aggregations.completed_revenue_pipeline('payment_date', 1, period_start, period_end)),
+        AuditQuery('rollups.revenue.period', RevenueRollup,
+                   pipeline=aggregations.completed_revenue_pipeline('day', '$count', period_start, period_end)),
+        AuditQuery('match_ids.period.active', MatchId,
+                   {'valid_till': {'$gte': period_start}, 'created_on': {'$lt': period_end}}),
+        AuditQuery('match_ids.period.trials', MatchId,
+                   {'created_on': {'$gte': period_start, '$lt': period_end}, 'is_trial': True}),
+        AuditQuery('payments.timeseries', Payment, pipeline=timeseries.bucketed_pipeline(
+            {'status': 'Completed', 'payment_date': {'$gte': period_start, '$lt': period_end}},
+            'payment_date', 'day', {'revenue': '$amount', 'payments': 1})),
+        AuditQuery('match_ids.timeseries', MatchId, pipeline=timeseries.bucketed_pipeline(
+            {'created_on': {'$gte': period_start, '$lt': period_end}}, 'created_on', 'day', {'new_match_ids': 1})),
+        AuditQuery('payments.daily_revenue', Payment,
+                   pipeline=aggregations.daily_revenue_pipeline(now - timedelta(days=180))),
+        AuditQuery('match_ids.trial_stats', MatchId, pipeline=aggregations.trial_stats_pipeline(), expect_scan=True),
+        AuditQuery('match_ids.active_by_cluster', MatchId, pipeline=aggregations.active_subscriptions_pipeline(now)),
+        # $facet counts over the whole collection cannot use an index
+        AuditQuery('match_ids.stats', MatchId, pipeline=aggregations.match_id_stats_pipeline(now), expect_scan=True),
+        AuditQuery('users.stats', UserProfile, pipeline=aggregations.user_stats_pipeline(), expect_scan=True),
+    ]
+
+
+def _explain_command(query):
+    collection = query.model._get_collection()
+    if query.pipeline is not None:
+        command = {'aggregate': collection.name, 'pipeline': query.pipeline, 'cursor': {}}
+    else:
+        command = {'find': collection.name, 'filter': query.filter}
+        if query.sort:
+            command['sort'] = dict(query.sort)
+        if query.limit:
+            command['limit'] = query.limit
+    return collection.database.command({'explain': command, 'verbosity': 'executionStats'})
+
+
+def _walk(node):
+    """Yield every plan stage dict below ``node`` (classic and SBE layouts)"""
+    if isinstance(node, dict):
+        if 'stage' in node:
+            yield node
+        for key, value in node.items():
+            if key in ('inputStage', 'inputStages', 'queryPlan', 'winningPlan',
+                       'shards', 'stages', '$cursor', 'queryPlanner'):
+                yield from _walk(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _walk(item)
+
+
+def _execution_stats(node):
+    """Every executionStats document in an explain result"""
+    if isinstance(node, dict):
+        if 'executionStats' in node:
+            yield node['executionStats']
+        for value in node.values():
+            yield from _execution_stats(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _execution_stats(item)
+
+
+def summarize(query, explain_result):
+    """Reduce an explain result to the numbers worth watching"""
+    planner_stages = list(_walk(explain_result))
+    stats = list(_execution_stats(explain_result))
+    stages = [stage['stage'] for stage in planner_stages]
+    indexes = sorted({stage['indexName'] for stage in planner_stages if stage.get('indexName')})
+    return PlanSummary(
+        query=query,
+        stages=list(dict.fromkeys(stages)),
+        indexes=indexes,
+        collection_scan='COLLSCAN' in stages,
+        # A SORT stage means the results were sorted in memory, not read in
+        # index order; $sort inside an aggregation shows up the same way
+        in_memory_sort='SORT' in stages,
+        keys_examined=sum(stat.get('totalKeysExamined', 0) for stat in stats),
+        docs_examined=sum(stat.get('totalDocsExamined', 0) for stat in stats),
+        returned=sum(stat.get('nReturned', 0) for stat in stats),
+        millis=max([stat.get('executionTimeMillis', 0) for stat in stats] or [0]),
+    )
+
+
+def explain(query):
+    return summarize(query, _explain_command(query))
+
+
+def problems(summary):
+    """Plan issues that should fail the audit"""
+    issues = []
+    if summary.collection_scan and not summary.query.expect_scan:
+        issues.append('collection scan')
+    if summary.in_memory_sort and summary.query.sort:
+        issues.append('in-memory sort')
+    return issues
@@ -0,0 +1,163 @@
+"""Per-request accounting of the Mongo commands a page issues.
+
+A pymongo command listener records every command against the ``QueryStats``
+of the request being served (held in a context variable, which
+concurrency.fan_out carries into its worker threads). ``QueryMonitorMiddleware``
+reports the totals in the ``X-Mongo-Stats`` and ``Server-Timing`` response
+headers, ``context_processor`` exposes them to the staff-only footer in
+base.html, and a warning is logged when one query shape repeats more than
+MONGO_N_PLUS_ONE_THRESHOLD times in a request (the N+1 pattern).
+"""
+import contextvars
+import json
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('solsub_query_stats', default=None)
+
+# Commands that are follow-ups or housekeeping, not a query of their own
+_UNSHAPED_COMMANDS = {'getMore', 'killCursors', 'endSessions', 'hello', 'isMaster', 'ping'}
+
+
+def _shape(value):
+    """Replace the values in a filter or pipeline with placeholders"""
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_shape(value[0])] if value else []
+    return '?'
+
+
+def query_shape(command_name, command):
+    collection = command.get(command_name)
+    if command_name == 'find':
+        detail = {'filter': command.get('filter', {})}
+        if command.get('sort'):
+            detail['sort'] = command['sort']
+    elif command_name == 'aggregate':
+        detail = command.get('pipeline', [])
+    elif command_name in ('update', 'delete'):
+        statements = command.get('updates' if command_name == 'update' else 'deletes') or [{}]
+        detail = statements[0].get('q', {})
+    elif command_name in ('count', 'distinct'):
+        detail = command.get('query', {})
+    else:
+        detail = None
+    return f'{command_name} {collection} {json.dumps(_shape(detail), sort_keys=True, default=str)}'
+
+
+def _documents(command_name, reply):
+    cursor = reply.get('cursor')
+    if cursor:
+        return len(cursor.get('firstBatch') or cursor.get('nextBatch') or [])
+    if command_name == 'distinct':
+        return len(reply.get('values', []))
+    return 0
+
+
+class QueryStats:
+    """Mongo commands, time and documents returned for one request"""
+
+    def __init__(self, label='', threshold=None):
+        self.label = label
+        self.threshold = threshold if threshold is not None else getattr(settings, 'MONGO_N_PLUS_ONE_THRESHOLD', 10)
+        self.commands = 0
+        self.duration_ms = 0.0
+        self.documents = 0
+        self.shapes = Counter()
+        self._lock = threading.Lock()
+
+    def record_start(self, command_name, command):
+        with self._lock:
+            self.commands += 1
+            if command_name in _UNSHAPED_COMMANDS:
+                return
+            shape = query_shape(command_name, command)
+            self.shapes[shape] += 1
+            count = self.shapes[shape]
+        if count == self.threshold + 1:
+            logger.warning(
+                'Possible N+1 on %s: query shape repeated more than %d times: %s',
+                self.label or 'unknown request', self.threshold, shape,
+            )
+
+    def record_end(self, duration_micros, documents=0):
+        with self._lock:
+            self.duration_ms += duration_micros / 1000
+            self.documents += documents
+
+    @property
+    def repeated(self):
+        """Query shapes issued more than ``threshold`` times, most frequent first"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > self.threshold]
+
+    def header(self):
+        return f'commands={self.commands} time_ms={self.duration_ms:.1f} documents={self.documents}'
+
+
+class QueryListener(monitoring.CommandListener):
+    """Feeds pymongo command events into the current request's QueryStats"""
+
+    def started(self, event):
+        stats = _current.get()
+        if stats is not None:
+            stats.record_start(event.command_name, event.command)
+
+    def succeeded(self, event):
+        stats = _current.get()
+        if stats is not None:
+            stats.record_end(event.duration_micros, _documents(event.command_name, event.reply))
+
+    def failed(self, event):
+        stats = _current.get()
+        if stats is not None:
+            stats.record_end(event.duration_micros)
+
+
+def current_stats():
+    return _current.get()
+
+
+def start(label=''):
+    """Begin collecting stats in this context; returns (stats, reset token)"""
+    stats = QueryStats(label)
+    return stats, _current.set(stats)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+class QueryMonitorMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'MONGO_QUERY_MONITOR', True):
+            return self.get_response(request)
+
+        stats, token = start(request.path)
+        try:
+            response = self.get_response(request)
+        finally:
+            stop(token)
+
+        # Streaming responses keep querying after this point, so their
+        # headers only cover the work done before the first byte
+        response['X-Mongo-Stats'] = stats.header()
+        response['Server-Timing'] = f'mongo;dur={stats.duration_ms:.1f};desc="{stats.commands} commands"'
+        return response
+
+
+def context_processor(request):
+    """Expose the live stats to the staff-only footer in base.html"""
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_staff:
+        return {}
+    return {'mongo_stats': current_stats()}
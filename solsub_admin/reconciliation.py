@@ -0,0 +1,262 @@
+"""Reconcile a payment gateway settlement file against the payments collection.
+
+The file (CSV with a header row, or NDJSON) is read one line at a time and
+checked ``batch_size`` rows at a time with a single ``payment_id $in``
+lookup, so memory use is bounded by the batch size however long the file
+is. Each row is classified as matched, missing, amount mismatch or status
+mismatch (or invalid when it can't be parsed); only the rows that aren't
+matched are handed to ``on_row`` for the report.
+
+With ``apply=True`` the differences are corrected with one unordered
+``bulk_write`` per batch: mismatched payments take the settlement amount
+and status, and missing ones are inserted when the row carries the fields
+a payment needs. Bulk writes skip the ``Payment`` save hook, so the revenue
+rollups are adjusted here.
+"""
+import csv
+import json
+from collections import Counter
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+
+from pymongo import UpdateOne
+
+from . import aggregations, caching, rollups
+from .mongo_models import Payment
+
+FORMATS = ('csv', 'ndjson')
+
+MATCHED = 'matched'
+MISSING = 'missing'
+AMOUNT_MISMATCH = 'amount_mismatch'
+STATUS_MISMATCH = 'status_mismatch'
+INVALID = 'invalid'
+OUTCOMES = (MATCHED, MISSING, AMOUNT_MISMATCH, STATUS_MISMATCH, INVALID)
+
+# Columns of the report written for rows that aren't matched
+REPORT_COLUMNS = [
+    'line', 'outcome', 'payment_id', 'amount', 'stored_amount', 'status', 'stored_status', 'corrected', 'error',
+]
+
+# Gateway status names mapped to Payment.status
+STATUS_ALIASES = {
+    'completed': 'Completed', 'success': 'Completed', 'succeeded': 'Completed', 'captured': 'Completed',
+    'settled': 'Completed', 'paid': 'Completed',
+    'failed': 'Failed', 'failure': 'Failed', 'declined': 'Failed', 'refunded': 'Failed',
+    'pending': 'Pending', 'created': 'Pending', 'authorized': 'Pending', 'processing': 'Pending',
+}
+
+# Settlement fields needed to insert a missing payment
+INSERT_FIELDS = ('match_id', 'api_key', 'payment_date')
+
+
+class InvalidRow(ValueError):
+    pass
+
+
+def detect_format(path):
+    return 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def read_rows(stream, file_format):
+    """(line number, raw row dict) for every record in a text stream"""
+    if file_format == 'ndjson':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, {key.strip().lower(): value for key, value in row.items() if key}
+
+
+def _amount(value):
+    try:
+        # Rounded the way Payment.amount (precision=2) stores it
+        return Payment.amount.to_mongo(Decimal(str(value).strip()))
+    except (InvalidOperation, TypeError, ValueError):
+        raise InvalidRow(f'invalid amount: {value!r}')
+
+
+def _date(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        value = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    except ValueError:
+        raise InvalidRow(f'invalid payment_date: {value!r}')
+    # Payment dates are stored as naive UTC
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_row(row):
+    """Settlement row normalised to payment fields"""
+    if row is None:
+        raise InvalidRow('unreadable line')
+    payment_id = str(row.get('payment_id') or '').strip()
+    if not payment_id:
+        raise InvalidRow('missing payment_id')
+    status = STATUS_ALIASES.get(str(row.get('status') or '').strip().lower())
+    if status is None:
+        raise InvalidRow(f"unknown status: {row.get('status')!r}")
+
+    parsed = {'payment_id': payment_id, 'amount': _amount(row.get('amount')), 'status': status}
+    for field in ('match_id', 'api_key', 'user_email'):
+        if row.get(field):
+            parsed[field] = str(row[field]).strip()
+    if row.get('payment_date'):
+        parsed['payment_date'] = _date(row['payment_date'])
+    return parsed
+
+
+def classify(settled, stored):
+    if stored is None:
+        return MISSING
+    if aggregations.to_float(stored.get('amount')) != settled['amount']:
+        return AMOUNT_MISMATCH
+    if stored.get('status', 'Pending') != settled['status']:
+        return STATUS_MISMATCH
+    return MATCHED
+
+
+def _batches(records, size):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _corrections(checked):
+    """Bulk operations for one batch, with the (previous, current) payment
+    documents each one would produce for the rollups"""
+    operations, changes = [], []
+    for outcome, settled, stored in checked:
+        if outcome in (AMOUNT_MISMATCH, STATUS_MISMATCH):
+            update = {'amount': settled['amount'], 'status': settled['status']}
+            # Only while the payment still holds the values compared above
+            operations.append(UpdateOne(
+                {'_id': stored['_id'], 'amount': stored.get('amount'), 'status': stored.get('status')},
+                {'$set': update},
+            ))
+            changes.append((stored, dict(stored, **update)))
+        elif outcome == MISSING and all(settled.get(field) for field in INSERT_FIELDS):
+            operations.append(UpdateOne(
+                {'payment_id': settled['payment_id']},
+                {'$setOnInsert': settled},
+                upsert=True,
+            ))
+            changes.append((None, settled))
+        else:
+            changes.append(None)
+            operations.append(None)
+    return operations, changes
+
+
+def _apply(checked):
+    """Write one batch's corrections; returns which of ``checked`` were corrected"""
+    operations, changes = _corrections(checked)
+    positions = [index for index, operation in enumerate(operations) if operation is not None]
+    if not positions:
+        return [False] * len(checked)
+
+    collection = Payment._get_collection()
+    result = collection.bulk_write([operations[index] for index in positions], ordered=False)
+    corrected = [False] * len(checked)
+    inserted = {positions[index] for index in (result.upserted_ids or {})}
+    updates = [index for index in positions if changes[index][0] is not None]
+
+    applied = set(updates)
+    if result.modified_count != len(updates):
+        # Some payments changed in between; only count the ones that took this update
+        current = {
+            document['_id']: document
+            for document in collection.find({'_id': {'$in': [changes[index][0]['_id'] for index in updates]}})
+        }
+        applied = {
+            index for index in updates
+            if all(current.get(changes[index][0]['_id'], {}).get(field) == changes[index][1][field]
+                   for field in ('amount', 'status'))
+        }
+
+    for index in inserted | applied:
+        corrected[index] = True
+    rollups.record_payment_changes(changes[index] for index in sorted(inserted | applied))
+    return corrected
+
+
+def reconcile(stream, file_format='csv', apply=False, batch_size=5000, on_row=None, progress=None):
+    """Check every settlement record in ``stream`` against the payments.
+
+    ``on_row(report_row)`` receives each row that isn't matched (see
+    ``REPORT_COLUMNS``); ``progress(counts)`` is called after each batch.
+    Returns the outcome counts, plus 'corrected' with ``apply``.
+    """
+    if file_format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    counts = Counter({outcome: 0 for outcome in OUTCOMES})
+    collection = Payment._get_collection()
+    fields = {'payment_id': 1, 'amount': 1, 'status': 1, 'api_key': 1, 'payment_date': 1}
+
+    for batch in _batches(read_rows(stream, file_format), batch_size):
+        parsed = []
+        for line_number, row in batch:
+            try:
+                parsed.append((line_number, parse_row(row)))
+            except InvalidRow as error:
+                counts[INVALID] += 1
+                if on_row:
+                    on_row({'line': line_number, 'outcome': INVALID, 'error': str(error),
+                            'payment_id': (row or {}).get('payment_id')})
+
+        ids = list({settled['payment_id'] for _, settled in parsed})
+        stored = {document['payment_id']: document for document in collection.find({'payment_id': {'$in': ids}}, fields)}
+
+        results, checked = [], {}
+        for line_number, settled in parsed:
+            previous = stored.get(settled['payment_id'])
+            outcome = classify(settled, previous)
+            counts[outcome] += 1
+            if outcome != MATCHED:
+                results.append((line_number, outcome, settled, previous))
+                # A payment listed twice in one batch is corrected once
+                checked.setdefault(settled['payment_id'], (outcome, settled, previous))
+
+        corrected = set()
+        if apply and checked:
+            flags = _apply(list(checked.values()))
+            corrected = {payment_id for payment_id, fixed in zip(checked, flags) if fixed}
+        counts['corrected'] += len(corrected)
+        if on_row:
+            for line_number, outcome, settled, previous in results:
+                on_row({
+                    'line': line_number,
+                    'outcome': outcome,
+                    'payment_id': settled['payment_id'],
+                    'amount': settled['amount'],
+                    'stored_amount': aggregations.to_float(previous.get('amount')) if previous else None,
+                    'status': settled['status'],
+                    'stored_status': previous.get('status') if previous else None,
+                    'corrected': settled['payment_id'] in corrected,
+                })
+        if progress:
+            progress(counts)
+
+    if counts['corrected']:
+        caching.bump('payments')
+    return counts
+
+
+def open_text(path):
+    """Text stream over a settlement file, read lazily line by line"""
+    return open(path, newline='', encoding='utf-8-sig')
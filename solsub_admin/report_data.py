@@ -0,0 +1,179 @@
+"""Data collection for the reports, shared by the views and report jobs"""
+from datetime import datetime, timedelta
+
+from . import aggregations, concurrency, exports, filters, reporting, rows
+from .cluster_registry import cluster_registry
+from .mongo_models import UserProfile, Payment
+
+
+def _payment_report_row(payment, cluster_names):
+    return {
+        'id': payment.get('payment_id'),
+        'match_id': payment.get('match_id'),
+        'cluster_name': cluster_names[payment.get('api_key')],
+        'amount': aggregations.to_float(payment.get('amount')),
+        'date': rows.format_date(payment.get('payment_date')),
+        'user_email': payment.get('user_email') or '-',
+    }
+
+
+def _payment_documents(query):
+    # Raw, projected documents; see rows.py
+    return reporting.objects(Payment).filter(__raw__=query).only(*rows.PAYMENT_FIELDS).as_pymongo()
+
+
+def payment_report_query(api_key, now):
+    """Completed payments dated in the month of ``now``, for one api_key or all"""
+    # Calculate the first and last day of the current month
+    first_day = datetime(now.year, now.month, 1)
+    if now.month == 12:
+        last_day = datetime(now.year + 1, 1, 1) - timedelta(days=1)
+    else:
+        last_day = datetime(now.year, now.month + 1, 1) - timedelta(days=1)
+
+    # Filter query based on whether a cluster was selected
+    query = {
+        'payment_date': {'$gte': first_day, '$lte': last_day},
+        'status': 'Completed',
+    }
+    if api_key:
+        query['api_key'] = api_key
+    return query
+
+
+def payment_report_context(cluster_name, now=None, include_payments=True):
+    """Completed payments of the current month for one cluster (or all).
+
+    With ``include_payments=False`` the payment rows are not loaded; the
+    total and count are aggregated in Mongo and the rows can be streamed
+    afterwards with ``iter_payment_rows(context)``.
+    """
+    now = now or datetime.now()
+
+    # Get api_key for the selected cluster
+    cluster_ref = cluster_registry.by_name(cluster_name) if cluster_name else None
+    query = payment_report_query(cluster_ref.api_key if cluster_ref else None, now)
+
+    context = {
+        'cluster_name': cluster_name,
+        'month_name': now.strftime('%B'),
+        'year': now.year,
+        'query': query,
+        'owner_info': _owner_info(cluster_ref),
+    }
+
+    if include_payments:
+        # Process payments
+        payments = list(_payment_documents(query))
+        payment_cluster_names = cluster_registry.cluster_names(p.get('api_key') for p in payments)
+        context['payments'] = [_payment_report_row(p, payment_cluster_names) for p in payments]
+        context['total_amount'] = sum(p['amount'] for p in context['payments'])
+        context['payment_count'] = len(context['payments'])
+    else:
+        totals = next(reporting.objects(Payment).filter(__raw__=query).aggregate([
+            {'$group': {'_id': None, 'total': {'$sum': '$amount'}, 'count': {'$sum': 1}}},
+        ]), None)
+        context['total_amount'] = aggregations.to_float(totals['total']) if totals else 0
+        context['payment_count'] = totals['count'] if totals else 0
+    return context
+
+
+def iter_payment_rows(context):
+    """Stream the report's payment rows from a cursor, one batch at a time"""
+    queryset = _payment_documents(context['query'])
+    for batch in exports.batched(queryset, exports.batch_size()):
+        cluster_names = cluster_registry.cluster_names(p.get('api_key') for p in batch)
+        for payment in batch:
+            yield _payment_report_row(payment, cluster_names)
+
+
+def _owner_info(cluster_ref):
+    # Get cluster owner information if a cluster is selected
+    owner = None
+    if cluster_ref:
+        owner = reporting.objects(UserProfile).filter(user_id=cluster_ref.owner_id).only(
+            'username', 'email', 'bank_details'
+        ).as_pymongo().first()
+    if not owner:
+        return None
+    bank_details = owner.get('bank_details')
+    owner_info = {
+        'username': owner.get('username'),
+        'email': owner.get('email'),
+        'has_bank_details': bank_details is not None,
+    }
+    if bank_details:
+        owner_info['bank_details'] = {
+            'bank_name': bank_details.get('bank_name'),
+            'account_number': bank_details.get('account_number'),
+            'ifsc_code': bank_details.get('ifsc_code'),
+            'branch_name': bank_details.get('branch_name'),
+        }
+    return owner_info
+
+
+# Days covered by the preset custom report ranges, ending today
+DATE_RANGE_DAYS = {
+    'last30days': 30,
+    'last90days': 90,
+    'lastYear': 365,
+}
+
+
+def report_period(params, now=None):
+    """[start, end) of the custom report parameters, in whole days.
+
+    An incomplete or invalid custom range falls back to the last 30 days,
+    as date_range_label() does.
+    """
+    now = now or datetime.now()
+    tomorrow = datetime(now.year, now.month, now.day) + timedelta(days=1)
+    if params.get('date_range') == 'custom':
+        start = filters.parse_date(params.get('start_date'))
+        end = filters.parse_date(params.get('end_date'))
+        if start and end:
+            return start, end + timedelta(days=1)
+    days = DATE_RANGE_DAYS.get(params.get('date_range'), 30)
+    return tomorrow - timedelta(days=days), tomorrow
+
+
+def date_range_label(params):
+    """Human readable period for the custom report parameters"""
+    date_range = params.get('date_range', 'last30days')
+    date_range_text = "Last 30 Days"
+    if date_range == 'last90days':
+        date_range_text = "Last 90 Days"
+    elif date_range == 'lastYear':
+        date_range_text = "Last Year"
+    elif date_range == 'custom':
+        start_date = params.get('start_date', '')
+        end_date = params.get('end_date', '')
+        if filters.parse_date(start_date) and filters.parse_date(end_date):
+            date_range_text = f"From {start_date} to {end_date}"
+    return date_range_text
+
+
+def custom_report_data(report_type, params=None, now=None):
+    """Summary figures, monthly revenue and cluster performance for the
+    period selected by ``params`` (see report_period)"""
+    start, end = report_period(params or {}, now)
+    kpis = concurrency.fan_out(
+        {
+            'payments': lambda: aggregations.payment_stats(start, end),
+            'match_ids': lambda: aggregations.match_id_period_stats(start, end),
+        },
+        defaults=aggregations.EMPTY_STATS,
+    )
+    payment_kpis, match_id_kpis = kpis['payments'], kpis['match_ids']
+
+    return {
+        'report_type': report_type,
+        'start': start,
+        'end': end,
+        'total_revenue': payment_kpis['total_revenue'],
+        'active_match_ids': match_id_kpis['active_match_ids'],
+        'trial_conversion_rate': match_id_kpis['trial_conversion_rate'],
+        'monthly_revenue': payment_kpis['monthly_revenue'],
+        'cluster_performance': payment_kpis['cluster_performance'],
+        'unavailable': kpis.failed,
+    }
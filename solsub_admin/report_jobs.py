@@ -0,0 +1,286 @@
+"""Background PDF report jobs.
+
+Rendering a large report can take longer than a proxy will wait, so the
+views hand it to a pool of worker processes and return a job id straight
+away. Job state lives in JSON files under REPORT_JOBS_DIR next to the
+finished PDFs, which lets every web worker (and every pool process) see
+the same jobs without an extra service.
+
+A job id is derived from the report kind and its parameters, so identical
+requests made while a report is rendering attach to that job instead of
+starting another one, and a finished report is served again for
+REPORT_JOB_REUSE_SECONDS.
+
+The process rendering a job holds its lock file, which carries an owner
+token and is touched on every progress update. A lock left untouched for
+REPORT_JOB_TIMEOUT belongs to a dead or hung worker: polling the job then
+reports it failed, and the next identical request restarts it.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _build_custom(params, output, progress):
+    from . import pdf_reports, report_data
+
+    progress(10, 'Collecting figures')
+    data = report_data.custom_report_data(params.get('report_type', 'summary'), params)
+    progress(40, 'Rendering PDF')
+    pdf_reports.render_custom_report(data, report_data.date_range_label(params), output, progress)
+    return pdf_reports.custom_report_filename(data['report_type'])
+
+
+def _build_payment(params, output, progress):
+    from . import pdf_reports, report_data
+
+    progress(10, 'Collecting payments')
+    context = report_data.payment_report_context(params.get('cluster_name', ''), include_payments=False)
+    progress(40, 'Rendering PDF')
+    pdf_reports.render_payment_report(context, report_data.iter_payment_rows(context), output, progress)
+    return pdf_reports.payment_report_filename(context)
+
+
+# Report kinds: builder and the request parameters that identify a report
+JOB_KINDS = {
+    'custom': (_build_custom, ('report_type', 'date_range', 'start_date', 'end_date')),
+    'payment': (_build_payment, ('cluster_name',)),
+}
+
+
+def jobs_dir():
+    path = getattr(settings, 'REPORT_JOBS_DIR', None) or os.path.join(tempfile.gettempdir(), 'solsub-report-jobs')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _path(job_id, suffix):
+    return os.path.join(jobs_dir(), f'{job_id}{suffix}')
+
+
+def job_params(kind, params):
+    """The whitelisted, non-empty parameters of a report request"""
+    names = JOB_KINDS[kind][1]
+    return {name: params.get(name, '') for name in names if params.get(name, '')}
+
+
+def job_id(kind, params):
+    payload = json.dumps([kind, job_params(kind, params)], sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def read_state(job_id):
+    if not re.fullmatch(r'[0-9a-f]{40}', job_id):
+        return None
+    try:
+        with open(_path(job_id, '.json')) as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(job_id, **changes):
+    state = read_state(job_id) or {'job_id': job_id}
+    state.update(changes, updated_at=time.time())
+    # Write then rename so readers never see a half-written file
+    fd, tmp = tempfile.mkstemp(dir=jobs_dir(), suffix='.tmp')
+    with os.fdopen(fd, 'w') as handle:
+        json.dump(state, handle)
+    os.replace(tmp, _path(job_id, '.json'))
+    return state
+
+
+def pdf_path(job_id):
+    return _path(job_id, '.pdf')
+
+
+def _age(path):
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+def _claim(job_id):
+    """Take the job's lock file and return its owner token; None when
+    another request holds it"""
+    lock = _path(job_id, '.lock')
+    age = _age(lock)
+    if age is not None and age > getattr(settings, 'REPORT_JOB_TIMEOUT', 600):
+        # The worker that held it died or hung; let this request take over
+        logger.warning('Report job %s lock is stale, restarting it', job_id)
+        try:
+            os.remove(lock)
+        except OSError:
+            pass
+    token = uuid.uuid4().hex
+    try:
+        fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return None
+    with os.fdopen(fd, 'w') as handle:
+        handle.write(token)
+    return token
+
+
+def _lock_owner(job_id):
+    try:
+        with open(_path(job_id, '.lock')) as handle:
+            return handle.read()
+    except OSError:
+        return None
+
+
+def _touch(job_id, token):
+    """Keep a live job's lock fresh so it isn't taken for a dead one"""
+    if _lock_owner(job_id) == token:
+        try:
+            os.utime(_path(job_id, '.lock'))
+        except OSError:
+            pass
+
+
+def _release(job_id, token):
+    # Only the owner removes the lock; a job restarted after a stale lock
+    # holds a new one
+    if _lock_owner(job_id) != token:
+        return
+    try:
+        os.remove(_path(job_id, '.lock'))
+    except OSError:
+        pass
+
+
+def job_state(job_id):
+    """The job's state, marking it failed when it is still queued or
+    running but its lock is gone or stale (the worker died)"""
+    state = read_state(job_id)
+    if state is None or state['status'] not in (QUEUED, RUNNING):
+        return state
+    age = _age(_path(job_id, '.lock'))
+    if age is None or age > getattr(settings, 'REPORT_JOB_TIMEOUT', 600):
+        logger.warning('Report job %s stopped without finishing', job_id)
+        return _write_state(job_id, status=FAILED, message='Report generation stopped, please try again',
+                            error='The report worker stopped responding')
+    return state
+
+
+def cleanup():
+    """Remove job files older than REPORT_JOB_RETENTION"""
+    retention = getattr(settings, 'REPORT_JOB_RETENTION', 24 * 3600)
+    directory = jobs_dir()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        age = _age(path)
+        if age is not None and age > retention:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                workers = getattr(settings, 'REPORT_JOB_WORKERS', 2)
+                if workers:
+                    # spawn: a fresh interpreter, never a fork of a process
+                    # holding open Mongo sockets and locks
+                    _executor = ProcessPoolExecutor(
+                        max_workers=workers,
+                        mp_context=get_context('spawn'),
+                        initializer=_init_worker,
+                    )
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='solsub-report')
+    return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def submit(kind, params):
+    """Start (or attach to) the job for this report and return its state"""
+    if kind not in JOB_KINDS:
+        raise ValueError(f'Unknown report kind: {kind}')
+    params = job_params(kind, params)
+    jid = job_id(kind, params)
+    cleanup()
+
+    state = read_state(jid)
+    if state and state['status'] == DONE and os.path.exists(pdf_path(jid)):
+        if _age(pdf_path(jid)) < getattr(settings, 'REPORT_JOB_REUSE_SECONDS', 60):
+            return state
+
+    token = _claim(jid)
+    if token is None:
+        # Already queued or rendering in some process; a finished state
+        # left by an earlier run is about to be replaced
+        if state and state['status'] in (QUEUED, RUNNING):
+            return state
+        return {'job_id': jid, 'status': QUEUED, 'progress': 0, 'message': 'Queued'}
+
+    state = _write_state(jid, kind=kind, params=params, status=QUEUED, progress=0,
+                         message='Queued', filename=None, error=None)
+    try:
+        try:
+            get_executor().submit(run_job, jid, kind, params, token)
+        except BrokenProcessPool:
+            # A worker was killed (e.g. OOM); start a fresh pool and retry once
+            _reset_executor()
+            get_executor().submit(run_job, jid, kind, params, token)
+    except Exception as exc:
+        _release(jid, token)
+        return _write_state(jid, status=FAILED, message='Could not start the report', error=str(exc))
+    return state
+
+
+def run_job(jid, kind, params, token):
+    """Render the report into the job's PDF file (runs in a pool worker)"""
+    def progress(percent, message):
+        _touch(jid, token)
+        _write_state(jid, progress=percent, message=message)
+
+    builder = JOB_KINDS[kind][0]
+    _write_state(jid, status=RUNNING, progress=0, message='Starting')
+    fd, tmp = tempfile.mkstemp(dir=jobs_dir(), suffix='.pdf.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            filename = builder(params, output, progress)
+        os.replace(tmp, pdf_path(jid))
+        _write_state(jid, status=DONE, progress=100, message='Ready', filename=filename)
+    except Exception as exc:
+        logger.exception('Report job %s failed', jid)
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        _write_state(jid, status=FAILED, message='Report generation failed', error=str(exc))
+    finally:
+        _release(jid, token)
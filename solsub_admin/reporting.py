@@ -0,0 +1,27 @@
+"""Read routing for reports and aggregates.
+
+Report, analytics and KPI queries read through the connection alias named
+by ``MONGO_REPORTING_ALIAS`` ('reporting' in settings.py, with its own URL,
+pool and read preference) so they can be served by a secondary without
+competing with the interactive pages for the default pool. Writes and the
+operational views keep using the default alias. Any registered alias can
+be plugged in, e.g. a second mongomock client when checking the routing.
+
+The querysets are built straight on the alias's collection rather than
+with ``QuerySet.using``: that goes through ``switch_db``, which swaps the
+model's alias on the class (racing with the other request threads) and
+drops its cached collection, so every call re-ran ``ensure_indexes``.
+"""
+from django.conf import settings
+from mongoengine.connection import DEFAULT_CONNECTION_NAME, get_db
+from mongoengine.queryset import QuerySet
+
+
+def alias():
+    return getattr(settings, 'MONGO_REPORTING_ALIAS', DEFAULT_CONNECTION_NAME)
+
+
+def objects(model):
+    """``model.objects`` evaluated against the reporting connection"""
+    queryset_class = model._meta.get('queryset_class', QuerySet)
+    return queryset_class(model, get_db(alias())[model._get_collection_name()])
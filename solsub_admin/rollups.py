@@ -0,0 +1,127 @@
+"""Materialized daily revenue rollups.
+
+``RevenueRollup`` holds one document per (day, api_key, status) with the
+summed amount and payment count. Payments saved through the model update it
+incrementally; the ``backfill_revenue_rollups`` command rebuilds it from raw
+payments for historical data or writes made outside this app.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+
+from bson.decimal128 import Decimal128
+
+from .mongo_models import Payment, RevenueRollup
+
+
+def day_of(value):
+    return datetime(value.year, value.month, value.day)
+
+
+def _amount(value):
+    if isinstance(value, Decimal128):
+        value = value.to_decimal()
+    return float(value or 0)
+
+
+def _bucket(payment):
+    """(day, api_key, status) a raw payment document rolls up into"""
+    if not payment or not payment.get('payment_date') or not payment.get('api_key'):
+        return None
+    return day_of(payment['payment_date']), payment['api_key'], payment.get('status', 'Pending')
+
+
+def _increment(bucket, amount, count):
+    day, api_key, status = bucket
+    RevenueRollup.objects(day=day, api_key=api_key, status=status).update_one(
+        inc__amount=amount,
+        inc__count=count,
+        upsert=True,
+    )
+
+
+def record_payment_change(previous, current):
+    """Move a payment's amount between rollup buckets after a write.
+
+    ``previous`` and ``current`` are raw payment documents (or None when the
+    payment was created or deleted).
+    """
+    old_bucket, new_bucket = _bucket(previous), _bucket(current)
+    old_amount = _amount(previous.get('amount')) if previous else 0
+    new_amount = _amount(current.get('amount')) if current else 0
+    if old_bucket == new_bucket and old_amount == new_amount:
+        return
+    if old_bucket:
+        _increment(old_bucket, -old_amount, -1)
+    if new_bucket:
+        _increment(new_bucket, new_amount, 1)
+
+
+def record_payment_changes(changes):
+    """``record_payment_change`` for many (previous, current) pairs at once,
+    with one update per rollup bucket touched (for bulk writes)"""
+    amounts, counts = Counter(), Counter()
+    for previous, current in changes:
+        for payment, sign in ((previous, -1), (current, 1)):
+            bucket = _bucket(payment)
+            if bucket:
+                amounts[bucket] += sign * _amount(payment.get('amount'))
+                counts[bucket] += sign
+    for bucket in amounts:
+        if amounts[bucket] or counts[bucket]:
+            _increment(bucket, amounts[bucket], counts[bucket])
+
+
+def rebuild(start, end, batch_days=31, progress=None):
+    """Recompute the rollups for payments dated in [start, end).
+
+    Works through the range ``batch_days`` at a time: each window is grouped
+    server-side and its rollup documents replaced, so memory use is bounded
+    by the number of (day, api_key, status) groups in one window.
+    """
+    written = 0
+    window_start = day_of(start)
+    while window_start < end:
+        window_end = min(window_start + timedelta(days=batch_days), end)
+        pipeline = [
+            {'$match': {'payment_date': {'$gte': window_start, '$lt': window_end}}},
+            {'$group': {
+                '_id': {
+                    'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$payment_date'}},
+                    'api_key': '$api_key',
+                    'status': {'$ifNull': ['$status', 'Pending']},
+                },
+                'amount': {'$sum': '$amount'},
+                'count': {'$sum': 1},
+            }},
+        ]
+        documents = [
+            RevenueRollup(
+                day=datetime.strptime(row['_id']['day'], '%Y-%m-%d'),
+                api_key=row['_id']['api_key'],
+                status=row['_id']['status'],
+                amount=_amount(row['amount']),
+                count=row['count'],
+            )
+            for row in Payment.objects.aggregate(pipeline)
+            # A missing api_key is left out of the group key altogether
+            if row['_id'].get('api_key')
+        ]
+
+        RevenueRollup.objects(day__gte=window_start, day__lt=window_end).delete()
+        if documents:
+            RevenueRollup.objects.insert(documents, load_bulk=False)
+        written += len(documents)
+
+        if progress:
+            progress(window_start, window_end, len(documents))
+        window_start = window_end
+    return written
+
+
+def payment_date_bounds():
+    """(earliest, latest) payment_date, or None when there are no payments"""
+    first = Payment.objects.order_by('payment_date').only('payment_date').first()
+    last = Payment.objects.order_by('-payment_date').only('payment_date').first()
+    if not first:
+        return None
+    return first.payment_date, last.payment_date
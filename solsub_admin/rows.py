@@ -0,0 +1,81 @@
+"""Row formatting shared by the list views, their JSON variants and exports.
+
+Rows are built from raw documents (``queryset.only(*FIELDS).as_pymongo()``)
+rather than mongoengine objects: the views only show a handful of fields,
+and skipping document construction (Decimal and embedded-document
+conversion included) is most of the per-row cost.
+"""
+from datetime import datetime
+
+from . import subscriptions
+from .aggregations import to_float
+
+# Projections for the read-only paths; the keyset sort fields must be included
+USER_FIELDS = ('user_id', 'username', 'email', 'created_at', 'clusters.cluster_name', 'bank_details.bank_name')
+PAYMENT_FIELDS = ('payment_id', 'match_id', 'api_key', 'amount', 'status', 'payment_date', 'user_email')
+MATCH_ID_FIELDS = ('match_id', 'cluster_name', 'created_on', 'last_paid_on', 'valid_till', 'is_trial', 'status')
+
+
+# Fields of the cluster list, in the order of the columnar API payload
+CLUSTER_FIELDS = ('name', 'price', 'timeline_days', 'trial_period', 'match_id_type', 'active_subscriptions', 'api_key')
+
+
+def format_date(value):
+    return value.strftime('%Y-%m-%d') if value else '-'
+
+
+def match_id_status(match_id, now=None):
+    status = match_id.get('status')
+    if status and subscriptions.use_subscription_states():
+        return subscriptions.LABELS[status]
+
+    now = now or datetime.now()
+    valid_till = match_id.get('valid_till')
+    is_active = valid_till and now <= valid_till
+
+    if match_id.get('is_trial') and is_active:
+        return "Trial Active"
+    elif is_active:
+        return "Paid Active"
+    return "Inactive"
+
+
+def user_row(user):
+    return {
+        'id': user.get('user_id'),
+        'username': user.get('username'),
+        'email': user.get('email'),
+        'created_at': format_date(user.get('created_at')),
+        'cluster_count': len(user.get('clusters') or []),
+        'has_bank_details': user.get('bank_details') is not None,
+    }
+
+
+def payment_row(payment, cluster_names):
+    """``cluster_names`` maps api_key -> name, see cluster_registry.cluster_names"""
+    return {
+        'id': payment.get('payment_id'),
+        'match_id': payment.get('match_id'),
+        'cluster_name': cluster_names.get(payment.get('api_key')),
+        'amount': to_float(payment.get('amount')),
+        'status': payment.get('status'),
+        'date': format_date(payment.get('payment_date')),
+        'user_email': payment.get('user_email') or '-',
+    }
+
+
+def match_id_row(match_id, now=None):
+    return {
+        'id': match_id.get('match_id'),
+        'cluster_name': match_id.get('cluster_name'),
+        'created_on': format_date(match_id.get('created_on')),
+        'last_paid_on': format_date(match_id.get('last_paid_on')),
+        'valid_till': format_date(match_id.get('valid_till')),
+        'is_trial': bool(match_id.get('is_trial')),
+        'status': match_id_status(match_id, now),
+    }
+
+
+def columns(items, fields):
+    """Column-oriented form of a list of row dicts: one value list per field"""
+    return {field: [item.get(field) for item in items] for field in fields}
@@ -0,0 +1,71 @@
+"""Search box across users, payments and match IDs.
+
+Every searched field has its own index, and a term is matched exactly
+first and then as an anchored prefix (see ``filters.search_query``), so
+each lookup is an index range scan stopped after ``limit`` documents. The
+three collections are queried in parallel and the results grouped by type,
+exact matches first.
+"""
+from datetime import datetime
+
+from . import filters, rows
+from .cluster_registry import cluster_registry
+from .concurrency import fan_out
+from .mongo_models import MatchId, Payment, UserProfile
+
+# Shorter terms would match too much of each index to be useful
+MIN_TERM_LENGTH = 2
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 50
+
+
+def _find(model, fields, projection, term, limit):
+    """Up to ``limit`` raw documents: exact matches, then prefix matches"""
+    found = list(
+        model.objects(__raw__=filters.search_query(fields, term, exact=True))
+        .only(*projection).as_pymongo().limit(limit)
+    )
+    if len(found) < limit:
+        prefix = filters.search_query(fields, term)
+        seen = [document['_id'] for document in found]
+        if seen:
+            prefix = {'$and': [prefix, {'_id': {'$nin': seen}}]}
+        found.extend(model.objects(__raw__=prefix).only(*projection).as_pymongo().limit(limit - len(found)))
+    return found
+
+
+def users(term, limit):
+    return [
+        rows.user_row(user)
+        for user in _find(UserProfile, filters.USER_SEARCH_FIELDS, rows.USER_FIELDS, term, limit)
+    ]
+
+
+def payments(term, limit):
+    found = _find(Payment, filters.PAYMENT_SEARCH_FIELDS, rows.PAYMENT_FIELDS, term, limit)
+    cluster_names = cluster_registry.cluster_names(payment.get('api_key') for payment in found)
+    return [rows.payment_row(payment, cluster_names) for payment in found]
+
+
+def match_ids(term, limit, now=None):
+    now = now or datetime.now()
+    return [
+        rows.match_id_row(match_id, now)
+        for match_id in _find(MatchId, filters.MATCH_ID_SEARCH_FIELDS, rows.MATCH_ID_FIELDS, term, limit)
+    ]
+
+
+def search(term, limit=DEFAULT_LIMIT):
+    """Matches grouped by type, plus the types whose query failed under
+    'unavailable'; every group is empty for terms that are too short"""
+    term = (term or '').strip()
+    limit = max(1, min(limit, MAX_LIMIT))
+    if len(term) < MIN_TERM_LENGTH:
+        return {'users': [], 'payments': [], 'match_ids': [], 'unavailable': []}
+
+    results = fan_out({
+        'users': lambda: users(term, limit),
+        'payments': lambda: payments(term, limit),
+        'match_ids': lambda: match_ids(term, limit),
+    }, defaults={'users': [], 'payments': [], 'match_ids': []})
+    return dict(results, unavailable=results.failed)
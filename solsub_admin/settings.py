@@ -37,6 +37,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'solsub_admin.query_monitor.QueryMonitorMiddleware',
 ]
 
 ROOT_URLCONF = 'solsub_admin.urls'
@@ -52,6 +53,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'solsub_admin.query_monitor.context_processor',
             ],
         },
     },
@@ -67,10 +69,125 @@ DATABASES = {
     }
 }
 
-# MongoDB Connection
-from mongoengine import connect
+# MongoDB Connection. Only registered here: the client (and its pool) is
+# created on the first query, so management commands that never touch
+# Mongo and forked workers don't pay for connection setup at import time.
+from mongoengine import register_connection
+from solsub_admin.query_monitor import QueryListener
 MONGODB_DATABASE_URL = env('MONGODB_DATABASE_URL')
-connect(host=MONGODB_DATABASE_URL)
+MONGO_MAX_POOL_SIZE = env.int('MONGO_MAX_POOL_SIZE', default=100)
+MONGO_MIN_POOL_SIZE = env.int('MONGO_MIN_POOL_SIZE', default=0)
+register_connection(
+    'default',
+    host=MONGODB_DATABASE_URL,
+    event_listeners=[QueryListener()],
+    maxPoolSize=MONGO_MAX_POOL_SIZE,
+    minPoolSize=MONGO_MIN_POOL_SIZE,
+    connect=False,
+)
+
+# Connection used by reports, analytics and KPI aggregates (reporting.py),
+# so they can read from a secondary with their own pool. Defaults to the
+# primary URL; the read preference is a pymongo mode name and staleness is
+# in seconds (-1 for no limit, otherwise at least 90).
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+MONGO_REPORTING_ALIAS = 'reporting'
+MONGODB_REPORTING_URL = env('MONGODB_REPORTING_URL', default=MONGODB_DATABASE_URL)
+MONGO_REPORTING_READ_PREFERENCE = env('MONGO_REPORTING_READ_PREFERENCE', default='secondaryPreferred')
+MONGO_REPORTING_MAX_STALENESS = env.int('MONGO_REPORTING_MAX_STALENESS', default=-1)
+MONGO_REPORTING_MAX_POOL_SIZE = env.int('MONGO_REPORTING_MAX_POOL_SIZE', default=20)
+register_connection(
+    MONGO_REPORTING_ALIAS,
+    host=MONGODB_REPORTING_URL,
+    event_listeners=[QueryListener()],
+    maxPoolSize=MONGO_REPORTING_MAX_POOL_SIZE,
+    # Passed as an object: mongoengine always sends its own read_preference
+    # (Primary by default), which overrides readPreference= keyword options
+    read_preference=make_read_preference(
+        read_pref_mode_from_name(MONGO_REPORTING_READ_PREFERENCE), None, MONGO_REPORTING_MAX_STALENESS,
+    ),
+    connect=False,
+)
+
+# Open the Mongo pool and fill the cluster registry and the dashboard caches
+# when a WSGI/ASGI worker starts, before it takes traffic (see warmup.py)
+WARM_UP_WORKERS = env.bool('WARM_UP_WORKERS', default=False)
+
+# Per-request Mongo command counts (X-Mongo-Stats header, staff footer) and
+# the number of repeats of one query shape that is logged as a likely N+1
+MONGO_QUERY_MONITOR = env.bool('MONGO_QUERY_MONITOR', default=True)
+MONGO_N_PLUS_ONE_THRESHOLD = env.int('MONGO_N_PLUS_ONE_THRESHOLD', default=10)
+
+# Seconds the in-process api_key -> cluster registry may serve before reloading
+CLUSTER_REGISTRY_TTL = env.int('CLUSTER_REGISTRY_TTL', default=300)
+
+# Page sizes for the keyset-paginated list views (?page_size=)
+LIST_PAGE_SIZE = env.int('LIST_PAGE_SIZE', default=50)
+LIST_MAX_PAGE_SIZE = env.int('LIST_MAX_PAGE_SIZE', default=500)
+
+# Documents fetched per cursor batch by the streaming CSV/NDJSON exports
+EXPORT_BATCH_SIZE = env.int('EXPORT_BATCH_SIZE', default=1000)
+
+# Read report revenue from the revenue_rollups collection instead of raw
+# payments. Off until enabled: run `manage.py backfill_revenue_rollups`
+# first, or revenue reads as zero.
+USE_REVENUE_ROLLUPS = env.bool('USE_REVENUE_ROLLUPS', default=False)
+
+# Read active match ID counts and statuses from the stored subscription
+# states instead of comparing valid_till with the clock. Populate them with
+# `manage.py track_subscriptions --rebuild` before enabling this (existing
+# match IDs have no status until then) and keep
+# `manage.py track_subscriptions --watch` running to process expiries.
+USE_SUBSCRIPTION_STATES = env.bool('USE_SUBSCRIPTION_STATES', default=False)
+
+# Cache used for aggregate results. Local memory by default; point it at a
+# shared backend (e.g. django.core.cache.backends.filebased.FileBasedCache
+# with a directory LOCATION) so every worker sees the same invalidations.
+CACHES = {
+    'default': {
+        'BACKEND': env('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': env('CACHE_LOCATION', default='solsub-admin'),
+    }
+}
+
+# Seconds each aggregate endpoint may be served from cache (0 disables it).
+# Also the longest an unchanged ETag is honoured for conditional GETs on
+# the list pages and JSON APIs ('default' for endpoints not listed).
+AGGREGATE_CACHE_TTLS = {
+    'default': 60,
+    'dashboard': env.int('DASHBOARD_CACHE_TTL', default=60),
+    'reports': env.int('REPORTS_CACHE_TTL', default=300),
+    'analytics': env.int('ANALYTICS_CACHE_TTL', default=300),
+    'timeseries': env.int('TIMESERIES_CACHE_TTL', default=300),
+    'clusters': env.int('CLUSTERS_CACHE_TTL', default=120),
+}
+
+# Seconds the browser may reuse a dashboard tab fragment (?fragment=1)
+FRAGMENT_MAX_AGE = env.int('FRAGMENT_MAX_AGE', default=30)
+
+# Largest selection a bulk action on the match_ids page may touch within the
+# request; larger ones go through `manage.py bulk_match_ids`
+BULK_ACTION_MAX_MATCH_IDS = env.int('BULK_ACTION_MAX_MATCH_IDS', default=10000)
+
+# Thread pool used to run a view's independent Mongo queries in parallel,
+# and the seconds each query may take before its figure is left out
+QUERY_FANOUT_WORKERS = env.int('QUERY_FANOUT_WORKERS', default=8)
+QUERY_FANOUT_TIMEOUT = env.float('QUERY_FANOUT_TIMEOUT', default=10.0)
+
+# Background PDF report jobs: worker processes (0 renders in a thread of the
+# web process), where job state and finished PDFs are kept (default: a
+# directory under the system temp dir, shared by all workers), how long a
+# finished report is reused for identical requests, when a running job is
+# considered dead, and when old job files are removed. All times in seconds.
+REPORT_JOBS_DIR = env('REPORT_JOBS_DIR', default='')
+REPORT_JOB_WORKERS = env.int('REPORT_JOB_WORKERS', default=2)
+REPORT_JOB_REUSE_SECONDS = env.int('REPORT_JOB_REUSE_SECONDS', default=60)
+REPORT_JOB_TIMEOUT = env.int('REPORT_JOB_TIMEOUT', default=600)
+REPORT_JOB_RETENTION = env.int('REPORT_JOB_RETENTION', default=24 * 3600)
+
+# Rows per table chunk in the payment report PDF. Long tables are laid out
+# chunk by chunk (each with its own header) as the rows stream in.
+PDF_TABLE_CHUNK_ROWS = env.int('PDF_TABLE_CHUNK_ROWS', default=40)
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -0,0 +1,221 @@
+"""Stored subscription states for match IDs and their active counts.
+
+``MatchId.status`` is set when a match ID is saved and moved to 'inactive'
+by ``expire_due()`` once its ``valid_till`` has passed, so "is it active"
+is an indexed field instead of a comparison with the clock on every
+request. ``SubscriptionCounter`` keeps the number of trial / paid active
+match IDs per cluster (plus a totals document), adjusted on every status
+change, and every change is recorded as a ``SubscriptionEvent``.
+
+Expiries are processed by ``manage.py track_subscriptions --watch``, which
+works through the due match IDs in ``valid_till`` order and sleeps until
+the next one; between runs a state is at most one interval stale.
+``rebuild()`` (``track_subscriptions --rebuild``) re-derives every status
+and counter, for the first deployment and for writes made outside this app.
+"""
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+
+from . import caching, reporting
+from .mongo_models import MatchId, SubscriptionCounter, SubscriptionEvent, SUBSCRIPTION_STATUSES
+
+TRIAL_ACTIVE, PAID_ACTIVE, INACTIVE = SUBSCRIPTION_STATUSES
+ACTIVE_STATUSES = (TRIAL_ACTIVE, PAID_ACTIVE)
+
+# Labels used by the match_ids view and its status filter
+LABELS = {
+    TRIAL_ACTIVE: 'Trial Active',
+    PAID_ACTIVE: 'Paid Active',
+    INACTIVE: 'Inactive',
+}
+STATUS_FOR_LABEL = {label: status for status, label in LABELS.items()}
+
+
+def use_subscription_states():
+    return getattr(settings, 'USE_SUBSCRIPTION_STATES', False)
+
+
+def status_of(is_trial, valid_till, now=None):
+    now = now or datetime.now()
+    if not valid_till or valid_till < now:
+        return INACTIVE
+    return TRIAL_ACTIVE if is_trial else PAID_ACTIVE
+
+
+def _adjust(cluster_name, status, delta):
+    """Add ``delta`` to a cluster's count for ``status`` and to the totals"""
+    if status not in ACTIVE_STATUSES or not delta:
+        return
+    collection = SubscriptionCounter._get_collection()
+    for name in (cluster_name, None):
+        collection.update_one(
+            {'cluster_name': name},
+            {'$inc': {status: delta, 'active': delta}},
+            upsert=True,
+        )
+
+
+def _event(document, from_status, to_status, at, reason):
+    return {
+        'match_id': document.get('match_id'),
+        'cluster_name': document.get('cluster_name'),
+        'from_status': from_status,
+        'to_status': to_status,
+        'at': at,
+        'reason': reason,
+    }
+
+
+def record_match_id_change(previous, current, now=None):
+    """Move a match ID between counters after a write and record the change.
+
+    ``previous`` and ``current`` are raw match ID documents (or None when the
+    match ID was created or deleted).
+    """
+    old_bucket = (previous.get('cluster_name'), previous.get('status')) if previous else (None, None)
+    new_bucket = (current.get('cluster_name'), current.get('status')) if current else (None, None)
+    if old_bucket == new_bucket:
+        return
+    _adjust(*old_bucket, -1)
+    _adjust(*new_bucket, 1)
+
+    if old_bucket[1] != new_bucket[1]:
+        document = current or previous
+        reason = 'saved' if current else 'deleted'
+        SubscriptionEvent._get_collection().insert_one(
+            _event(document, old_bucket[1], new_bucket[1], now or datetime.now(), reason)
+        )
+
+
+def _due_query(now):
+    return {'status': {'$in': list(ACTIVE_STATUSES)}, 'valid_till': {'$lt': now}}
+
+
+def expire_due(now=None, batch_size=500, progress=None):
+    """Mark active match IDs whose valid_till has passed as inactive.
+
+    Due match IDs are read in valid_till order, ``batch_size`` at a time,
+    and updated with one conditional update per (cluster, status) group.
+    Counters move by the number of documents actually modified, so a
+    renewal saved in between is neither expired nor counted twice. Returns
+    the number of match IDs expired.
+    """
+    now = now or datetime.now()
+    collection = MatchId._get_collection()
+    fields = {'match_id': 1, 'cluster_name': 1, 'status': 1, 'valid_till': 1}
+    expired = 0
+    while True:
+        batch = list(collection.find(_due_query(now), fields).sort('valid_till', 1).limit(batch_size))
+        if not batch:
+            break
+
+        groups = {}
+        for document in batch:
+            groups.setdefault((document.get('cluster_name'), document['status']), []).append(document)
+
+        events = []
+        for (cluster_name, status), documents in groups.items():
+            ids = [document['_id'] for document in documents]
+            modified = collection.update_many(
+                {'_id': {'$in': ids}, 'status': status, 'valid_till': {'$lt': now}},
+                {'$set': {'status': INACTIVE}},
+            ).modified_count
+            if modified != len(documents):
+                # Some were saved concurrently; only record the ones expired here
+                still_due = {document['_id'] for document in collection.find(
+                    {'_id': {'$in': ids}, 'status': INACTIVE, 'valid_till': {'$lt': now}}, {'_id': 1}
+                )}
+                documents = [document for document in documents if document['_id'] in still_due]
+            _adjust(cluster_name, status, -modified)
+            events.extend(
+                _event(document, status, INACTIVE, document['valid_till'], 'expired')
+                for document in documents
+            )
+            expired += modified
+
+        if events:
+            SubscriptionEvent._get_collection().insert_many(events)
+        if progress:
+            progress(expired)
+
+    if expired:
+        caching.bump('match_ids')
+    return expired
+
+
+def next_expiry():
+    """valid_till of the next active match ID to expire, or None"""
+    document = MatchId._get_collection().find_one(
+        {'status': {'$in': list(ACTIVE_STATUSES)}},
+        {'valid_till': 1},
+        sort=[('valid_till', 1)],
+    )
+    return document['valid_till'] if document else None
+
+
+def rebuild(now=None):
+    """Recompute every match ID's status and the counters from scratch.
+
+    Statuses are set with one server-side update per status, touching only
+    match IDs whose stored status differs; no events are recorded. Returns
+    the number of match IDs whose status changed.
+    """
+    now = now or datetime.now()
+    collection = MatchId._get_collection()
+    active = {'valid_till': {'$gte': now}}
+    queries = {
+        TRIAL_ACTIVE: dict(active, is_trial=True),
+        PAID_ACTIVE: dict(active, is_trial={'$ne': True}),
+        INACTIVE: {'$or': [{'valid_till': None}, {'valid_till': {'$lt': now}}]},
+    }
+    changed = 0
+    for status, query in queries.items():
+        query = dict(query, status={'$ne': status})
+        changed += collection.update_many(query, {'$set': {'status': status}}).modified_count
+
+    pipeline = [
+        {'$match': {'status': {'$in': list(ACTIVE_STATUSES)}}},
+        {'$group': {'_id': {'cluster_name': '$cluster_name', 'status': '$status'}, 'count': {'$sum': 1}}},
+    ]
+    counters = {None: Counter()}
+    for row in collection.aggregate(pipeline):
+        cluster_name, status = row['_id'].get('cluster_name'), row['_id']['status']
+        counters.setdefault(cluster_name, Counter())[status] += row['count']
+        counters[None][status] += row['count']
+
+    documents = [
+        {
+            'cluster_name': cluster_name,
+            TRIAL_ACTIVE: counts[TRIAL_ACTIVE],
+            PAID_ACTIVE: counts[PAID_ACTIVE],
+            'active': counts[TRIAL_ACTIVE] + counts[PAID_ACTIVE],
+        }
+        for cluster_name, counts in counters.items()
+    ]
+    counter_collection = SubscriptionCounter._get_collection()
+    counter_collection.delete_many({})
+    counter_collection.insert_many(documents)
+
+    caching.bump('match_ids')
+    return changed
+
+
+def active_counts():
+    """Active match IDs in total and the number of clusters that have any"""
+    totals = reporting.objects(SubscriptionCounter).filter(cluster_name=None).as_pymongo().first() or {}
+    return {
+        'active_match_ids': totals.get('active', 0),
+        'active_clusters': reporting.objects(SubscriptionCounter).filter(cluster_name__ne=None, active__gt=0).count(),
+    }
+
+
+def active_by_cluster():
+    """Number of active match IDs per cluster name"""
+    return {
+        row['cluster_name']: row['active']
+        for row in reporting.objects(SubscriptionCounter).filter(cluster_name__ne=None, active__gt=0).only(
+            'cluster_name', 'active'
+        ).as_pymongo()
+    }
@@ -0,0 +1,180 @@
+"""Synthetic users, clusters, match IDs and payments for benchmarks.
+
+Distributions are skewed the way production data is: a few owners hold
+most clusters, a few clusters hold most match IDs, payments grow towards
+the present and most of them complete. Documents are built through the
+mongoengine models (so field encoding matches real writes) and inserted in
+bulk. Bulk inserts skip the model save hooks, so the matching clusters
+collection entries are inserted alongside and the revenue rollups and
+subscription states are rebuilt at the end. Seed into an empty database
+(see ``flush()``).
+"""
+import random
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from mongoengine import connect, disconnect
+from mongoengine.connection import DEFAULT_CONNECTION_NAME
+
+from . import caching, reporting, rollups, subscriptions
+from .cluster_registry import cluster_registry
+from .mongo_models import (
+    BankDetails, ClusterDetails, UserProfile, MatchId, Payment, RevenueRollup, RegisteredCluster,
+    SubscriptionCounter, SubscriptionEvent,
+)
+
+SEEDED_MODELS = (
+    UserProfile, MatchId, Payment, RevenueRollup, RegisteredCluster, SubscriptionCounter, SubscriptionEvent,
+)
+
+CLUSTER_PRICES = (99, 199, 299, 499, 999)
+BANKS = ('State Bank', 'HDFC Bank', 'ICICI Bank', 'Axis Bank')
+
+
+def use_database(mongo_url=None, mock=False):
+    """Point the default and reporting connections at a local or mock database"""
+    if not mongo_url and not mock:
+        return
+    aliases = {DEFAULT_CONNECTION_NAME, reporting.alias()}
+    for alias in aliases:
+        disconnect(alias)
+    if mock:
+        try:
+            import mongomock
+        except ImportError:
+            raise RuntimeError('mongomock is not installed (pip install mongomock)')
+        options = {'db': 'solsub_synthetic', 'host': 'mongodb://localhost', 'mongo_client_class': mongomock.MongoClient}
+    else:
+        options = {'host': mongo_url}
+    # Identical settings make mongoengine share one client between the
+    # aliases, so reports see the seeded data (mongomock clients don't share)
+    for alias in aliases:
+        connect(alias=alias, **options)
+    cluster_registry.invalidate()
+
+
+def flush():
+    for model in SEEDED_MODELS:
+        model._get_collection().delete_many({})
+    cluster_registry.invalidate()
+    caching.bump('users', 'match_ids', 'payments', 'clusters')
+
+
+def _zipf_weights(count, skew=1.1):
+    return [1 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+def _insert(model, documents, batch_size=5000):
+    collection = model._get_collection()
+    for start in range(0, len(documents), batch_size):
+        collection.insert_many(documents[start:start + batch_size], ordered=False)
+
+
+def _spread(rng, start, end, bias=1.0):
+    """A datetime in [start, end); bias > 1 favours recent values"""
+    return start + (end - start) * (rng.random() ** (1 / bias))
+
+
+def generate(users, clusters, match_ids, payments, seed=0, now=None, progress=None):
+    """Insert the given number of each document; returns the counts written"""
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    two_years_ago = now - timedelta(days=730)
+    year_ago = now - timedelta(days=365)
+    progress = progress or (lambda message: None)
+
+    # Users, a minority of them owning clusters (weighted towards a few)
+    profiles = []
+    for index in range(users):
+        profiles.append(UserProfile(
+            id=ObjectId(),  # so the clusters collection can reference it before insert
+            user_id=f'synthetic-user-{index}',
+            email=f'user{index}@example.com',
+            username=f'user{index}',
+            created_at=_spread(rng, two_years_ago, now),
+            bank_details=BankDetails(
+                bank_name=rng.choice(BANKS),
+                account_number=str(rng.randrange(10 ** 9, 10 ** 10)),
+                ifsc_code=f'SYNT0{rng.randrange(100000, 999999)}',
+                branch_name='Main',
+            ) if rng.random() < 0.7 else None,
+        ))
+
+    cluster_specs = []
+    registered = []
+    owner_weights = _zipf_weights(max(users, 1))
+    for index in range(clusters if users else 0):
+        owner = rng.choices(profiles, weights=owner_weights)[0]
+        cluster = ClusterDetails(
+            cluster_name=f'Cluster {index}',
+            cluster_price=rng.choice(CLUSTER_PRICES),
+            timeline_days=rng.choice((30, 30, 30, 7, 14)),
+            api_key=f'{rng.getrandbits(128):032x}',
+            match_id_type=rng.choice(('admin_generated', 'user_created')),
+            trial_period=rng.choice((0, 0, 3, 7)),
+        )
+        owner.clusters.append(cluster)
+        cluster_specs.append(cluster)
+        registered.append(RegisteredCluster.from_cluster(owner, cluster))
+    _insert(UserProfile, [profile.to_mongo() for profile in profiles])
+    for document in registered:
+        document.synced_at = now
+    _insert(RegisteredCluster, [document.to_mongo() for document in registered])
+    progress(f'{users} users, {len(cluster_specs)} clusters')
+
+    # Match IDs, most of them on a few popular clusters
+    match_docs = []
+    match_clusters = []
+    cluster_weights = _zipf_weights(max(len(cluster_specs), 1))
+    for index in range(match_ids if cluster_specs else 0):
+        cluster = rng.choices(cluster_specs, weights=cluster_weights)[0]
+        created_on = _spread(rng, year_ago, now, bias=1.5)
+        is_trial = rng.random() < 0.3
+        last_paid_on = None
+        if not is_trial or rng.random() < 0.4:
+            last_paid_on = _spread(rng, created_on, now)
+        period = timedelta(days=cluster.trial_period if is_trial and not last_paid_on else cluster.timeline_days)
+        valid_till = (last_paid_on or created_on) + period
+        match_docs.append(MatchId(
+            match_id=f'synthetic-match-{index}',
+            cluster_name=cluster.cluster_name,
+            created_on=created_on,
+            last_paid_on=last_paid_on,
+            valid_till=valid_till,
+            is_trial=is_trial,
+        ).to_mongo())
+        match_clusters.append(cluster)
+    _insert(MatchId, match_docs)
+    # Statuses and counters the MatchId save hook would normally maintain
+    subscriptions.rebuild(now)
+    progress(f'{len(match_docs)} match IDs')
+
+    # Payments for those match IDs, growing towards the present
+    payment_docs = []
+    for index in range(payments if match_docs else 0):
+        position = rng.randrange(len(match_docs))
+        cluster = match_clusters[position]
+        payment_docs.append(Payment(
+            payment_id=f'synthetic-payment-{index}',
+            match_id=match_docs[position]['match_id'],
+            api_key=cluster.api_key,
+            amount=cluster.cluster_price,
+            status=rng.choices(('Completed', 'Pending', 'Failed'), weights=(85, 10, 5))[0],
+            payment_date=_spread(rng, year_ago, now, bias=1.5),
+            user_email=f'payer{rng.randrange(max(match_ids, 1))}@example.com',
+        ).to_mongo())
+    _insert(Payment, payment_docs)
+    progress(f'{len(payment_docs)} payments')
+
+    # Rollups the Payment save hook would normally maintain
+    if payment_docs:
+        rollups.rebuild(year_ago, now + timedelta(days=1))
+    caching.bump('users', 'match_ids', 'payments', 'clusters')
+    progress('rebuilt revenue rollups')
+
+    return {
+        'users': users,
+        'clusters': len(cluster_specs),
+        'match_ids': len(match_docs),
+        'payments': len(payment_docs),
+    }
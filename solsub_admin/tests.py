@@ -0,0 +1,620 @@
+import base64
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from unittest import mock
+
+from bson import ObjectId
+from django.conf import settings
+from django.core.management import call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from mongoengine import connect, connection, disconnect
+from mongoengine.connection import DEFAULT_CONNECTION_NAME, get_connection, get_db
+
+from . import (
+    aggregations, caching, match_id_actions, pagination, reconciliation, report_jobs, reporting, subscriptions,
+)
+from .cluster_registry import cluster_registry
+from .mongo_models import MatchId, Payment, RevenueRollup, SubscriptionCounter, SubscriptionEvent, UserProfile
+
+
+class ReportingConnectionTests(SimpleTestCase):
+    """Report reads go through the reporting alias, writes stay on the default one"""
+
+    def test_reporting_read_preference(self):
+        # mongoengine overrides readPreference= options with its own default
+        preference = get_connection(settings.MONGO_REPORTING_ALIAS).read_preference
+        self.assertEqual(preference.mongos_mode, settings.MONGO_REPORTING_READ_PREFERENCE)
+
+
+class MockMongoTestCase(SimpleTestCase):
+    """Points the default and reporting aliases at mongomock for the class"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import mongomock
+        cls.aliases = (DEFAULT_CONNECTION_NAME, reporting.alias())
+        cls.registered = {alias: connection._connection_settings.get(alias) for alias in cls.aliases}
+        for alias in cls.aliases:
+            disconnect(alias)
+            connect(alias=alias, db=cls.database_name(alias), host='mongodb://localhost',
+                    mongo_client_class=mongomock.MongoClient)
+        cluster_registry.invalidate()
+
+    @classmethod
+    def tearDownClass(cls):
+        # Put back the connections registered in settings.py
+        for alias, registered in cls.registered.items():
+            disconnect(alias)
+            if registered:
+                connection._connection_settings[alias] = registered
+        cluster_registry.invalidate()
+        super().tearDownClass()
+
+    @classmethod
+    def database_name(cls, alias):
+        return 'solsub_test'
+
+
+@override_settings(USE_REVENUE_ROLLUPS=False, USE_SUBSCRIPTION_STATES=True)
+class ReportingRoutingTests(MockMongoTestCase):
+
+    @classmethod
+    def database_name(cls, alias):
+        # Two stand-in servers holding different data
+        return f'solsub_{alias}'
+
+    def setUp(self):
+        for alias in self.aliases:
+            db = get_db(alias)
+            for name in db.list_collection_names():
+                db.drop_collection(name)
+
+    def test_payment_stats_read_reporting_alias(self):
+        get_db(reporting.alias())['payments'].insert_one({
+            'payment_id': 'p1', 'match_id': 'm1', 'api_key': 'k1', 'amount': 99.0,
+            'status': 'Completed', 'payment_date': datetime(2026, 1, 15),
+        })
+
+        self.assertEqual(Payment.objects.count(), 0)
+        self.assertEqual(aggregations.payment_stats()['total_revenue'], 99.0)
+
+    def test_active_counts_read_reporting_alias(self):
+        counters = [
+            {'cluster_name': None, 'trial_active': 1, 'paid_active': 2, 'active': 3},
+            {'cluster_name': 'Cluster 0', 'trial_active': 1, 'paid_active': 2, 'active': 3},
+        ]
+        get_db(reporting.alias())['subscription_counters'].insert_many(counters)
+
+        self.assertEqual(subscriptions.active_counts(), {'active_match_ids': 3, 'active_clusters': 1})
+        self.assertEqual(subscriptions.active_by_cluster(), {'Cluster 0': 3})
+
+    def test_reporting_reads_leave_model_alias_alone(self):
+        get_db(reporting.alias())['payments'].insert_one({'payment_id': 'p1'})
+
+        def read(_):
+            return [reporting.objects(Payment).count() for _ in range(200)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            counts = [count for batch in executor.map(read, range(8)) for count in batch]
+
+        self.assertEqual(set(counts), {1})
+        self.assertEqual(Payment._meta.get('db_alias', DEFAULT_CONNECTION_NAME), DEFAULT_CONNECTION_NAME)
+        self.assertEqual(Payment._get_collection().database.name, self.database_name(DEFAULT_CONNECTION_NAME))
+        self.assertEqual(Payment.objects.count(), 0)
+
+
+class CacheInvalidationTests(MockMongoTestCase):
+    """Model writes bump the generation of their collection"""
+
+    def assertBumps(self, collection, write):
+        before = caching.generations([collection])
+        write()
+        self.assertNotEqual(caching.generations([collection]), before)
+
+    def test_payment_writes(self):
+        payment = Payment(payment_id='p1', match_id='m1', api_key='k1', amount=10,
+                          status='Completed', payment_date=datetime(2026, 1, 15))
+        self.assertBumps('payments', payment.save)
+        self.assertBumps('payments', payment.delete)
+
+    def test_match_id_writes(self):
+        match_id = MatchId(match_id='m1', cluster_name='Cluster 0', created_on=datetime(2026, 1, 15))
+        self.assertBumps('match_ids', match_id.save)
+        self.assertBumps('match_ids', match_id.delete)
+
+    def test_user_writes(self):
+        user = UserProfile(user_id='u1', email='u1@example.com', username='u1')
+        self.assertBumps('users', user.save)
+        self.assertBumps('users', user.delete)
+
+
+class RevenueRollupTests(MockMongoTestCase):
+    """The rollups kept up by Payment writes match a regrouping of the payments"""
+
+    def setUp(self):
+        Payment._get_collection().drop()
+        RevenueRollup._get_collection().drop()
+
+    def payment(self, **fields):
+        values = dict(payment_id='p1', match_id='m1', api_key='k1', amount=10,
+                      status='Pending', payment_date=datetime(2026, 1, 15, 9, 30))
+        values.update(fields)
+        return Payment(**values)
+
+    def rollups(self):
+        return {
+            (document['day'], document['api_key'], document['status']): (document['amount'], document['count'])
+            for document in RevenueRollup._get_collection().find()
+            if document['amount'] or document['count']
+        }
+
+    def regrouped(self):
+        pipeline = [
+            {'$match': {'api_key': {'$ne': None}}},
+            {'$group': {
+                '_id': {
+                    'day': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$payment_date'}},
+                    'api_key': '$api_key',
+                    'status': {'$ifNull': ['$status', 'Pending']},
+                },
+                'amount': {'$sum': '$amount'},
+                'count': {'$sum': 1},
+            }},
+        ]
+        return {
+            (datetime.strptime(row['_id']['day'], '%Y-%m-%d'), row['_id']['api_key'], row['_id']['status']):
+                (row['amount'], row['count'])
+            for row in Payment._get_collection().aggregate(pipeline)
+        }
+
+    def assertRollups(self, expected):
+        self.assertEqual(self.rollups(), expected)
+        self.assertEqual(self.rollups(), self.regrouped())
+
+    def test_create_status_change_and_delete(self):
+        payment = self.payment()
+        payment.save()
+        self.assertRollups({(datetime(2026, 1, 15), 'k1', 'Pending'): (10, 1)})
+
+        self.payment(payment_id='p2', amount=5).save()
+        self.assertRollups({(datetime(2026, 1, 15), 'k1', 'Pending'): (15, 2)})
+
+        payment.status = 'Completed'
+        payment.save()
+        self.assertRollups({
+            (datetime(2026, 1, 15), 'k1', 'Pending'): (5, 1),
+            (datetime(2026, 1, 15), 'k1', 'Completed'): (10, 1),
+        })
+
+        payment.delete()
+        self.assertRollups({(datetime(2026, 1, 15), 'k1', 'Pending'): (5, 1)})
+
+    def test_date_and_api_key_changes_move_the_amount(self):
+        payment = self.payment(status='Completed')
+        payment.save()
+
+        payment.payment_date = datetime(2026, 1, 16, 23, 59)
+        payment.save()
+        self.assertRollups({(datetime(2026, 1, 16), 'k1', 'Completed'): (10, 1)})
+
+        payment.api_key = 'k2'
+        payment.amount = 12
+        payment.save()
+        self.assertRollups({(datetime(2026, 1, 16), 'k2', 'Completed'): (12, 1)})
+
+    def test_backfill_matches_the_payments(self):
+        Payment._get_collection().insert_many([
+            {'payment_id': f'p{index}', 'api_key': f'k{index % 3}', 'amount': float(index),
+             'status': ('Completed', 'Failed', 'Pending')[index % 4 % 3],
+             'payment_date': datetime(2026, 1, 1 + index % 9, index % 24)}
+            for index in range(60)
+        ] + [
+            # Written outside the app: no status, and no api_key
+            {'payment_id': 'p-no-status', 'api_key': 'k1', 'amount': 7.0, 'payment_date': datetime(2026, 1, 2)},
+            {'payment_id': 'p-no-key', 'amount': 3.0, 'status': 'Completed', 'payment_date': datetime(2026, 1, 2)},
+        ])
+        # A stale rollup the backfill must replace
+        RevenueRollup(day=datetime(2026, 1, 3), api_key='k9', status='Completed', amount=99, count=9).save()
+
+        call_command('backfill_revenue_rollups', '--batch-days', '2', stdout=io.StringIO())
+
+        self.assertEqual(self.rollups(), self.regrouped())
+        self.assertEqual(sum(count for _, count in self.rollups().values()), 61)
+
+
+class SubscriptionCounterTests(MockMongoTestCase):
+    """The counters kept up by saves and expiries match a recount of the match IDs"""
+
+    def setUp(self):
+        for model in (MatchId, SubscriptionCounter, SubscriptionEvent):
+            model._get_collection().drop()
+        self.now = datetime.now()
+
+    def match_id(self, match_id, cluster_name='Cluster 0', days=30, is_trial=False):
+        return MatchId(match_id=match_id, cluster_name=cluster_name, created_on=self.now,
+                       valid_till=self.now + timedelta(days=days), is_trial=is_trial)
+
+    def counters(self):
+        counters = {}
+        for document in SubscriptionCounter._get_collection().find():
+            counts = tuple(document.get(field, 0) for field in (*subscriptions.ACTIVE_STATUSES, 'active'))
+            if document['cluster_name'] is None or any(counts):
+                counters[document['cluster_name']] = counts
+        return counters
+
+    def recount(self, now):
+        counts = {None: Counter()}
+        for document in MatchId._get_collection().find():
+            status = subscriptions.status_of(document.get('is_trial'), document.get('valid_till'), now)
+            if status in subscriptions.ACTIVE_STATUSES:
+                for name in (document['cluster_name'], None):
+                    counts.setdefault(name, Counter())[status] += 1
+        return {
+            name: (count[subscriptions.TRIAL_ACTIVE], count[subscriptions.PAID_ACTIVE], sum(count.values()))
+            for name, count in counts.items()
+        }
+
+    def assertCounters(self, now=None):
+        self.assertEqual(self.counters(), self.recount(now or datetime.now()))
+
+    def test_save_and_delete(self):
+        trial = self.match_id('m1', is_trial=True)
+        trial.save()
+        self.match_id('m2', cluster_name='Cluster 1').save()
+        lapsed = self.match_id('m3', days=-1)
+        lapsed.save()
+        self.assertCounters()
+        self.assertEqual(self.counters()[None], (1, 1, 2))
+
+        trial.is_trial = False
+        trial.save()
+        self.assertCounters()
+
+        trial.cluster_name = 'Cluster 1'
+        trial.save()
+        self.assertCounters()
+        self.assertEqual(self.counters(), {None: (0, 2, 2), 'Cluster 1': (0, 2, 2)})
+
+        lapsed.valid_till = self.now + timedelta(days=7)
+        lapsed.save()
+        self.assertCounters()
+
+        trial.delete()
+        self.assertCounters()
+        self.assertEqual(self.counters()[None], (0, 2, 2))
+
+    def test_expiry(self):
+        for index in range(5):
+            self.match_id(f'm{index}', cluster_name=f'Cluster {index % 2}', days=index - 1,
+                          is_trial=bool(index % 2)).save()
+        # m0 and m1 had lapsed when saved; the other three are due two weeks on
+        later = self.now + timedelta(days=14)
+
+        self.assertEqual(subscriptions.expire_due(now=later, batch_size=2), 3)
+        self.assertCounters(later)
+        self.assertEqual(self.counters()[None], (0, 0, 0))
+        expired = SubscriptionEvent._get_collection().count_documents({'reason': 'expired'})
+        self.assertEqual(expired, 3)
+
+        # Nothing more is due
+        self.assertEqual(subscriptions.expire_due(now=later), 0)
+        self.assertCounters(later)
+
+    def test_rebuild(self):
+        # Written outside the app: no stored status and no counters
+        MatchId._get_collection().insert_many([
+            {'match_id': f'm{index}', 'cluster_name': f'Cluster {index % 3}', 'created_on': self.now,
+             'valid_till': self.now + timedelta(days=index - 4), 'is_trial': index % 2 == 0}
+            for index in range(12)
+        ] + [{'match_id': 'm-open', 'cluster_name': 'Cluster 0', 'created_on': self.now, 'valid_till': None}])
+        SubscriptionCounter._get_collection().insert_one({'cluster_name': 'Cluster 9', 'paid_active': 5, 'active': 5})
+
+        call_command('track_subscriptions', '--rebuild', stdout=io.StringIO())
+
+        self.assertCounters()
+        for document in MatchId._get_collection().find():
+            self.assertEqual(
+                document['status'],
+                subscriptions.status_of(document.get('is_trial'), document.get('valid_till')),
+                document['match_id'],
+            )
+
+        # Saves after the rebuild keep the counters in step
+        match_id = MatchId.objects.get(match_id='m0')
+        match_id.valid_till = self.now + timedelta(days=30)
+        match_id.save()
+        MatchId.objects.get(match_id='m11').delete()
+        self.assertCounters()
+
+
+class MatchIdSelectionTests(MockMongoTestCase):
+
+    def test_id_list_keeps_search_prefix(self):
+        collection = MatchId._get_collection()
+        collection.insert_many([{'match_id': 'team-1'}, {'match_id': 'other-1'}])
+
+        query = match_id_actions.selection_query({'q': 'team-'}, ['team-1', 'other-1'])
+        self.assertEqual([document['match_id'] for document in collection.find(query)], ['team-1'])
+
+
+class KeysetPaginationTests(MockMongoTestCase):
+
+    def setUp(self):
+        collection = Payment._get_collection()
+        collection.drop()
+        # Ties on the sort key, and a payment without a date
+        dates = [datetime(2026, 1, 15), datetime(2026, 1, 15), datetime(2026, 1, 15),
+                 datetime(2026, 1, 14), datetime(2026, 1, 13), None]
+        collection.insert_many([
+            {'payment_id': f'p{index}', 'payment_date': date} for index, date in enumerate(dates)
+        ])
+        self.expected = [
+            document['payment_id']
+            for document in collection.find().sort([('payment_date', -1), ('_id', -1)])
+        ]
+
+    def paginator(self, descending=True):
+        queryset = Payment.objects.only('payment_id', 'payment_date').as_pymongo()
+        return pagination.KeysetPaginator(queryset, 'payment_date', descending=descending, page_size=2)
+
+    def ids(self, page):
+        return [document['payment_id'] for document in page.items]
+
+    def test_forward_and_back(self):
+        for descending in (True, False):
+            expected = self.expected if descending else self.expected[::-1]
+            paginator = self.paginator(descending)
+            pages = [paginator.page()]
+            while pages[-1].next_cursor:
+                pages.append(paginator.page(pages[-1].next_cursor))
+            self.assertEqual([payment_id for page in pages for payment_id in self.ids(page)], expected)
+            self.assertIsNone(pages[0].previous_cursor)
+
+            # Walking back from the last page returns the same pages
+            back = [pages[-1]]
+            while back[-1].previous_cursor:
+                back.append(paginator.page(back[-1].previous_cursor))
+            self.assertEqual([self.ids(page) for page in back[::-1]], [self.ids(page) for page in pages])
+
+    def test_bad_cursor_returns_first_page(self):
+        first = self.ids(self.paginator().page())
+        bad_payloads = [
+            {'k': {'v': 1}, 'id': 'not-an-object-id', 'd': 'next'},
+            {'k': {'v': {'$gt': ''}}, 'id': str(ObjectId()), 'd': 'next'},
+            {'k': {'v': [1]}, 'id': str(ObjectId()), 'd': 'next'},
+            {'k': {'dt': {'$ne': None}}, 'id': str(ObjectId()), 'd': 'next'},
+            {'k': {'v': 1}, 'id': str(ObjectId()), 'd': 'sideways'},
+            ['k', 'id', 'd'],
+        ]
+        cursors = ['not base64!', base64.urlsafe_b64encode(b'not json').decode()]
+        cursors += [base64.urlsafe_b64encode(json.dumps(payload).encode()).decode() for payload in bad_payloads]
+        for cursor in cursors:
+            self.assertIsNone(pagination.decode_cursor(cursor), cursor)
+            self.assertEqual(self.ids(self.paginator().page(cursor)), first)
+
+
+class ReportJobTests(MockMongoTestCase):
+    """Jobs run on the in-process thread executor (REPORT_JOB_WORKERS=0)"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = self.settings(REPORT_JOB_WORKERS=0, REPORT_JOBS_DIR=directory.name,
+                                  REPORT_JOB_REUSE_SECONDS=60, REPORT_JOB_TIMEOUT=600)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        report_jobs._reset_executor()
+        self.addCleanup(self.shut_down_executor)
+        Payment._get_collection().drop()
+        Payment._get_collection().insert_one({
+            'payment_id': 'p1', 'match_id': 'm1', 'api_key': 'k1', 'amount': 10.0,
+            'status': 'Completed', 'payment_date': datetime.now(),
+        })
+
+    def shut_down_executor(self):
+        if report_jobs._executor is not None:
+            report_jobs._executor.shutdown(wait=True)
+        report_jobs._reset_executor()
+
+    def wait(self):
+        # One worker thread: an empty task finishes after the queued jobs
+        report_jobs.get_executor().submit(lambda: None).result(timeout=30)
+
+    def builder(self, build):
+        return mock.patch.dict(report_jobs.JOB_KINDS, {'payment': (build, ('cluster_name',))})
+
+    def make_stale(self, jid):
+        stale = time.time() - 601
+        os.utime(report_jobs._path(jid, '.lock'), (stale, stale))
+
+    def test_payment_report_renders(self):
+        state = report_jobs.submit('payment', {'cluster_name': ''})
+        self.wait()
+
+        state = report_jobs.job_state(state['job_id'])
+        self.assertEqual(state['status'], report_jobs.DONE)
+        with open(report_jobs.pdf_path(state['job_id']), 'rb') as pdf:
+            self.assertEqual(pdf.read(5), b'%PDF-')
+        self.assertFalse(os.path.exists(report_jobs._path(state['job_id'], '.lock')))
+
+    def test_identical_requests_share_a_job(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def build(params, output, progress):
+            calls.append(params)
+            started.set()
+            release.wait(timeout=30)
+            return 'report.pdf'
+
+        with self.builder(build):
+            first = report_jobs.submit('payment', {'cluster_name': 'Cluster 0'})
+            started.wait(timeout=30)
+            # Parameters outside the report's own are ignored
+            second = report_jobs.submit('payment', {'cluster_name': 'Cluster 0', 'csrfmiddlewaretoken': 'x'})
+            self.assertEqual(second['job_id'], first['job_id'])
+            self.assertEqual(report_jobs.job_state(first['job_id'])['status'], report_jobs.RUNNING)
+            release.set()
+            self.wait()
+
+        self.assertEqual(calls, [{'cluster_name': 'Cluster 0'}])
+        self.assertEqual(report_jobs.job_state(first['job_id'])['status'], report_jobs.DONE)
+
+    def test_finished_report_is_reused(self):
+        calls = []
+
+        def build(params, output, progress):
+            calls.append(params)
+            output.write(b'%PDF-')
+            return 'report.pdf'
+
+        with self.builder(build):
+            jid = report_jobs.submit('payment', {})['job_id']
+            self.wait()
+            self.assertEqual(report_jobs.submit('payment', {})['status'], report_jobs.DONE)
+            self.wait()
+            self.assertEqual(len(calls), 1)
+
+            # Once the reuse window has passed the report is rendered again
+            old = time.time() - 61
+            os.utime(report_jobs.pdf_path(jid), (old, old))
+            self.assertEqual(report_jobs.submit('payment', {})['status'], report_jobs.QUEUED)
+            self.wait()
+            self.assertEqual(len(calls), 2)
+
+    def test_busy_job_reports_queued_over_an_old_result(self):
+        with self.builder(lambda params, output, progress: 'report.pdf'):
+            jid = report_jobs.submit('payment', {})['job_id']
+            self.wait()
+            old = time.time() - 61
+            os.utime(report_jobs.pdf_path(jid), (old, old))
+            # Another request is rendering it again
+            self.assertIsNotNone(report_jobs._claim(jid))
+
+            state = report_jobs.submit('payment', {})
+
+        self.assertEqual(state['status'], report_jobs.QUEUED)
+
+    def test_stale_lock(self):
+        jid = report_jobs.job_id('payment', {})
+        report_jobs._write_state(jid, status=report_jobs.RUNNING, progress=40, message='Rendering PDF')
+        dead = report_jobs._claim(jid)
+        self.assertEqual(report_jobs.job_state(jid)['status'], report_jobs.RUNNING)
+
+        # The worker died: polling marks the job failed...
+        self.make_stale(jid)
+        self.assertEqual(report_jobs.job_state(jid)['status'], report_jobs.FAILED)
+
+        # ...and the next request restarts it; the dead worker's release
+        # leaves the new lock alone
+        with self.builder(lambda params, output, progress: 'report.pdf'):
+            live = report_jobs._claim(jid)
+            self.assertIsNotNone(live)
+            report_jobs._release(jid, dead)
+            self.assertEqual(report_jobs._lock_owner(jid), live)
+            report_jobs._release(jid, live)
+
+            self.assertEqual(report_jobs.submit('payment', {})['status'], report_jobs.QUEUED)
+            self.wait()
+        self.assertEqual(report_jobs.job_state(jid)['status'], report_jobs.DONE)
+
+    def test_progress_keeps_the_lock_fresh(self):
+        def build(params, output, progress):
+            self.make_stale(jid)
+            progress(50, 'Halfway')
+            self.assertEqual(report_jobs.job_state(jid)['status'], report_jobs.RUNNING)
+            return 'report.pdf'
+
+        jid = report_jobs.job_id('payment', {})
+        with self.builder(build):
+            report_jobs.submit('payment', {})
+            self.wait()
+        self.assertEqual(report_jobs.job_state(jid)['status'], report_jobs.DONE)
+
+    def test_failed_job(self):
+        def build(params, output, progress):
+            output.write(b'partial')
+            raise RuntimeError('no figures')
+
+        with self.builder(build), self.assertLogs(report_jobs.logger, 'ERROR'):
+            jid = report_jobs.submit('payment', {})['job_id']
+            self.wait()
+
+        state = report_jobs.job_state(jid)
+        self.assertEqual((state['status'], state['error']), (report_jobs.FAILED, 'no figures'))
+        self.assertFalse(os.path.exists(report_jobs._path(jid, '.lock')))
+        self.assertEqual([name for name in os.listdir(report_jobs.jobs_dir()) if name.endswith('.tmp')], [])
+
+    def test_broken_pool_is_replaced(self):
+        broken = mock.Mock()
+        broken.submit.side_effect = BrokenProcessPool()
+
+        with self.builder(lambda params, output, progress: 'report.pdf'), \
+                mock.patch.object(report_jobs, '_executor', broken):
+            jid = report_jobs.submit('payment', {})['job_id']
+            replacement = report_jobs.get_executor()
+            self.assertIsNot(replacement, broken)
+            self.wait()
+        replacement.shutdown(wait=True)
+
+        self.assertEqual(report_jobs.job_state(jid)['status'], report_jobs.DONE)
+
+
+@override_settings(PDF_TABLE_CHUNK_ROWS=7)
+class PaymentReportPdfTests(SimpleTestCase):
+
+    def pdf_text(self, pdf):
+        # ReportLab writes page contents as ASCII85 over Flate
+        streams = re.findall(rb'stream\r?\n(.*?)endstream', pdf, re.S)
+        return b''.join(zlib.decompress(base64.a85decode(stream.strip(), adobe=True)) for stream in streams)
+
+    def test_every_streamed_row_is_rendered(self):
+        from . import pdf_reports
+
+        count = 500
+        payments = (
+            {'id': f'pay_{index:05d}', 'match_id': f'm{index}', 'cluster_name': 'Cluster 0', 'amount': 10.0,
+             'date': '2026-01-15', 'user_email': f'u{index}@example.com'}
+            for index in range(count)
+        )
+        context = {'cluster_name': '', 'month_name': 'January', 'year': 2026, 'owner_info': None,
+                   'total_amount': 10.0 * count, 'payment_count': count}
+        output = io.BytesIO()
+        pdf_reports.render_payment_report(context, payments, output)
+
+        text = self.pdf_text(output.getvalue())
+        expected = [f'pay_{index:05d}'.encode() for index in range(count)]
+        self.assertEqual(sorted(re.findall(rb'pay_\d{5}', text)), expected)
+        self.assertIn(b'5000.00', text)
+
+
+class SettlementRowTests(SimpleTestCase):
+
+    def test_payment_date_offsets_convert_to_utc(self):
+        row = {'payment_id': 'p1', 'amount': '10', 'status': 'success'}
+        for value, expected in (
+            ('2026-01-15T02:00:00+05:30', datetime(2026, 1, 14, 20, 30)),
+            ('2026-01-15T02:00:00Z', datetime(2026, 1, 15, 2, 0)),
+            ('2026-01-15T02:00:00', datetime(2026, 1, 15, 2, 0)),
+        ):
+            parsed = reconciliation.parse_row(dict(row, payment_date=value))
+            self.assertEqual(parsed['payment_date'], expected)
+
+
+class TimeseriesAccessTests(SimpleTestCase):
+
+    def test_anonymous_requests_redirect_to_login(self):
+        response = self.client.get(reverse('timeseries_data'))
+        self.assertEqual(response.status_code, 302)
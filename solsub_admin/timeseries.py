@@ -0,0 +1,179 @@
+"""Calendar-bucketed time series for the analytics API.
+
+Documents are bucketed server-side by truncating their date in the
+aggregation to whole days, ISO weeks (starting Monday) or calendar months,
+so the same month of different years never merges and no bucket is
+skipped. Buckets without data are zero-filled here, and every metric is
+returned as one array aligned with the bucket labels.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from . import aggregations, filters, reporting
+from .cluster_registry import cluster_registry
+from .mongo_models import MatchId, Payment, RevenueRollup
+
+GRANULARITIES = ('day', 'week', 'month')
+METRICS = ('revenue', 'payments', 'new_match_ids')
+
+# Longest series one request may ask for
+MAX_BUCKETS = 1000
+
+Query = namedtuple('Query', ['start', 'end', 'granularity', 'cluster_name'])
+
+
+class InvalidQuery(ValueError):
+    pass
+
+
+def truncate(value, granularity):
+    """Start of the bucket ``value`` falls in"""
+    day = datetime(value.year, value.month, value.day)
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return datetime(value.year, value.month, 1)
+    return day
+
+
+def _next(bucket, granularity):
+    if granularity == 'month':
+        if bucket.month == 12:
+            return datetime(bucket.year + 1, 1, 1)
+        return datetime(bucket.year, bucket.month + 1, 1)
+    return bucket + timedelta(days=7 if granularity == 'week' else 1)
+
+
+def buckets(start, end, granularity):
+    """Every bucket start from the one holding ``start`` up to ``end``"""
+    result = []
+    bucket = truncate(start, granularity)
+    while bucket < end:
+        result.append(bucket)
+        if len(result) > MAX_BUCKETS:
+            raise InvalidQuery(f'More than {MAX_BUCKETS} {granularity} buckets requested')
+        bucket = _next(bucket, granularity)
+    return result
+
+
+def parse_query(params, now=None):
+    """Query from the ``from``, ``to``, ``granularity`` and ``cluster`` params.
+
+    ``to`` is inclusive; the range defaults to the last six calendar months
+    including the current one.
+    """
+    now = now or datetime.now()
+    granularity = params.get('granularity') or 'month'
+    if granularity not in GRANULARITIES:
+        raise InvalidQuery(f"granularity must be one of {', '.join(GRANULARITIES)}")
+
+    start, end = params.get('from'), params.get('to')
+    if start and not filters.parse_date(start):
+        raise InvalidQuery('from must be a YYYY-MM-DD date')
+    if end and not filters.parse_date(end):
+        raise InvalidQuery('to must be a YYYY-MM-DD date')
+
+    end = filters.parse_date(end) if end else truncate(now, 'day')
+    end += timedelta(days=1)
+    if start:
+        start = filters.parse_date(start)
+    else:
+        start = truncate(now, 'month')
+        for _ in range(5):
+            start = truncate(start - timedelta(days=1), 'month')
+    if start >= end:
+        raise InvalidQuery('from must not be after to')
+
+    cluster_name = (params.get('cluster') or '').strip()
+    return Query(start, end, granularity, '' if cluster_name == 'all' else cluster_name)
+
+
+def _bucket_expression(field, granularity):
+    """Server-side truncation of ``field`` to the start of its bucket.
+
+    Built from $dateFromParts rather than $dateTrunc, which needs MongoDB
+    5.0 and is missing from mongomock (used by the benchmarks).
+    """
+    date = f'${field}'
+    parts = {'year': {'$year': date}, 'month': {'$month': date}}
+    if granularity == 'month':
+        return {'$dateFromParts': parts}
+    day = {'$dateFromParts': dict(parts, day={'$dayOfMonth': date})}
+    if granularity == 'day':
+        return day
+    # $dayOfWeek is 1 for Sunday; step back to the Monday of the ISO week
+    days_since_monday = {'$mod': [{'$add': [{'$dayOfWeek': date}, 5]}, 7]}
+    return {'$subtract': [day, {'$multiply': [days_since_monday, 24 * 3600 * 1000]}]}
+
+
+def bucketed_pipeline(match, date_field, granularity, sums):
+    """Group documents matching ``match`` by bucket of ``date_field``.
+
+    ``sums`` maps output names to the expression summed per bucket.
+    """
+    return [
+        {'$match': match},
+        {'$group': dict(
+            {'_id': _bucket_expression(date_field, granularity)},
+            **{name: {'$sum': expression} for name, expression in sums.items()}
+        )},
+    ]
+
+
+def _range(field, query):
+    return {field: {'$gte': query.start, '$lt': query.end}}
+
+
+def _payment_rows(query):
+    # Payments only store the api_key, so resolve the cluster first
+    match = {'status': 'Completed'}
+    if query.cluster_name:
+        ref = cluster_registry.by_name(query.cluster_name)
+        match['api_key'] = ref.api_key if ref else {'$in': []}
+
+    if aggregations.use_rollups():
+        match.update(_range('day', query))
+        pipeline = bucketed_pipeline(match, 'day', query.granularity, {'revenue': '$amount', 'payments': '$count'})
+        return reporting.objects(RevenueRollup).aggregate(pipeline)
+
+    match.update(_range('payment_date', query))
+    pipeline = bucketed_pipeline(match, 'payment_date', query.granularity, {'revenue': '$amount', 'payments': 1})
+    return reporting.objects(Payment).aggregate(pipeline)
+
+
+def _match_id_rows(query):
+    match = _range('created_on', query)
+    if query.cluster_name:
+        match['cluster_name'] = query.cluster_name
+    pipeline = bucketed_pipeline(match, 'created_on', query.granularity, {'new_match_ids': 1})
+    return reporting.objects(MatchId).aggregate(pipeline)
+
+
+def series(query):
+    """Bucket labels and one zero-filled array per metric.
+
+    Labels are bucket start dates; the first and last bucket only cover the
+    part of the period inside [start, end).
+    """
+    starts = buckets(query.start, query.end, query.granularity)
+    position = {bucket: index for index, bucket in enumerate(starts)}
+    values = {metric: [0] * len(starts) for metric in METRICS}
+
+    for rows in (_payment_rows(query), _match_id_rows(query)):
+        for row in rows:
+            index = position.get(row['_id'])
+            if index is None:
+                continue
+            for metric in METRICS:
+                if metric in row:
+                    values[metric][index] = row[metric]
+
+    values['revenue'] = [aggregations.to_float(value) for value in values['revenue']]
+    return {
+        'granularity': query.granularity,
+        'from': query.start.strftime('%Y-%m-%d'),
+        'to': (query.end - timedelta(days=1)).strftime('%Y-%m-%d'),
+        'cluster': query.cluster_name or None,
+        'labels': [bucket.strftime('%Y-%m-%d') for bucket in starts],
+        'series': values,
+    }
@@ -6,11 +6,20 @@ urlpatterns = [
     path('users/', views.users, name='users'),
     path('payments/', views.payments, name='payments'),
     path('match-ids/', views.match_ids, name='match_ids'),
+    path('match-ids/bulk/', views.match_ids_bulk, name='match_ids_bulk'),
     path('clusters/', views.clusters, name='clusters'),
+    path('exports/users/', views.export_users, name='export_users'),
+    path('exports/payments/', views.export_payments, name='export_payments'),
+    path('exports/match-ids/', views.export_match_ids, name='export_match_ids'),
     path('reports/', views.reports, name='reports'),
     path('reports/cluster-owner-payment/', views.cluster_owner_payment_report, name='cluster_owner_payment_report'),
     path('reports/generate-pdf/', views.generate_report_pdf, name='generate_report_pdf'),
+    path('reports/jobs/', views.start_report_job, name='start_report_job'),
+    path('reports/jobs/<str:job_id>/', views.report_job_status, name='report_job_status'),
+    path('reports/jobs/<str:job_id>/download/', views.download_report_job, name='download_report_job'),
     path('api/analytics/', views.analytics_data, name='analytics_data'),
+    path('api/timeseries/', views.timeseries_data, name='timeseries_data'),
+    path('api/search/', views.search_data, name='search_data'),
     path('api/clusters/', views.cluster_data, name='cluster_data'),
     path('api/users/<str:user_id>/', views.user_detail, name='user_detail'),
 ]
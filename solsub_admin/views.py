@@ -1,213 +1,277 @@
-from django.shortcuts import render
+from django.shortcuts import redirect, render
+from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse, HttpResponse
-from .mongo_models import UserProfile, MatchId, Payment, ClusterDetails
-from .models import Cluster
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import urlencode
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_POST
+from .mongo_models import UserProfile, MatchId, Payment, RegisteredCluster
+from .cluster_registry import cluster_registry
+from . import (
+    aggregations, caching, exports, filters, match_id_actions, report_data, reporting, report_jobs, rows,
+    search, timeseries,
+)
+from .pagination import paginate, page_query, sort_query
+from django.conf import settings
 from datetime import datetime, timedelta
 import json
 import calendar
 import logging
-import io
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
+import tempfile
 
 logger = logging.getLogger(__name__)
 
+# Indexed fields the list views may be sorted on
+USER_SORT_FIELDS = ('created_at',)
+PAYMENT_SORT_FIELDS = ('payment_date',)
+MATCH_ID_SORT_FIELDS = ('created_on', 'valid_till')
+
+# Collections each cached endpoint is derived from; writes to any of them
+# invalidate the cached result
+KPI_COLLECTIONS = ('users', 'match_ids', 'payments')
+CLUSTER_COLLECTIONS = ('clusters', 'match_ids')
+
+def _is_complete(context):
+    # Don't cache figures that were filled in for a failed query
+    return not context['unavailable']
+
+def _dashboard_kpis():
+    # Each KPI group is a single aggregation on its collection
+    kpis = aggregations.fetch_kpis(KPI_COLLECTIONS)
+    user_kpis, match_id_kpis, payment_kpis = kpis['users'], kpis['match_ids'], kpis['payments']
+    
+    return {
+        'user_count': user_kpis['user_count'],
+        'active_match_ids': match_id_kpis['active_match_ids'],
+        'cluster_count': match_id_kpis['active_clusters'],  # Only clusters with active match IDs
+        'total_revenue': payment_kpis['total_revenue'],
+        'trial_conversion_rate': match_id_kpis['trial_conversion_rate'],
+        'unavailable': kpis.failed,
+    }
+
 @login_required
 def dashboard(request):
-    # Get counts for dashboard stats
-    user_count = UserProfile.objects.count()
-    
-    # Count active match IDs (Trial Active or Paid Active)
-    now = datetime.now()
-    active_match_ids = 0
-    for match_id in MatchId.objects:
-        is_active = match_id.valid_till and now <= match_id.valid_till
-        if is_active:  # Includes both Trial Active and Paid Active
-            active_match_ids += 1
-    
-    # Get clusters with at least one active match ID
-    active_clusters = set()
-    for match_id in MatchId.objects(valid_till__gt=now):
-        active_clusters.add(match_id.cluster_name)
-    
-    # Calculate total revenue
-    total_revenue = 0
-    for payment in Payment.objects(status='Completed'):
-        total_revenue += float(payment.amount)
-    
-    # Calculate trial conversion rate
-    trial_match_ids = MatchId.objects(is_trial=True).count()
-    converted_trials = 0
-    for match_id in MatchId.objects(is_trial=True):
-        if match_id.last_paid_on and match_id.last_paid_on > match_id.created_on:
-            converted_trials += 1
-    
-    trial_conversion_rate = 0
-    if trial_match_ids > 0:
-        trial_conversion_rate = (converted_trials / trial_match_ids) * 100
-    
-    context = {
-        'user_count': user_count,
-        'active_match_ids': active_match_ids,
-        'cluster_count': len(active_clusters),  # Only clusters with active match IDs
-        'total_revenue': total_revenue,
-        'trial_conversion_rate': trial_conversion_rate,
-    }
+    context = caching.cached_result('dashboard', KPI_COLLECTIONS, _dashboard_kpis, should_cache=_is_complete)
     
     return render(request, 'dashboard/index.html', context)
 
+def _is_fragment(request):
+    return request.GET.get('fragment') == '1'
+
+def _fragment_response(request, template_name, context):
+    """Render only a page's table partial, for the dashboard tabs"""
+    response = render(request, template_name, context)
+    # Short private caching, so switching back to a tab is free
+    patch_cache_control(response, private=True, max_age=getattr(settings, 'FRAGMENT_MAX_AGE', 30))
+    patch_vary_headers(response, ['Cookie'])
+    return response
+
+def _export_query(request):
+    """The current filters as a query string for the export links"""
+    params = request.GET.copy()
+    for name in ('cursor', 'page_size', 'format', 'fragment'):
+        params.pop(name, None)
+    return params.urlencode()
+
+def _list_response(request, template_name, key, rows, page, sort_fields, context=None):
+    """Render one page of a list view, its JSON variant with format=json or
+    just its table with fragment=1"""
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            key: rows,
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+            'sort': page.sort,
+            'page_size': page.page_size,
+        })
+    
+    context = dict(context or {})
+    context.update({
+        key: rows,
+        'page': page,
+        'next_query': page_query(request, page.next_cursor) if page.next_cursor else None,
+        'previous_query': page_query(request, page.previous_cursor) if page.previous_cursor else None,
+        'filters': request.GET,
+        'export_query': _export_query(request),
+        # Clicking a sortable column flips its direction, newest first by default
+        'sort_queries': {
+            field: sort_query(request, field if page.sort == f'-{field}' else f'-{field}')
+            for field in sort_fields
+        },
+    })
+    if _is_fragment(request):
+        return _fragment_response(request, f'dashboard/partials/{key}_table.html', context)
+    return render(request, template_name, context)
+
 @login_required
+@caching.conditional('users', ('users',))
 def users(request):
-    # Get all users
-    all_users = []
-    
-    for user in UserProfile.objects:
-        all_users.append({
-            'id': user.user_id,
-            'username': user.username,
-            'email': user.email,
-            'created_at': user.created_at.strftime('%Y-%m-%d') if user.created_at else '-',
-            'cluster_count': len(user.clusters),
-            'has_bank_details': user.bank_details is not None,
-        })
+    # Get one page of users, newest first
+    queryset = UserProfile.objects(__raw__=filters.user_query(request.GET))
+    queryset = queryset.only(*rows.USER_FIELDS).as_pymongo()
+    page = paginate(request, queryset, USER_SORT_FIELDS, '-created_at')
+    
+    page_users = [rows.user_row(user) for user in page.items]
     
-    return render(request, 'dashboard/users.html', {'users': all_users})
+    return _list_response(request, 'dashboard/users.html', 'users', page_users, page, USER_SORT_FIELDS)
 
 @login_required
+@caching.conditional('payments', ('payments', 'clusters'))
 def payments(request):
-    # Get all payments
-    all_payments = []
+    # Get one page of payments, newest first
+    queryset = Payment.objects(__raw__=filters.payment_query(request.GET))
+    queryset = queryset.only(*rows.PAYMENT_FIELDS).as_pymongo()
+    page = paginate(request, queryset, PAYMENT_SORT_FIELDS, '-payment_date')
     
-    for payment in Payment.objects:
-        # Get cluster_name from api_key
-        cluster_name = payment.cluster_name
-        
-        all_payments.append({
-            'id': payment.payment_id,
-            'match_id': payment.match_id,
-            'cluster_name': cluster_name,
-            'amount': float(payment.amount),
-            'status': payment.status,
-            'date': payment.payment_date.strftime('%Y-%m-%d'),
-            'user_email': payment.user_email if payment.user_email else '-',
-        })
+    # Resolve cluster names for the whole page in one batch
+    cluster_names = cluster_registry.cluster_names(p.get('api_key') for p in page.items)
+    page_payments = [rows.payment_row(payment, cluster_names) for payment in page.items]
     
-    return render(request, 'dashboard/payments.html', {'payments': all_payments})
+    context = {
+        'cluster_names': cluster_registry.all_names(),
+        'statuses': filters.PAYMENT_STATUSES,
+    }
+    return _list_response(request, 'dashboard/payments.html', 'payments', page_payments, page, PAYMENT_SORT_FIELDS, context)
 
 @login_required
+@caching.conditional('match_ids', ('match_ids', 'clusters'))
 def match_ids(request):
-    # Get all match IDs
-    all_match_ids = []
+    # Get one page of match IDs, newest first
     now = datetime.now()
+    queryset = MatchId.objects(__raw__=filters.match_id_query(request.GET, now))
+    queryset = queryset.only(*rows.MATCH_ID_FIELDS).as_pymongo()
+    page = paginate(request, queryset, MATCH_ID_SORT_FIELDS, '-created_on')
     
-    for match_id in MatchId.objects:
-        is_active = match_id.valid_till and now <= match_id.valid_till
-        
-        if match_id.is_trial and is_active:
-            status = "Trial Active"
-        elif is_active:
-            status = "Paid Active"
-        else:
-            status = "Inactive"
-        
-        all_match_ids.append({
-            'id': match_id.match_id,
-            'cluster_name': match_id.cluster_name,
-            'created_on': match_id.created_on.strftime('%Y-%m-%d'),
-            'last_paid_on': match_id.last_paid_on.strftime('%Y-%m-%d') if match_id.last_paid_on else '-',
-            'valid_till': match_id.valid_till.strftime('%Y-%m-%d') if match_id.valid_till else '-',
-            'is_trial': match_id.is_trial,
-            'status': status,
+    page_match_ids = [rows.match_id_row(match_id, now) for match_id in page.items]
+    
+    context = {
+        'cluster_names': cluster_registry.all_names(),
+        'statuses': filters.MATCH_ID_STATUSES,
+    }
+    return _list_response(request, 'dashboard/match_ids.html', 'match_ids', page_match_ids, page, MATCH_ID_SORT_FIELDS, context)
+
+@login_required
+@require_POST
+def match_ids_bulk(request):
+    """Apply a bulk action to the filtered match IDs, optionally narrowed to
+    an uploaded or pasted list of match IDs"""
+    action = request.POST.get('action')
+    listed = request.POST.get('match_ids', '')
+    if request.FILES.get('match_ids_file'):
+        listed += '\n' + request.FILES['match_ids_file'].read().decode('utf-8', errors='ignore')
+    ids = match_id_actions.parse_match_ids(listed) or None
+    query = match_id_actions.selection_query(request.POST, ids)
+    # Back to the list with the filters the action was applied to
+    back = f"{reverse('match_ids')}?{urlencode({name: request.POST.get(name, '') for name in ('cluster', 'status', 'q')})}"
+
+    try:
+        days = int(request.POST['days']) if request.POST.get('days') else None
+    except ValueError:
+        messages.error(request, 'Days must be a whole number.')
+        return redirect(back)
+
+    selected = MatchId._get_collection().count_documents(query)
+    if selected > settings.BULK_ACTION_MAX_MATCH_IDS:
+        messages.error(
+            request,
+            f'{selected} match IDs selected; use manage.py bulk_match_ids for more than '
+            f'{settings.BULK_ACTION_MAX_MATCH_IDS}.',
+        )
+        return redirect(back)
+
+    try:
+        matched, modified = match_id_actions.apply(action, query, days=days)
+    except match_id_actions.InvalidAction as error:
+        messages.error(request, str(error))
+    else:
+        logger.info('Bulk %s by %s: %s matched, %s modified', action, request.user, matched, modified)
+        messages.success(request, f'{action.replace("_", " ").capitalize()}: {modified} of {matched} match IDs updated.')
+    return redirect(back)
+
+def _export_response(request, name, columns, row_batches):
+    """Stream an export as CSV (default) or NDJSON with ?format=ndjson"""
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in exports.EXPORT_FORMATS:
+        export_format = 'csv'
+    
+    response = StreamingHttpResponse(
+        exports.stream(export_format, columns, row_batches),
+        content_type=exports.EXPORT_FORMATS[export_format],
+    )
+    filename = f"{name}_{datetime.now().strftime('%Y%m%d')}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@login_required
+def export_users(request):
+    queryset = UserProfile.objects(__raw__=filters.user_query(request.GET)).order_by('-created_at', '-id')
+    queryset = queryset.only(*rows.USER_FIELDS).as_pymongo()
+    return _export_response(request, 'users', exports.USER_COLUMNS, exports.user_batches(queryset))
+
+@login_required
+def export_payments(request):
+    queryset = Payment.objects(__raw__=filters.payment_query(request.GET)).order_by('-payment_date', '-id')
+    queryset = queryset.only(*rows.PAYMENT_FIELDS).as_pymongo()
+    return _export_response(request, 'payments', exports.PAYMENT_COLUMNS, exports.payment_batches(queryset))
+
+@login_required
+def export_match_ids(request):
+    now = datetime.now()
+    queryset = MatchId.objects(__raw__=filters.match_id_query(request.GET, now)).order_by('-created_on', '-id')
+    queryset = queryset.only(*rows.MATCH_ID_FIELDS).as_pymongo()
+    return _export_response(request, 'match_ids', exports.MATCH_ID_COLUMNS, exports.match_id_batches(queryset, now))
+
+def _cluster_list():
+    # One query for the clusters and one grouped count of active match IDs,
+    # instead of a count per cluster
+    active_counts = aggregations.active_subscriptions_by_cluster()
+    
+    unique_clusters = []
+    for cluster in RegisteredCluster.objects.as_pymongo():
+        unique_clusters.append({
+            'name': cluster['cluster_name'],
+            'price': aggregations.to_float(cluster.get('cluster_price')),
+            'timeline_days': cluster.get('timeline_days'),
+            'trial_period': cluster.get('trial_period', 0),
+            'match_id_type': cluster.get('match_id_type', 'admin_generated'),
+            'active_subscriptions': active_counts.get(cluster['cluster_name'], 0),
+            'api_key': cluster.get('api_key'),
         })
     
-    return render(request, 'dashboard/match_ids.html', {'match_ids': all_match_ids})
+    return unique_clusters
 
 @login_required
+@caching.conditional('clusters', CLUSTER_COLLECTIONS)
 def clusters(request):
-    # Get all unique clusters
-    all_clusters = []
-    for user in UserProfile.objects:
-        for cluster in user.clusters:
-            # Count active match IDs for this cluster
-            active_count = MatchId.objects(
-                cluster_name=cluster.cluster_name,
-                valid_till__gt=datetime.now()
-            ).count()
-            
-            all_clusters.append({
-                'name': cluster.cluster_name,
-                'price': float(cluster.cluster_price),
-                'timeline_days': cluster.timeline_days,
-                'trial_period': cluster.trial_period,
-                'match_id_type': cluster.match_id_type,
-                'active_subscriptions': active_count,
-                'api_key': cluster.api_key,
-            })
-    
-    # Remove duplicates based on cluster name
-    unique_clusters = []
-    cluster_names = set()
-    for cluster in all_clusters:
-        if cluster['name'] not in cluster_names:
-            cluster_names.add(cluster['name'])
-            unique_clusters.append(cluster)
+    unique_clusters = caching.cached_result('clusters', CLUSTER_COLLECTIONS, _cluster_list)
     
+    if _is_fragment(request):
+        return _fragment_response(request, 'dashboard/partials/clusters_table.html', {'clusters': unique_clusters})
     return render(request, 'dashboard/clusters.html', {'clusters': unique_clusters})
 
+def _report_kpis():
+    # Monthly revenue, cluster performance and user growth are aggregated in Mongo
+    kpis = aggregations.fetch_kpis(KPI_COLLECTIONS)
+    user_kpis, match_id_kpis, payment_kpis = kpis['users'], kpis['match_ids'], kpis['payments']
+    
+    return {
+        'monthly_revenue': payment_kpis['monthly_revenue'],
+        'cluster_performance': payment_kpis['cluster_performance'],
+        'user_growth': user_kpis['user_growth'],
+        'total_revenue': payment_kpis['total_revenue'],
+        'active_match_ids': match_id_kpis['active_match_ids'],
+        'trial_conversion_rate': match_id_kpis['trial_conversion_rate'],
+        'unavailable': kpis.failed,
+    }
+
 @login_required
 def reports(request):
-    # Get data for reports
-    now = datetime.now()
-    
-    # Monthly revenue data
-    monthly_revenue = {}
-    for payment in Payment.objects(status='Completed'):
-        if payment.payment_date:  # Check if payment_date is not None
-            month_year = payment.payment_date.strftime('%Y-%m')
-            if month_year not in monthly_revenue:
-                monthly_revenue[month_year] = 0
-            monthly_revenue[month_year] += float(payment.amount)
-    
-    # Cluster performance data
-    cluster_performance = {}
-    for payment in Payment.objects(status='Completed'):
-        cluster_name = payment.cluster_name
-        if cluster_name:
-            if cluster_name not in cluster_performance:
-                cluster_performance[cluster_name] = {
-                    'revenue': 0,
-                    'count': 0
-                }
-            cluster_performance[cluster_name]['revenue'] += float(payment.amount)
-            cluster_performance[cluster_name]['count'] += 1
-    
-    # User growth data (safe, since created_at is required)
-    user_growth = {}
-    for user in UserProfile.objects:
-        if user.created_at:  # Check if created_at is not None
-            month_year = user.created_at.strftime('%Y-%m')
-            if month_year not in user_growth:
-                user_growth[month_year] = 0
-            user_growth[month_year] += 1
+    context = dict(caching.cached_result('reports', KPI_COLLECTIONS, _report_kpis, should_cache=_is_complete))
     
     # Get all cluster names for the dropdown
-    cluster_names = []
-    for user in UserProfile.objects:
-        for cluster in user.clusters:
-            if cluster.cluster_name not in cluster_names:
-                cluster_names.append(cluster.cluster_name)
-    
-    context = {
-        'monthly_revenue': monthly_revenue,
-        'cluster_performance': cluster_performance,
-        'user_growth': user_growth,
-        'cluster_names': cluster_names,
-    }
+    context['cluster_names'] = cluster_registry.all_names()
     
     return render(request, 'dashboard/reports.html', context)
 
@@ -216,419 +280,100 @@ def cluster_owner_payment_report(request):
     # Get the selected cluster name from the request
     cluster_name = request.GET.get('cluster_name', '')
     
-    # Get the current month and year
-    now = datetime.now()
-    current_month = now.month
-    current_year = now.year
-    
-    # Calculate the first and last day of the current month
-    first_day = datetime(current_year, current_month, 1)
-    if current_month == 12:
-        last_day = datetime(current_year + 1, 1, 1) - timedelta(days=1)
-    else:
-        last_day = datetime(current_year, current_month + 1, 1) - timedelta(days=1)
-    
-    # Get all payments for the selected cluster in the current month
-    payments_data = []
-    total_amount = 0
-    
-    # Get api_key for the selected cluster
-    api_key = None
-    if cluster_name:
-        for user in UserProfile.objects:
-            for cluster in user.clusters:
-                if cluster.cluster_name == cluster_name:
-                    api_key = cluster.api_key
-                    break
-            if api_key:
-                break
-    
-    # Filter query based on whether a cluster was selected
-    if api_key:
-        payments = Payment.objects(
-            api_key=api_key,
-            payment_date__gte=first_day,
-            payment_date__lte=last_day,
-            status='Completed'
-        )
-    else:
-        payments = Payment.objects(
-            payment_date__gte=first_day,
-            payment_date__lte=last_day,
-            status='Completed'
+    # Check if PDF download was requested
+    if request.GET.get('format') == 'pdf':
+        return generate_payment_report_pdf(
+            report_data.payment_report_context(cluster_name, include_payments=False)
         )
     
-    # Process payments
-    for payment in payments:
-        payment_cluster_name = payment.cluster_name
-        payments_data.append({
-            'id': payment.payment_id,
-            'match_id': payment.match_id,
-            'cluster_name': payment_cluster_name,
-            'amount': float(payment.amount),
-            'date': payment.payment_date.strftime('%Y-%m-%d'),
-            'user_email': payment.user_email if payment.user_email else '-',
-        })
-        total_amount += float(payment.amount)
+    context = report_data.payment_report_context(cluster_name)
     
     # Get all cluster names for the dropdown
-    cluster_names = []
-    for user in UserProfile.objects:
-        for cluster in user.clusters:
-            if cluster.cluster_name not in cluster_names:
-                cluster_names.append(cluster.cluster_name)
-    
-    # Get cluster owner information if a cluster is selected
-    owner_info = None
-    if cluster_name:
-        for user in UserProfile.objects:
-            for cluster in user.clusters:
-                if cluster.cluster_name == cluster_name:
-                    owner_info = {
-                        'username': user.username,
-                        'email': user.email,
-                        'has_bank_details': user.bank_details is not None,
-                    }
-                    if user.bank_details:
-                        owner_info['bank_details'] = {
-                            'bank_name': user.bank_details.bank_name,
-                            'account_number': user.bank_details.account_number,
-                            'ifsc_code': user.bank_details.ifsc_code,
-                            'branch_name': user.bank_details.branch_name,
-                        }
-                    break
-            if owner_info:
-                break
-    
-    context = {
-        'cluster_name': cluster_name,
-        'month_name': now.strftime('%B'),
-        'year': current_year,
-        'payments': payments_data,
-        'total_amount': total_amount,
-        'cluster_names': cluster_names,
-        'owner_info': owner_info,
-    }
-    
-    # Check if PDF download was requested
-    if request.GET.get('format') == 'pdf':
-        return generate_payment_report_pdf(context)
+    context['cluster_names'] = cluster_registry.all_names()
     
     return render(request, 'dashboard/cluster_owner_payment_report.html', context)
 
+def _pdf_response(render_pdf, filename):
+    # Render into an anonymous temp file and stream it from disk, so the
+    # PDF is never held in memory; the file goes away when it is closed
+    output = tempfile.TemporaryFile()
+    try:
+        render_pdf(output)
+    except Exception:
+        output.close()
+        raise
+    output.seek(0)
+    return FileResponse(output, as_attachment=True, filename=filename, content_type='application/pdf')
+
 def generate_payment_report_pdf(context):
     """Generate a PDF report for cluster owner payments"""
-    # Create a file-like buffer to receive PDF data
-    buffer = io.BytesIO()
-    
-    # Create the PDF object, using the buffer as its "file"
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    
-    # Container for the 'Flowable' objects
-    elements = []
-    
-    # Define styles
-    styles = getSampleStyleSheet()
-    title_style = styles['Heading1']
-    subtitle_style = styles['Heading2']
-    normal_style = styles['Normal']
-    
-    # Add title
-    if context['cluster_name']:
-        title = f"Payment Report for {context['cluster_name']}"
-    else:
-        title = "Payment Report for All Clusters"
-    
-    elements.append(Paragraph(title, title_style))
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Add period
-    period = f"{context['month_name']} {context['year']}"
-    elements.append(Paragraph(f"Period: {period}", subtitle_style))
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Add owner info if available
-    if context['owner_info']:
-        owner = context['owner_info']
-        elements.append(Paragraph("Cluster Owner Information", subtitle_style))
-        elements.append(Paragraph(f"Name: {owner['username']}", normal_style))
-        elements.append(Paragraph(f"Email: {owner['email']}", normal_style))
-        
-        if 'bank_details' in owner:
-            elements.append(Spacer(1, 0.1*inch))
-            elements.append(Paragraph("Bank Details", subtitle_style))
-            bank = owner['bank_details']
-            elements.append(Paragraph(f"Bank: {bank['bank_name']}", normal_style))
-            elements.append(Paragraph(f"Account: {bank['account_number']}", normal_style))
-            elements.append(Paragraph(f"IFSC: {bank['ifsc_code']}", normal_style))
-            elements.append(Paragraph(f"Branch: {bank['branch_name']}", normal_style))
-        
-        elements.append(Spacer(1, 0.25*inch))
-    
-    # Add summary
-    elements.append(Paragraph("Summary", subtitle_style))
-    elements.append(Paragraph(f"Total Revenue: ₹{context['total_amount']:.2f}", normal_style))
-    elements.append(Paragraph(f"Total Payments: {len(context['payments'])}", normal_style))
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Add payments table
-    elements.append(Paragraph("Payment Details", subtitle_style))
-    
-    # Define table data
-    if context['cluster_name']:
-        # If specific cluster, don't include cluster name column
-        data = [['Payment ID', 'Match ID', 'Amount (₹)', 'Date', 'User Email']]
-        for payment in context['payments']:
-            data.append([
-                payment['id'],
-                payment['match_id'],
-                f"₹{payment['amount']:.2f}",
-                payment['date'],
-                payment['user_email']
-            ])
-        # Add total row
-        data.append(['Total', '', f"₹{context['total_amount']:.2f}", '', ''])
-    else:
-        # If all clusters, include cluster name column
-        data = [['Payment ID', 'Match ID', 'Cluster', 'Amount (₹)', 'Date', 'User Email']]
-        for payment in context['payments']:
-            data.append([
-                payment['id'],
-                payment['match_id'],
-                payment['cluster_name'],
-                f"₹{payment['amount']:.2f}",
-                payment['date'],
-                payment['user_email']
-            ])
-        # Add total row
-        data.append(['Total', '', '', f"₹{context['total_amount']:.2f}", '', ''])
-    
-    # Create table
-    table = Table(data)
-    
-    # Add style to table
-    style = TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.beige),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ALIGN', (3, 1), (3, -1), 'RIGHT'),  # Align amount column to right
-    ])
-    table.setStyle(style)
-    
-    # Add table to elements
-    elements.append(table)
-    
-    # Add footer with date
-    elements.append(Spacer(1, 0.5*inch))
-    elements.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_style))
-    
-    # Build PDF
-    doc.build(elements)
-    
-    # Get the value of the BytesIO buffer
-    pdf = buffer.getvalue()
-    buffer.close()
-    
-    # Create the HTTP response with PDF
-    response = HttpResponse(content_type='application/pdf')
-    filename = f"payment_report_{context['month_name']}_{context['year']}"
-    if context['cluster_name']:
-        filename += f"_{context['cluster_name'].replace(' ', '_')}"
-    response['Content-Disposition'] = f'attachment; filename="{filename}.pdf"'
-    
-    # Write the PDF to the response
-    response.write(pdf)
-    return response
+    # ReportLab is only loaded by the requests that render a PDF
+    from . import pdf_reports
+    payment_rows = report_data.iter_payment_rows(context)
+    return _pdf_response(
+        lambda output: pdf_reports.render_payment_report(context, payment_rows, output),
+        pdf_reports.payment_report_filename(context),
+    )
 
 @login_required
 def generate_report_pdf(request):
     """Generate a PDF for the custom report"""
+    from . import pdf_reports
     # Get report parameters
     report_type = request.GET.get('report_type', 'summary')
-    date_range = request.GET.get('date_range', 'last30days')
-    
-    # Create a file-like buffer to receive PDF data
-    buffer = io.BytesIO()
-    
-    # Create the PDF object, using the buffer as its "file"
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    
-    # Container for the 'Flowable' objects
-    elements = []
-    
-    # Define styles
-    styles = getSampleStyleSheet()
-    title_style = styles['Heading1']
-    subtitle_style = styles['Heading2']
-    normal_style = styles['Normal']
-    
-    # Add title
-    title = f"SolSub Admin {report_type.capitalize()} Report"
-    elements.append(Paragraph(title, title_style))
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Add date range
-    date_range_text = "Last 30 Days"
-    if date_range == 'last90days':
-        date_range_text = "Last 90 Days"
-    elif date_range == 'lastYear':
-        date_range_text = "Last Year"
-    elif date_range == 'custom':
-        start_date = request.GET.get('start_date', '')
-        end_date = request.GET.get('end_date', '')
-        if start_date and end_date:
-            date_range_text = f"From {start_date} to {end_date}"
-    
-    elements.append(Paragraph(f"Period: {date_range_text}", subtitle_style))
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Add summary statistics
-    now = datetime.now()
-    
-    # Calculate total revenue
-    total_revenue = 0
-    for payment in Payment.objects(status='Completed'):
-        total_revenue += float(payment.amount)
-    
-    # Count active match IDs
-    active_match_ids = 0
-    for match_id in MatchId.objects:
-        is_active = match_id.valid_till and now <= match_id.valid_till
-        if is_active:
-            active_match_ids += 1
-    
-    # Calculate trial conversion rate
-    trial_match_ids = MatchId.objects(is_trial=True).count()
-    converted_trials = 0
-    for match_id in MatchId.objects(is_trial=True):
-        if match_id.last_paid_on and match_id.last_paid_on > match_id.created_on:
-            converted_trials += 1
-    
-    trial_conversion_rate = 0
-    if trial_match_ids > 0:
-        trial_conversion_rate = (converted_trials / trial_match_ids) * 100
-    
-    elements.append(Paragraph("Summary", subtitle_style))
-    elements.append(Paragraph(f"Total Revenue: ₹{total_revenue:.2f}", normal_style))
-    elements.append(Paragraph(f"Active Subscriptions: {active_match_ids}", normal_style))
-    elements.append(Paragraph(f"Trial Conversion Rate: {trial_conversion_rate:.1f}%", normal_style))
-    elements.append(Spacer(1, 0.25*inch))
-    
-    # Add monthly revenue breakdown
-    elements.append(Paragraph("Monthly Revenue Breakdown", subtitle_style))
-    
-    # Get monthly revenue data
-    monthly_revenue = {}
-    for payment in Payment.objects(status='Completed'):
-        if payment.payment_date:
-            month_year = payment.payment_date.strftime('%Y-%m')
-            if month_year not in monthly_revenue:
-                monthly_revenue[month_year] = 0
-            monthly_revenue[month_year] += float(payment.amount)
-    
-    # Create table data
-    data = [['Month', 'Revenue (₹)']]
-    for month, revenue in monthly_revenue.items():
-        # Format month as "Month Year"
-        month_date = datetime.strptime(month, '%Y-%m')
-        formatted_month = month_date.strftime('%B %Y')
-        data.append([formatted_month, f"₹{revenue:.2f}"])
-    
-    # Create table
-    if len(data) > 1:  # Only create table if there's data
-        table = Table(data)
-        
-        # Add style to table
-        style = TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('ALIGN', (1, 1), (1, -1), 'RIGHT'),  # Align amount column to right
-        ])
-        table.setStyle(style)
-        
-        # Add table to elements
-        elements.append(table)
-    else:
-        elements.append(Paragraph("No revenue data available", normal_style))
-    
-    # Add cluster performance if detailed report
-    if report_type in ['detailed', 'financial']:
-        elements.append(Spacer(1, 0.25*inch))
-        elements.append(Paragraph("Cluster Performance", subtitle_style))
-        
-        # Get cluster performance data
-        cluster_performance = {}
-        for payment in Payment.objects(status='Completed'):
-            cluster_name = payment.cluster_name
-            if cluster_name:
-                if cluster_name not in cluster_performance:
-                    cluster_performance[cluster_name] = {
-                        'revenue': 0,
-                        'count': 0
-                    }
-                cluster_performance[cluster_name]['revenue'] += float(payment.amount)
-                cluster_performance[cluster_name]['count'] += 1
-        
-        # Create table data
-        data = [['Cluster', 'Revenue (₹)', 'Number of Payments']]
-        for cluster, stats in cluster_performance.items():
-            data.append([cluster, f"₹{stats['revenue']:.2f}", stats['count']])
-        
-        # Create table
-        if len(data) > 1:  # Only create table if there's data
-            table = Table(data)
-            
-            # Add style to table
-            style = TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('ALIGN', (1, 1), (1, -1), 'RIGHT'),  # Align amount column to right
-            ])
-            table.setStyle(style)
-            
-            # Add table to elements
-            elements.append(table)
-        else:
-            elements.append(Paragraph("No cluster performance data available", normal_style))
-    
-    # Add footer with date
-    elements.append(Spacer(1, 0.5*inch))
-    elements.append(Paragraph(f"Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}", normal_style))
-    
-    # Build PDF
-    doc.build(elements)
     
-    # Get the value of the BytesIO buffer
-    pdf = buffer.getvalue()
-    buffer.close()
-    
-    # Create the HTTP response with PDF
-    response = HttpResponse(content_type='application/pdf')
-    filename = f"solsub_report_{report_type}_{datetime.now().strftime('%Y%m%d')}"
-    response['Content-Disposition'] = f'attachment; filename="{filename}.pdf"'
-    
-    # Write the PDF to the response
-    response.write(pdf)
-    return response
+    data = report_data.custom_report_data(report_type, request.GET)
+    date_range_text = report_data.date_range_label(request.GET)
+    return _pdf_response(
+        lambda output: pdf_reports.render_custom_report(data, date_range_text, output),
+        pdf_reports.custom_report_filename(report_type),
+    )
+
+# Background PDF report jobs
+def _job_response(state, status=200):
+    job_id = state['job_id']
+    return JsonResponse({
+        'success': state['status'] != report_jobs.FAILED,
+        'job_id': job_id,
+        'status': state['status'],
+        'progress': state.get('progress', 0),
+        'message': state.get('message', ''),
+        'error': state.get('error'),
+        'status_url': reverse('report_job_status', args=[job_id]),
+        'download_url': reverse('download_report_job', args=[job_id]),
+    }, status=status)
+
+@login_required
+@require_POST
+def start_report_job(request):
+    """Queue a PDF report (or attach to the identical one already running)"""
+    kind = request.POST.get('kind', 'custom')
+    if kind not in report_jobs.JOB_KINDS:
+        return JsonResponse({'success': False, 'error': f'Unknown report kind: {kind}'}, status=400)
+    
+    state = report_jobs.submit(kind, request.POST)
+    return _job_response(state, status=202)
+
+@login_required
+def report_job_status(request, job_id):
+    state = report_jobs.job_state(job_id)
+    if state is None:
+        raise Http404('Unknown report job')
+    return _job_response(state)
+
+@login_required
+def download_report_job(request, job_id):
+    state = report_jobs.read_state(job_id)
+    if state is None or state['status'] != report_jobs.DONE:
+        raise Http404('Report is not ready')
+    try:
+        pdf = open(report_jobs.pdf_path(job_id), 'rb')
+    except FileNotFoundError:
+        raise Http404('Report has expired')
+    return FileResponse(pdf, as_attachment=True, filename=state['filename'], content_type='application/pdf')
 
 # API endpoints for dashboard data
-def analytics_data(request):
+def _analytics_chart_data():
     # Get monthly payment data for the chart
     now = datetime.now()
     start_date = now - timedelta(days=180)  # Last 6 months
@@ -645,25 +390,27 @@ def analytics_data(request):
             'clusters': {}
         }
     
-    # Populate with payment data
-    for payment in Payment.objects(payment_date__gte=start_date, status='Completed'):
-        month_name = payment.payment_date.strftime('%b')
+    # Populate with daily revenue totals
+    daily_revenue = aggregations.daily_revenue(start_date)
+    cluster_names = cluster_registry.cluster_names(api_key for _, api_key, _, _ in daily_revenue)
+    for day, api_key, revenue, count in daily_revenue:
+        month_name = day.strftime('%b')
         if month_name in monthly_data:
-            monthly_data[month_name]['revenue'] += float(payment.amount)
-            monthly_data[month_name]['payments'] += 1
+            monthly_data[month_name]['revenue'] += revenue
+            monthly_data[month_name]['payments'] += count
             
             # Get cluster_name from api_key
-            cluster_name = payment.cluster_name
+            cluster_name = cluster_names[api_key]
             if cluster_name:
                 # Track by cluster
                 if cluster_name not in monthly_data[month_name]['clusters']:
                     monthly_data[month_name]['clusters'][cluster_name] = 0
-                monthly_data[month_name]['clusters'][cluster_name] += float(payment.amount)
+                monthly_data[month_name]['clusters'][cluster_name] += revenue
     
     # Count active subscriptions by month
-    for match_id in MatchId.objects:
-        if match_id.valid_till:
-            month_name = match_id.valid_till.strftime('%b')
+    for match_id in reporting.objects(MatchId).filter(valid_till__ne=None).only('valid_till').as_pymongo():
+        if match_id.get('valid_till'):
+            month_name = match_id['valid_till'].strftime('%b')
             if month_name in monthly_data:
                 monthly_data[month_name]['subscriptions'] += 1
     
@@ -686,72 +433,112 @@ def analytics_data(request):
     month_order = {month: i for i, month in enumerate(calendar.month_abbr[1:])}
     chart_data.sort(key=lambda x: month_order[x['month']])
     
+    return chart_data
+
+ANALYTICS_SERIES = ('revenue', 'payments', 'subscriptions')
+
+def _wants_columns(request):
+    return request.GET.get('format') == 'columns'
+
+def _columns_response(payload):
+    # No whitespace between tokens; the repeated keys are already gone
+    return JsonResponse(payload, json_dumps_params={'separators': (',', ':')})
+
+def _analytics_columns(chart_data):
+    """Month labels, one array per series and one revenue array per cluster"""
+    cluster_names = sorted({name for item in chart_data for name in item} - {'month', *ANALYTICS_SERIES})
+    return {
+        'labels': [item['month'] for item in chart_data],
+        'series': rows.columns(chart_data, ANALYTICS_SERIES),
+        'clusters': {name: [item.get(name, 0) for item in chart_data] for name in cluster_names},
+    }
+
+@gzip_page
+@caching.conditional('analytics', KPI_COLLECTIONS)
+def analytics_data(request):
+    # format only changes the layout, so both layouts share one cached result
+    params = request.GET.copy()
+    params.pop('format', None)
+    chart_data = caching.cached_result('analytics', KPI_COLLECTIONS, _analytics_chart_data, params)
+    
+    if _wants_columns(request):
+        return _columns_response(_analytics_columns(chart_data))
     return JsonResponse({'data': chart_data})
 
+@login_required
+@gzip_page
+@caching.conditional('timeseries', KPI_COLLECTIONS)
+def timeseries_data(request):
+    """Revenue, payment and new match ID series for ?from, to, granularity, cluster"""
+    try:
+        query = timeseries.parse_query(request.GET)
+        params = {'query': json.dumps(query, default=str)}
+        data = caching.cached_result('timeseries', KPI_COLLECTIONS, lambda: timeseries.series(query), params)
+    except timeseries.InvalidQuery as exc:
+        return JsonResponse({'success': False, 'error': str(exc)}, status=400)
+    
+    return _columns_response(data)
+
+@login_required
+@gzip_page
+def search_data(request):
+    """Users, payments and match IDs matching ?q= exactly or by prefix"""
+    try:
+        limit = int(request.GET.get('limit', search.DEFAULT_LIMIT))
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'limit must be a number'}, status=400)
+    return JsonResponse(search.search(request.GET.get('q'), limit))
+
+@gzip_page
+@caching.conditional('clusters', CLUSTER_COLLECTIONS)
 def cluster_data(request):
-    # Similar to the clusters view but returns JSON
-    all_clusters = []
-    for user in UserProfile.objects:
-        for cluster in user.clusters:
-            active_count = MatchId.objects(
-                cluster_name=cluster.cluster_name,
-                valid_till__gt=datetime.now()
-            ).count()
-            
-            all_clusters.append({
-                'name': cluster.cluster_name,
-                'price': float(cluster.cluster_price),
-                'timeline_days': cluster.timeline_days,
-                'trial_period': cluster.trial_period,
-                'match_id_type': cluster.match_id_type,
-                'active_subscriptions': active_count,
-                'api_key': cluster.api_key,
-            })
-    
-    # Remove duplicates
-    unique_clusters = []
-    cluster_names = set()
-    for cluster in all_clusters:
-        if cluster['name'] not in cluster_names:
-            cluster_names.add(cluster['name'])
-            unique_clusters.append(cluster)
+    # Same list as the clusters view, shared through the cache
+    unique_clusters = caching.cached_result('clusters', CLUSTER_COLLECTIONS, _cluster_list)
     
+    if _wants_columns(request):
+        return _columns_response({
+            'count': len(unique_clusters),
+            'clusters': rows.columns(unique_clusters, rows.CLUSTER_FIELDS),
+        })
     return JsonResponse({'clusters': unique_clusters})
 
+@gzip_page
+@caching.conditional('user_detail', ('users',))
 def user_detail(request, user_id):
     # Get detailed information for a specific user
-    user = UserProfile.objects(user_id=user_id).first()
+    user = UserProfile.objects(user_id=user_id).exclude('id').as_pymongo().first()
     
     if not user:
         return JsonResponse({'success': False, 'error': 'User not found'})
     
     # Format user data
     user_data = {
-        'id': user.user_id,
-        'username': user.username,
-        'email': user.email,
-        'created_at': user.created_at.strftime('%Y-%m-%d'),
+        'id': user['user_id'],
+        'username': user.get('username'),
+        'email': user.get('email'),
+        'created_at': rows.format_date(user.get('created_at')),
         'clusters': [],
     }
     
     # Add bank details if available
-    if user.bank_details:
+    bank_details = user.get('bank_details')
+    if bank_details:
         user_data['bank_details'] = {
-            'bank_name': user.bank_details.bank_name,
-            'account_number': user.bank_details.account_number,
-            'ifsc_code': user.bank_details.ifsc_code,
-            'branch_name': user.bank_details.branch_name,
+            'bank_name': bank_details.get('bank_name'),
+            'account_number': bank_details.get('account_number'),
+            'ifsc_code': bank_details.get('ifsc_code'),
+            'branch_name': bank_details.get('branch_name'),
         }
     
     # Add clusters
-    for cluster in user.clusters:
+    for cluster in user.get('clusters') or []:
         user_data['clusters'].append({
-            'cluster_name': cluster.cluster_name,
-            'cluster_price': float(cluster.cluster_price),
-            'timeline_days': cluster.timeline_days,
-            'trial_period': cluster.trial_period,
-            'match_id_type': cluster.match_id_type,
-            'api_key': cluster.api_key,
+            'cluster_name': cluster.get('cluster_name'),
+            'cluster_price': aggregations.to_float(cluster.get('cluster_price')),
+            'timeline_days': cluster.get('timeline_days'),
+            'trial_period': cluster.get('trial_period', 0),
+            'match_id_type': cluster.get('match_id_type', 'admin_generated'),
+            'api_key': cluster.get('api_key'),
         })
     
     return JsonResponse({'success': True, 'user': user_data})
@@ -0,0 +1,46 @@
+"""Optional warm-up for a freshly started worker.
+
+With ``WARM_UP_WORKERS`` enabled the WSGI/ASGI entry points call
+``maybe_warm_up()`` once the application is loaded: it opens the Mongo
+client (so minPoolSize connections are established), loads the cluster
+registry and fills the result cache for the dashboard and cluster list,
+so the first requests a worker serves don't pay for all of that. Servers
+that fork after loading the app (e.g. gunicorn --preload) should call
+``warm_up()`` from their post-fork hook instead, since connections must
+not be shared across a fork.
+"""
+import logging
+import time
+
+from django.conf import settings
+from mongoengine.connection import get_db
+
+from . import caching
+from .cluster_registry import cluster_registry
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up():
+    """Prime the connection pool and caches; returns the seconds it took"""
+    # Imported here so warmup.py can be loaded before the URLconf
+    from . import views
+
+    started = time.monotonic()
+    get_db().command('ping')
+    cluster_registry.all_names()
+    caching.cached_result('dashboard', views.KPI_COLLECTIONS, views._dashboard_kpis, should_cache=views._is_complete)
+    caching.cached_result('clusters', views.CLUSTER_COLLECTIONS, views._cluster_list)
+    elapsed = time.monotonic() - started
+    logger.info('Worker warmed up in %.2fs', elapsed)
+    return elapsed
+
+
+def maybe_warm_up():
+    if not getattr(settings, 'WARM_UP_WORKERS', False):
+        return
+    try:
+        warm_up()
+    except Exception:
+        # A worker that could not warm up still serves requests
+        logger.exception('Worker warm-up failed')